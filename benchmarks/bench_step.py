@@ -0,0 +1,393 @@
+"""
+Step throughput benchmarks for the Wolf-Sheep model.
+
+Measures WolfSheep.step in steps/second and agent updates/second over a
+matrix of grid sizes, initial populations, soil on/off and fire/migration
+on/off, the time to build a world of each size (startup/ cases, in
+builds/second), TiledWolfSheep with its tiles in worker processes against in
+this one (tiled/ cases, with the speedup of the processes), plus
+microbenchmarks of model construction, the headless import,
+RandomWalker.random_move, Predator.hunt and get_type_count. Every result is
+appended to a JSON-lines history file, and compared with the latest earlier
+result of the same case on the same machine (or with a baseline file); cases
+that got slower by more than the tolerance are flagged and make the script
+exit with status 1.
+
+Step and startup cases that would build more than --max-agents mesa agents
+(e.g. a 2000x2000 world with soil on the agent engines, about 8 million) are
+skipped.
+
+    $ python benchmarks/bench_step.py                 # quick matrix
+    $ python benchmarks/bench_step.py --full          # up to 2000x2000
+    $ python benchmarks/bench_step.py --filter micro  # only matching cases
+    $ python benchmarks/bench_step.py --baseline benchmarks/baseline.jsonl
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from wolf_sheep.agents import Mouse, Cat, Grass
+from wolf_sheep.model import WolfSheep
+from wolf_sheep.tiled import TiledWolfSheep
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+
+QUICK_SIZES = (20, 100)
+FULL_SIZES = (20, 100, 500, 2000)
+# Animals per cell: the model's defaults (10 mice and 4 cats on 20x20), and
+# a crowded grid
+DENSITIES = {"sparse": (0.025, 0.0, 0.01, 0.0), "crowded": (0.2, 0.05, 0.05, 0.01)}
+
+
+def mesa_agents(params):
+    """
+    Returns about how many mesa agents a case builds: one per animal on the
+    agent engine, and a soil patch and a plant per cell on the agent plant
+    engines.
+    """
+    if params["engine"] == "vectorized":
+        return 0
+    count = sum(params[f"initial_{name}"] for name in ("mice", "sheep", "cats", "wolves"))
+    if params["soil"] and params["plant_engine"] != "vectorized":
+        count += 2 * params["width"] * params["height"]
+    return count
+
+
+def populations(size, density):
+    cells = size * size
+    mice, sheep, cats, wolves = DENSITIES[density]
+    return dict(
+        initial_mice=int(mice * cells),
+        initial_sheep=int(sheep * cells),
+        initial_cats=int(cats * cells),
+        initial_wolves=int(wolves * cells),
+    )
+
+
+def step_cases(sizes):
+    """
+    Returns (name, params) for every combination of the step matrix.
+    """
+    for size, density, soil, fire, migration in itertools.product(
+        sizes, DENSITIES, (False, True), (False, True), (False, True)
+    ):
+        name = (
+            f"step/{size}x{size}/{density}/soil={'on' if soil else 'off'}"
+            f"/fire={'on' if fire else 'off'}/migration={'on' if migration else 'off'}"
+        )
+        params = dict(
+            width=size,
+            height=size,
+            soil=soil,
+            fire_period=10 if fire else 0,
+            migration=migration,
+            **populations(size, density),
+        )
+        yield name, params
+
+
+def startup_cases(sizes):
+    """
+    Returns (name, params) for building a world with soil of every size and
+    density.
+    """
+    for size, density in itertools.product(sizes, DENSITIES):
+        params = dict(width=size, height=size, soil=True, **populations(size, density))
+        yield f"startup/{size}x{size}/{density}/soil=on", params
+
+
+def tiled_cases(sizes):
+    """
+    Returns (name, params) for a TiledWolfSheep run with soil on a crowded
+    grid of every size large enough to cut into tiles.
+    """
+    for size in sizes:
+        if size >= 100:
+            params = dict(width=size, height=size, soil=True, **populations(size, "crowded"))
+            yield f"tiled/{size}x{size}/crowded/soil=on", params
+
+
+def bench_tiled(params, steps, repeat):
+    """
+    Run steps tiled steps, one tile per core, with the tiles in worker
+    processes and in this one, and return the best steps/second of each and
+    the speedup of the processes.
+    """
+    result = {}
+    for processes, metric in ((True, "steps_per_s"), (False, "in_process_steps_per_s")):
+        best = 0.0
+        for _ in range(repeat):
+            with TiledWolfSheep(processes=processes, seed=0, **params) as model:
+                start = time.perf_counter()
+                for _ in range(steps):
+                    model.step()
+                best = max(best, steps / (time.perf_counter() - start))
+        result[metric] = best
+    result["speedup"] = result["steps_per_s"] / result["in_process_steps_per_s"]
+    return result
+
+
+def bench_startup(params, repeat):
+    """
+    Returns the best rate at which a model with params is built.
+    """
+    return {"builds_per_s": best_rate(lambda: WolfSheep(seed=0, **params), 1, repeat)}
+
+
+def agent_updates(model):
+    """
+    Returns the number of agents, or cells and animals of the array engines,
+    that one step updates.
+    """
+    updates = model.schedule.get_agent_count()
+    if model.plants is not None:
+        updates += model.width * model.height
+    if model.animals is not None:
+        updates += sum(len(species) for species in model.animals.species.values())
+    return updates
+
+
+def bench_steps(params, steps, repeat):
+    """
+    Run steps model steps repeat times, each on a fresh model, and return
+    the best steps/second and agent updates/second.
+    """
+    best = None
+    for _ in range(repeat):
+        model = WolfSheep(seed=0, **params)
+        updates = 0
+        elapsed = 0.0
+        for _ in range(steps):
+            updates += agent_updates(model)
+            start = time.perf_counter()
+            model.step()
+            elapsed += time.perf_counter() - start
+        result = {"steps_per_s": steps / elapsed, "updates_per_s": updates / elapsed}
+        if best is None or result["steps_per_s"] > best["steps_per_s"]:
+            best = result
+    return best
+
+
+def best_rate(func, calls, repeat):
+    """
+    Returns the best rate, in calls per second, of func, which performs
+    calls operations per invocation.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return calls / best
+
+
+def micro_cases():
+    """
+    Returns (name, function of repeat returning the metrics) for every
+    microbenchmark.
+    """
+
+    def construction(repeat):
+        params = dict(width=100, height=100, soil=True, initial_mice=1000, initial_cats=200)
+        return {"models_per_s": best_rate(lambda: WolfSheep(seed=0, **params), 1, repeat)}
+
+    def headless_import(repeat):
+        # In a fresh interpreter, as the start of every batch worker pays it
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+        command = [sys.executable, "-c", "import wolf_sheep.headless"]
+        return {
+            "imports_per_s": best_rate(
+                lambda: subprocess.run(command, cwd=root, check=True), 1, repeat
+            )
+        }
+
+    def random_move(repeat):
+        model = WolfSheep(width=100, height=100, initial_mice=10_000, initial_cats=0, seed=0)
+        mice = list(model.schedule.agents_by_type[Mouse].values())
+
+        def move_all():
+            for mouse in mice:
+                mouse.random_move()
+
+        return {"calls_per_s": best_rate(move_all, len(mice), repeat)}
+
+    def hunt(repeat):
+        model = WolfSheep(
+            width=100, height=100, initial_mice=2000, initial_cats=2000, cat_hunt_radius=3, seed=0
+        )
+        cats = list(model.schedule.agents_by_type[Cat].values())
+
+        def hunt_all():
+            for cat in cats:
+                cat.hunt()
+
+        return {"calls_per_s": best_rate(hunt_all, len(cats), repeat)}
+
+    def get_type_count(repeat):
+        model = WolfSheep(width=100, height=100, soil=True, initial_mice=1000, seed=0)
+        for _ in range(5):
+            model.step()
+        schedule = model.schedule
+        calls = 1000
+        return {
+            "unfiltered_per_s": best_rate(
+                lambda: [schedule.get_type_count(Mouse) for _ in range(calls)], calls, repeat
+            ),
+            "named_filter_per_s": best_rate(
+                lambda: [schedule.get_type_count(Grass, "fully_grown") for _ in range(calls)],
+                calls,
+                repeat,
+            ),
+            "callable_filter_per_s": best_rate(
+                lambda: schedule.get_type_count(Grass, lambda grass: grass.fully_grown),
+                1,
+                repeat,
+            ),
+        }
+
+    return [
+        ("micro/construction", construction),
+        ("micro/headless_import", headless_import),
+        ("micro/random_move", random_move),
+        ("micro/hunt", hunt),
+        ("micro/get_type_count", get_type_count),
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def latest_by_name(records, host=None):
+    """
+    Returns the most recent record of every case, optionally only those
+    recorded on host.
+    """
+    latest = {}
+    for record in records:
+        if host is None or record.get("host") == host:
+            latest[record["name"]] = record
+    return latest
+
+
+def compare(record, baseline, tolerance):
+    """
+    Returns the metrics of record that fell below (1 - tolerance) times the
+    baseline, as (metric, baseline value, new value) tuples.
+    """
+    regressions = []
+    for metric, value in record["metrics"].items():
+        old = baseline["metrics"].get(metric)
+        if old and value < (1 - tolerance) * old:
+            regressions.append((metric, old, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--full", action="store_true", help="include the large grids")
+    parser.add_argument("--filter", default="", help="only run cases containing this")
+    parser.add_argument("--steps", type=int, default=20, help="steps per step case")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions, the best counts")
+    parser.add_argument("--engine", default="agents", help="WolfSheep engine")
+    parser.add_argument("--plant-engine", default="agents", help="WolfSheep plant_engine")
+    parser.add_argument(
+        "--max-agents", type=int, default=1_000_000, help="skip cases building more mesa agents"
+    )
+    parser.add_argument("--history", default=HISTORY, help="JSON-lines history file")
+    parser.add_argument("--baseline", help="compare with this history file instead")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--no-record", action="store_true", help="do not append to the history")
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter("ignore")
+    host = platform.node()
+    if args.baseline:
+        baseline = latest_by_name(load_history(args.baseline))
+    else:
+        baseline = latest_by_name(load_history(args.history), host)
+
+    # Only the step and startup cases run on the chosen engines, and the
+    # vectorized animal engine always brings the vectorized plant layer
+    plant_engine = "vectorized" if args.engine == "vectorized" else args.plant_engine
+    suffix = ""
+    if args.engine != "agents" or plant_engine != "agents":
+        suffix = f"[engine={args.engine},plant_engine={plant_engine}]"
+    cases = []
+    skipped = 0
+    sizes = FULL_SIZES if args.full else QUICK_SIZES
+    for kind, engine_cases in (("step", step_cases(sizes)), ("startup", startup_cases(sizes))):
+        for name, params in engine_cases:
+            params.update(engine=args.engine, plant_engine=plant_engine)
+            if mesa_agents(params) > args.max_agents:
+                skipped += args.filter in name
+                continue
+            if kind == "step":
+                run = partial(bench_steps, params, args.steps, args.repeat)
+            else:
+                run = partial(bench_startup, params, args.repeat)
+            cases.append((name + suffix, params, run))
+    for name, params in tiled_cases(FULL_SIZES if args.full else QUICK_SIZES):
+        cases.append((name, params, partial(bench_tiled, params, args.steps, args.repeat)))
+    for name, func in micro_cases():
+        cases.append((name, {}, partial(func, args.repeat)))
+
+    common = {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "host": host,
+        "python": platform.python_version(),
+    }
+    flagged = 0
+    with open(os.devnull if args.no_record else args.history, "a") as history:
+        for name, params, run in cases:
+            if args.filter not in name:
+                continue
+            record = dict(common, name=name, params=params, metrics=run())
+            history.write(json.dumps(record) + "\n")
+            history.flush()
+
+            metrics = "  ".join(f"{k}={v:,.1f}" for k, v in record["metrics"].items())
+            print(f"{name:<60} {metrics}")
+            if name in baseline:
+                for metric, old, new in compare(record, baseline[name], args.tolerance):
+                    flagged += 1
+                    print(f"  REGRESSION {metric}: {old:,.1f} -> {new:,.1f} ({new / old - 1:+.0%})")
+
+    if skipped:
+        print(f"{skipped} case(s) skipped, building more than {args.max_agents:,} mesa agents")
+    if flagged:
+        print(f"{flagged} regression(s) beyond {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
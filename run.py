@@ -1,3 +1,16 @@
-from wolf_sheep.server import server
+import sys
+
+# Only the selected server is created, as each one builds a model
+# python run.py --heatmap draws rasters instead of agents, for large worlds
+if "--heatmap" in sys.argv:
+    from wolf_sheep.server import heatmap_server as server
+# python run.py --background steps the model at full speed between frames
+elif "--background" in sys.argv:
+    from wolf_sheep.server import background_server as server
+# python run.py --shared has every browser tab watch the same model
+elif "--shared" in sys.argv:
+    from wolf_sheep.server import broadcast_server as server
+else:
+    from wolf_sheep.server import server
 
 server.launch(open_browser=True)
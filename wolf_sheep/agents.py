@@ -1,8 +1,9 @@
+import math
+
 import mesa
 
 from .random_walk import RandomWalker
 from .predator import Predator
-import random
 
 
 class Mouse(RandomWalker):
@@ -10,6 +11,7 @@ class Mouse(RandomWalker):
     A mouse that walks around, reproduces (asexually) and eats grass.
     """
     energy = None
+
     def __init__(self, unique_id, pos, model, moore, energy=None):
         super().__init__(unique_id, pos, model, moore=moore)
         self.energy = energy
@@ -25,28 +27,26 @@ class Mouse(RandomWalker):
 
         self.energy -= 1
 
-        this_cell = self.model.grid.get_cell_list_contents([self.pos])
-        plants = [obj for obj in this_cell if isinstance(obj, (Grass))]
-        if len(plants) > 0:
-            plant_to_eat = self.random.choice(plants)
-            self.energy += self.model.food_energies[plant_to_eat.__class__]
+        if self.model.plants is not None:
+            plant = self.model.plants.plant_at(self.pos)
+            if plant is Grass:
+                self.energy += self.model.food_energies[plant]
+                self.model.plants.remove_plant(self.pos)
+        else:
+            plant_to_eat = self.model.grid.plant_at(self.pos)
+            if isinstance(plant_to_eat, Grass):
+                self.energy += self.model.food_energies[plant_to_eat.__class__]
 
-            self.model.grid.remove_agent(plant_to_eat)
-            self.model.schedule.remove(plant_to_eat)
+                self.model.kill(plant_to_eat)
 
         # Death
         if self.energy < 0:
-            self.model.grid.remove_agent(self)
-            self.model.schedule.remove(self)
+            self.model.kill(self)
         elif self.energy > self.model.mouse_reproduce_energy:
-            if self.random.random() < self.model.mouse_reproduce:
+            if self.model.streams.reproduction.random() < self.model.mouse_reproduce:
                 # Create a new mouse
                 self.energy /= 2
-                mouse = Mouse(
-                    self.model.next_id(), self.pos, self.model, self.moore, self.energy
-                )
-                self.model.grid.place_agent(mouse, mouse.pos)
-                self.model.schedule.add(mouse)
+                self.model.spawn(Mouse, self.pos, self.moore, self.energy)
         # if self.energy > self.model.mouse_reproduce_energy and self.countup > self.model.mouse_evolution_time:
         #     pos = self.pos
         #     self.model.grid.remove_agent(self)
@@ -62,6 +62,7 @@ class Sheep(RandomWalker):
     A sheep that walks around, reproduces (asexually) and eats grass, bushes and trees.
     """
     energy = None
+
     def __init__(self, unique_id, pos, model, moore, energy=None):
         super().__init__(unique_id, pos, model, moore=moore)
         self.energy = energy
@@ -77,36 +78,41 @@ class Sheep(RandomWalker):
 
         self.energy -= 2
 
-        this_cell = self.model.grid.get_cell_list_contents([self.pos])
-        plants = [obj for obj in this_cell if isinstance(obj, (Grass, Bush))]
-        if len(plants) > 0:
-            plant_to_eat = self.random.choice(plants)
-            self.energy += self.model.food_energies[plant_to_eat.__class__]
+        if self.model.plants is not None:
+            plant = self.model.plants.plant_at(self.pos)
+            if plant is Grass or plant is Bush:
+                self.energy += self.model.food_energies[plant]
+                self.model.plants.remove_plant(self.pos)
+        else:
+            plant_to_eat = self.model.grid.plant_at(self.pos)
+            if isinstance(plant_to_eat, (Grass, Bush)):
+                self.energy += self.model.food_energies[plant_to_eat.__class__]
 
-            self.model.grid.remove_agent(plant_to_eat)
-            self.model.schedule.remove(plant_to_eat)
+                self.model.kill(plant_to_eat)
 
         # Death
         if self.energy < 0:
-            self.model.grid.remove_agent(self)
-            self.model.schedule.remove(self)
+            self.model.kill(self)
             living = False
 
-        if living and self.random.random() < self.model.sheep_reproduce:
+        if living and self.model.streams.reproduction.random() < self.model.sheep_reproduce:
             # Create a new sheep:
             self.energy /= 2
-            lamb = Sheep(
-                self.model.next_id(), self.pos, self.model, self.moore, self.energy
-            )
-            self.model.grid.place_agent(lamb, self.pos)
-            self.model.schedule.add(lamb)
+            self.model.spawn(Sheep, self.pos, self.moore, self.energy)
 
 class Cat(Predator):
     """
     A cat that walks around, reproduces (asexually) and eats mice.
     """
     def __init__(self, unique_id, pos, model, moore, energy=None, max_energy=50, reproduction_threshold=None):
-        super().__init__(unique_id, pos, model, prey=(Mouse))
+        super().__init__(
+            unique_id,
+            pos,
+            model,
+            prey=(Mouse,),
+            moore=moore,
+            hunt_radius=model.cat_hunt_radius,
+        )
         self.energy = energy
         self.countup = 0
 
@@ -117,30 +123,23 @@ class Cat(Predator):
         self.energy -= 1
 
         # If there are is any animal present, eat one
-        x, y = self.pos
-        this_cell = self.model.grid.get_cell_list_contents([self.pos])
-        animals = [obj for obj in this_cell if isinstance(obj, (Mouse))]
-        if len(animals) > 0:
-            animal_to_eat = self.random.choice(animals)
+        animal_to_eat = self.model.grid.random_agent_at(
+            self.pos, (Mouse,), self.model.streams.feeding
+        )
+        if animal_to_eat is not None:
             self.energy += self.model.food_energies[animal_to_eat.__class__]
 
             # Kill the animal
-            self.model.grid.remove_agent(animal_to_eat)
-            self.model.schedule.remove(animal_to_eat)
+            self.model.kill(animal_to_eat)
 
         # Death or reproduction
         if self.energy < 0:
-            self.model.grid.remove_agent(self)
-            self.model.schedule.remove(self)
+            self.model.kill(self)
         elif self.energy > self.model.cat_reproduce_energy:
-            if self.random.random() < self.model.cat_reproduce:
+            if self.model.streams.reproduction.random() < self.model.cat_reproduce:
                 # Create a new kitten
                 self.energy /= 2
-                kitty = Cat(
-                    self.model.next_id(), self.pos, self.model, self.moore, self.energy
-                )
-                self.model.grid.place_agent(kitty, kitty.pos)
-                self.model.schedule.add(kitty)
+                self.model.spawn(Cat, self.pos, self.moore, self.energy)
         #if self.energy > self.model.cat_reproduce_energy and self.countup > self.model.cat_evolution_time:
         #    pos = self.pos
         #    self.model.grid.remove_agent(self)
@@ -156,7 +155,14 @@ class Wolf(Predator):
     A wolf that walks around, reproduces (asexually) and eats cats, sheep and mice.
     """
     def __init__(self, unique_id, pos, model, moore, energy=None, max_energy=50, reproduction_threshold=None):
-        super().__init__(unique_id, pos, model, prey=(Sheep, Mouse), moore=moore)
+        super().__init__(
+            unique_id,
+            pos,
+            model,
+            prey=(Sheep, Mouse),
+            moore=moore,
+            hunt_radius=model.wolf_hunt_radius,
+        )
         self.energy = energy
 
     def step(self):
@@ -165,36 +171,51 @@ class Wolf(Predator):
         self.energy -= 2
 
         # If there are is any animal present, eat one
-        x, y = self.pos
-        this_cell = self.model.grid.get_cell_list_contents([self.pos])
-        animals = [obj for obj in this_cell if isinstance(obj, (Mouse, Sheep, Cat))]
-        if len(animals) > 0:
-            animal_to_eat = self.random.choice(animals)
+        animal_to_eat = self.model.grid.random_agent_at(
+            self.pos, (Mouse, Sheep, Cat), self.model.streams.feeding
+        )
+        if animal_to_eat is not None:
             self.energy += self.model.food_energies[animal_to_eat.__class__]
 
             # Kill the animal
-            self.model.grid.remove_agent(animal_to_eat)
-            self.model.schedule.remove(animal_to_eat)
+            self.model.kill(animal_to_eat)
 
         # Death or reproduction
         if self.energy < 0:
-            self.model.grid.remove_agent(self)
-            self.model.schedule.remove(self)
+            self.model.kill(self)
         elif self.energy > self.model.wolf_reproduce_energy:
-            if self.random.random() < self.model.wolf_reproduce:
+            if self.model.streams.reproduction.random() < self.model.wolf_reproduce:
                 # Create a new wolf cub
                 self.energy /= 2
-                cub = Wolf(
-                    self.model.next_id(), self.pos, self.model, self.moore, self.energy
-                )
-                self.model.grid.place_agent(cub, cub.pos)
-                self.model.schedule.add(cub)
+                self.model.spawn(Wolf, self.pos, self.moore, self.energy)
+
+# Thresholds and probabilities of soil succession, shared by SoilPatch.step,
+# its timer mode and the PlantLayer
+GRASS_SOIL_TIME = 150
+BUSH_SOIL_TIME = 100
+TREE_SOIL_TIME = 200
+GRASS_SOIL_PROB = 0.3
+BUSH_SOIL_PROB = 0.2
+TREE_SOIL_PROB = 0.3
+SPROUT_PROB = 0.3
+MAX_SOIL_LEVEL = 4
+
+
+def _geometric(rng, probability):
+    """
+    Returns the number of trials, 1 or more, up to and including the first
+    success of trials that succeed with probability, drawn with one number
+    from rng.
+    """
+    if probability >= 1:
+        return 1
+    return 1 + int(math.log(1.0 - rng.random()) / math.log(1.0 - probability))
+
 
 class SoilPatch(mesa.Agent):
     """
     A patch of soil, it represents the soil conditions that allow various plants to grow, level 0 - nothing grows, 1 - only Grass, 2 - Grass and Bush, 3 - Grass, Bush and Tree
     """
-
     def __init__(self, unique_id, pos, model, level):
         """
         Creates a new patch of soil
@@ -210,51 +231,130 @@ class SoilPatch(mesa.Agent):
         self.countup_tree = 0
         self.countup_bush = 0
         self.countup_grass = 0
+        # Timer mode: the counters include the steps before updated, and run
+        # for the plant type seen when the patch was last rescheduled
+        self.updated = model.schedule.steps
+        self.plant_type = None
 
 
     def step(self):
-        this_cell = self.model.grid.get_cell_list_contents([self.pos])
-        cell_obj = [obj for obj in this_cell if isinstance(obj, (Tree, Grass, Bush))]
+        plant = self.model.grid.plant_at(self.pos)
 
-        if len(cell_obj) == 0:
+        if plant is None:
             self.countup += 1
-            if self.countup > self.model.soil_evolution_time and self.level >= 1 and random.random() < 0.3:
-                grass = Grass(self.model.next_id(), self.pos, self.model,self.model.grass_regrowth_time)
-                self.model.grid.place_agent(grass, self.pos)
-                self.model.schedule.add(grass)
+            if self.countup > self.model.soil_evolution_time and self.level >= 1 and self.model.streams.succession.random() < SPROUT_PROB:
+                self.model.spawn(Grass, self.pos, self.model.grass_regrowth_time)
                 self.countup = 0
         else:
             
-            if isinstance(cell_obj[0], (Tree)):
+            if isinstance(plant, (Tree)):
                 self.countup_tree += 1
-                if self.countup_tree > 200 and random.random() < 0.3:
+                if self.countup_tree > TREE_SOIL_TIME and self.model.streams.succession.random() < TREE_SOIL_PROB:
                     self.level -= 1
                     self.countup_tree = 0
-                    self.model.grid.remove_agent(cell_obj[0])
-                    self.model.schedule.remove(cell_obj[0])
-            elif isinstance(cell_obj[0], (Bush)):
+                    self.model.kill(plant)
+            elif isinstance(plant, (Bush)):
                 self.countup_bush += 1
-                if self.countup_bush > 100 and self.level < 4 and random.random() < 0.2:
+                if self.countup_bush > BUSH_SOIL_TIME and self.level < MAX_SOIL_LEVEL and self.model.streams.succession.random() < BUSH_SOIL_PROB:
                     self.level += 1
                     self.countup_bush = 0
                 # self.model.grid.remove_agent(cell_obj[0])
                 # self.model.schedule.remove(cell_obj[0])
-            elif isinstance(cell_obj[0], (Grass)):
+            elif isinstance(plant, (Grass)):
                 self.countup_grass += 1
-                if self.countup_grass > 150 and self.level < 4 and random.random() < 0.3:
+                if self.countup_grass > GRASS_SOIL_TIME and self.level < MAX_SOIL_LEVEL and self.model.streams.succession.random() < GRASS_SOIL_PROB:
                     self.level += 1
                     self.countup_grass = 0
                 # self.model.grid.remove_agent(cell_obj[0])
                 # self.model.schedule.remove(cell_obj[0])
 
-                
+    # Timer mode (plant_engine="timers"): instead of step, the scheduler
+    # calls wake at the step the next transition happens. The per-step
+    # success draws after a threshold are replaced by one geometric draw of
+    # how many steps it takes, which has the same distribution.
+
+    def _catch_up(self, now):
+        elapsed = now - self.updated
+        if elapsed <= 0:
+            return
+        if self.plant_type is None:
+            self.countup += elapsed
+        elif self.plant_type is Tree:
+            self.countup_tree += elapsed
+        elif self.plant_type is Bush:
+            self.countup_bush += elapsed
+        else:
+            self.countup_grass += elapsed
+        self.updated = now
+
+    def reschedule(self):
+        """
+        Schedule the next transition of the patch from its current state.
+        Called whenever the plant on the patch changes.
+        """
+        schedule = self.model.schedule
+        start = max(schedule.steps, self.updated)
+        self._catch_up(start)
+        plant = self.model.grid.plant_at(self.pos)
+        self.plant_type = plant_type = None if plant is None else type(plant)
+        if plant_type is None:
+            if self.level < 1:
+                schedule.cancel_wake(self)
+                return
+            threshold, counter, probability = (
+                self.model.soil_evolution_time, self.countup, SPROUT_PROB
+            )
+        elif plant_type is Tree:
+            threshold, counter, probability = (
+                TREE_SOIL_TIME, self.countup_tree, TREE_SOIL_PROB
+            )
+        elif self.level >= MAX_SOIL_LEVEL:
+            schedule.cancel_wake(self)
+            return
+        elif plant_type is Bush:
+            threshold, counter, probability = (
+                BUSH_SOIL_TIME, self.countup_bush, BUSH_SOIL_PROB
+            )
+        else:
+            threshold, counter, probability = (
+                GRASS_SOIL_TIME, self.countup_grass, GRASS_SOIL_PROB
+            )
+        # The counter first exceeds the threshold threshold - counter steps
+        # from start, and from then on every step succeeds with probability
+        delay = max(0, threshold - counter)
+        delay += _geometric(self.model.streams.succession, probability) - 1
+        schedule.wake_at(self, start + delay)
+
+    def wake(self):
+        """
+        Apply the transition due at this step.
+        """
+        now = self.model.schedule.steps
+        self._catch_up(now)
+        self.updated = now + 1
+        plant_type = self.plant_type
+        if plant_type is None:
+            self.countup = 0
+            self.model.spawn(Grass, self.pos, self.model.grass_regrowth_time)
+        elif plant_type is Tree:
+            self.level -= 1
+            self.countup_tree = 0
+            self.model.kill(self.model.grid.plant_at(self.pos))
+        else:
+            self.level += 1
+            if plant_type is Bush:
+                self.countup_bush = 0
+            else:
+                self.countup_grass = 0
+            self.reschedule()
+            # The plant may be waiting for a higher level to grow
+            self.model.grid.plant_at(self.pos).reschedule()
 
 
 class Grass(mesa.Agent):
     """
     A patch of grass that grows at a fixed rate and it is eaten by 
     """
-
     def __init__(self, unique_id, pos, model, countdown):
         """
         Creates a new patch of grass
@@ -269,6 +369,7 @@ class Grass(mesa.Agent):
         self.countdown = countdown
         self.countup = 0
         self.pos = pos
+        self.updated = model.schedule.steps
 
     def step(self):
         if not self.fully_grown:
@@ -276,20 +377,63 @@ class Grass(mesa.Agent):
                 # Set as fully grown
                 self.fully_grown = True
                 self.countdown = self.model.grass_regrowth_time
+                self.model.schedule.update_filters(self)
             else:
                 self.countdown -= 1
         else:
             self.countup += 1
 
-        this_cell = self.model.grid.get_cell_list_contents([self.pos])
-        soil_patch = [obj for obj in this_cell if isinstance(obj, SoilPatch)][0]
+        soil_patch = self.model.grid.soil_at(self.pos)
         if self.fully_grown and self.countup > self.model.grass_evolution_time and soil_patch.level > 1:
             pos = self.pos
-            self.model.grid.remove_agent(self)
-            self.model.schedule.remove(self)
-            bush = Bush(self.model.next_id(), pos, self.model)
-            self.model.grid.place_agent(bush, pos)
-            self.model.schedule.add(bush)
+            self.model.kill(self)
+            self.model.spawn(Bush, pos)
+
+    # Timer mode, see SoilPatch
+
+    def _catch_up(self, now):
+        elapsed = now - self.updated
+        if elapsed <= 0:
+            return
+        if self.fully_grown:
+            self.countup += elapsed
+        else:
+            self.countdown -= elapsed
+        self.updated = now
+
+    def reschedule(self):
+        """
+        Schedule the step the grass grows, or turns into a bush.
+        """
+        schedule = self.model.schedule
+        start = max(schedule.steps, self.updated)
+        self._catch_up(start)
+        if not self.fully_grown:
+            schedule.wake_at(self, start + max(0, self.countdown))
+        elif self.model.grid.soil_at(self.pos).level > 1:
+            delay = max(0, self.model.grass_evolution_time - self.countup)
+            schedule.wake_at(self, start + delay)
+        else:
+            # Woken again by the soil patch when its level rises
+            schedule.cancel_wake(self)
+
+    def wake(self):
+        """
+        Apply the transition due at this step.
+        """
+        now = self.model.schedule.steps
+        self._catch_up(now)
+        self.updated = now + 1
+        if not self.fully_grown:
+            self.fully_grown = True
+            self.countdown = self.model.grass_regrowth_time
+            self.model.schedule.update_filters(self)
+            self.reschedule()
+            return
+        self.countup += 1
+        pos = self.pos
+        self.model.kill(self)
+        self.model.spawn(Bush, pos)
 
 
 
@@ -312,7 +456,7 @@ class Grass(mesa.Agent):
 #                 self.model.schedule.remove(self)
 #                 living = False
 
-#         if living and self.random.random() < self.model.sheep_reproduce:
+#         if living and self.model.streams.reproduction.random() < self.model.sheep_reproduce:
 #             # Create a new sheep:
 #             if self.model.grass:
 #                 self.energy /= 2
@@ -327,7 +471,6 @@ class Bush(mesa.Agent):
     """
     
     """
-
     def __init__(self, unique_id, pos, model):
         """
         Creates a bush
@@ -340,26 +483,47 @@ class Bush(mesa.Agent):
         super().__init__(unique_id, model)
         self.countup = 0
         self.pos = pos
+        self.updated = model.schedule.steps
 
     def step(self):
         self.countup += 1
 
-        this_cell = self.model.grid.get_cell_list_contents([self.pos])
-        soil_patch = [obj for obj in this_cell if isinstance(obj, SoilPatch)][0]
+        soil_patch = self.model.grid.soil_at(self.pos)
         if self.countup > self.model.bush_evolution_time and soil_patch.level > 2:
             pos = self.pos
-            self.model.grid.remove_agent(self)
-            self.model.schedule.remove(self)
-            tree = Tree(self.model.next_id(), pos, self.model)
-            self.model.grid.place_agent(tree, pos)
-            self.model.schedule.add(tree)
+            self.model.kill(self)
+            self.model.spawn(Tree, pos)
+
+    # Timer mode, see SoilPatch
+
+    def reschedule(self):
+        """
+        Schedule the step the bush turns into a tree.
+        """
+        schedule = self.model.schedule
+        start = max(schedule.steps, self.updated)
+        self.countup += start - self.updated
+        self.updated = start
+        if self.model.grid.soil_at(self.pos).level > 2:
+            delay = max(0, self.model.bush_evolution_time - self.countup)
+            schedule.wake_at(self, start + delay)
+        else:
+            # Woken again by the soil patch when its level rises
+            schedule.cancel_wake(self)
+
+    def wake(self):
+        """
+        Apply the transition due at this step.
+        """
+        pos = self.pos
+        self.model.kill(self)
+        self.model.spawn(Tree, pos)
 
 
 class Tree(mesa.Agent):
     """
     
     """
-
     def __init__(self, unique_id, pos, model):
         """
         Creates a bush
@@ -375,18 +539,13 @@ class Tree(mesa.Agent):
     def step(self):
         pass
 
-
-class FirePatch(mesa.Agent):
-    def __init__(self, unique_id, pos, model):
+    def reschedule(self):
         """
-        Fire Patch for visualization only
+        Trees have no transition of their own; the soil patch kills them.
         """
-        super().__init__(unique_id, model)
-        self.pos = pos
 
-    def step(self):
-        self.model.grid.remove_agent(self)
-        self.model.schedule.remove(self)
+    def wake(self):
+        pass
 
 
 # class GrassPatch(mesa.Agent):
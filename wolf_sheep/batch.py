@@ -0,0 +1,236 @@
+"""
+Headless parameter sweeps
+=========================
+
+Runs WolfSheep over every combination of a set of parameter values, with a
+number of seeded replicates each, fanned out across a process pool. The
+DataCollector output of all runs is written to a single columnar file
+(CSV, or Parquet/Feather when the file name asks for it).
+
+The sweep is described by a JSON config file:
+
+    {
+        "fixed": {"soil": true, "initial_mice": 50},
+        "sweep": {"cat_reproduce": [0.05, 0.1, 0.15]},
+        "replicates": 5,
+        "steps": 200,
+        "seed": 0,
+        "stop": [{"condition": "extinction", "types": ["Mouse", "Cat"]}]
+    }
+
+or built from the sliders in server.model_params:
+
+    $ python -m wolf_sheep.batch --from-server --sweep cat_reproduce -o out.csv
+
+The optional stop conditions (see stopping.from_config) end a run before
+steps once they hold; the StopReason and Steps columns tell why and when each
+run stopped.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .model import WolfSheep
+from .stopping import from_config
+
+
+def server_params(sweep=(), points=None):
+    """
+    Build a sweep config from the user parameters of the visualization server.
+
+    Every parameter takes its default value from the server, except the ones
+    named in sweep, which range over their slider's min/max/step. If points is
+    given, each swept range is thinned to that many evenly spaced values.
+    """
+    # Only imported on demand, so headless runs do not load the visualization
+    import mesa
+    from .server import model_params
+
+    fixed = {}
+    swept = {}
+    for name, param in model_params.items():
+        if isinstance(param, mesa.visualization.StaticText):
+            continue
+        if not isinstance(param, mesa.visualization.UserParam):
+            fixed[name] = param
+        elif name in sweep:
+            swept[name] = slider_values(param, points)
+        else:
+            fixed[name] = param.value
+    unknown = set(sweep) - set(swept)
+    if unknown:
+        raise ValueError(f"Unknown server parameters: {sorted(unknown)}")
+    return {"fixed": fixed, "sweep": swept}
+
+
+def slider_values(slider, points=None):
+    """
+    Returns the values a Slider can take, optionally thinned to points values.
+    """
+    count = int(round((slider.max_value - slider.min_value) / slider.step)) + 1
+    values = [slider.min_value + i * slider.step for i in range(count)]
+    if isinstance(slider.step, float) or isinstance(slider.min_value, float):
+        values = [round(value, 10) for value in values]
+    if points is not None and points < count:
+        indices = sorted({round(i * (count - 1) / max(points - 1, 1)) for i in range(points)})
+        values = [values[i] for i in indices]
+    return values
+
+
+def expand_runs(config):
+    """
+    Returns the list of (run_id, params, seed) triples described by a config.
+
+    Every combination of swept values is repeated for each replicate, and each
+    run gets its own explicit seed counting up from the config's base seed.
+    """
+    fixed = config.get("fixed", {})
+    sweep = config.get("sweep", {})
+    replicates = config.get("replicates", 1)
+    base_seed = config.get("seed", 0)
+
+    names = list(sweep)
+    runs = []
+    for values in itertools.product(*(sweep[name] for name in names)):
+        for _ in range(replicates):
+            params = dict(fixed)
+            params.update(zip(names, values))
+            run_id = len(runs)
+            runs.append((run_id, params, base_seed + run_id))
+    return runs
+
+
+def run_one(run_id, params, seed, steps, stop=()):
+    """
+    Run a single model and return its DataCollector output as a DataFrame,
+    together with the wall time the run took. stop describes the stop
+    conditions of the run, as JSON (see stopping.from_config).
+    """
+    start = time.perf_counter()
+    model = WolfSheep(seed=seed, stop_conditions=from_config(stop), **params)
+    stop_reason = model.run_model(steps)
+    wall_time = time.perf_counter() - start
+
+    data = collected_data(model)
+    data.insert(0, "RunId", run_id)
+    data.insert(1, "Seed", seed)
+    for name, value in params.items():
+        data[name] = value
+    data["StopReason"] = stop_reason
+    data["Steps"] = model.schedule.steps
+    data["WallTime"] = wall_time
+    return data, wall_time
+
+
+def collected_data(model):
+    """
+    Returns the model-level data a model collected, with a Step column.
+    """
+    data = model.datacollector.get_model_vars_dataframe()
+    if data.index.name != "Step":
+        # mesa.DataCollector numbers its rows by collection, not by step
+        data.index = data.index * model.collect_interval
+        data.index.name = "Step"
+    return data.reset_index()
+
+
+def run_batch(config, processes=None, progress=True):
+    """
+    Run every scenario of a sweep config in a process pool.
+
+    Returns one DataFrame with the collected data of all runs, ordered by run.
+    """
+    runs = expand_runs(config)
+    steps = config.get("steps", 200)
+    stop = config.get("stop", ())
+    from_config(stop)  # Fail early on a bad description
+    results = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {
+            executor.submit(run_one, run_id, params, seed, steps, stop): (run_id, seed)
+            for run_id, params, seed in runs
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            run_id, seed = futures[future]
+            data, wall_time = future.result()
+            results[run_id] = data
+            if progress:
+                print(
+                    f"[{done}/{len(runs)}] run {run_id} seed {seed}: "
+                    f"{wall_time:.2f}s (elapsed {time.perf_counter() - start:.1f}s)",
+                    file=sys.stderr,
+                )
+    if not results:
+        return pd.DataFrame()
+    return pd.concat([results[run_id] for run_id in sorted(results)], ignore_index=True)
+
+
+def write_results(data, path):
+    """
+    Write the collected data to a columnar file, picking the format from the
+    file extension.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".parquet":
+        data.to_parquet(path, index=False)
+    elif extension == ".feather":
+        data.to_feather(path)
+    else:
+        data.to_csv(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless WolfSheep parameter sweeps")
+    parser.add_argument("config", nargs="?", help="JSON sweep config file")
+    parser.add_argument(
+        "--from-server",
+        action="store_true",
+        help="take default values and slider ranges from server.model_params",
+    )
+    parser.add_argument(
+        "--sweep",
+        action="append",
+        default=[],
+        help="server parameter to sweep over its slider range (repeatable)",
+    )
+    parser.add_argument("--points", type=int, help="values per swept slider")
+    parser.add_argument("--replicates", type=int, help="runs per parameter combination")
+    parser.add_argument("--steps", type=int, help="steps per run")
+    parser.add_argument("--seed", type=int, help="seed of the first run")
+    parser.add_argument("--processes", type=int, help="worker processes")
+    parser.add_argument(
+        "--stop",
+        type=json.loads,
+        help='stop conditions as JSON, e.g. \'[{"condition": "steady", "window": 100}]\'',
+    )
+    parser.add_argument("-o", "--output", default="batch_results.csv")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.from_server:
+        config.update(server_params(args.sweep, args.points))
+    if args.config:
+        with open(args.config) as f:
+            file_config = json.load(f)
+        config.setdefault("fixed", {}).update(file_config.pop("fixed", {}))
+        config.setdefault("sweep", {}).update(file_config.pop("sweep", {}))
+        config.update(file_config)
+    for key in ("replicates", "steps", "seed", "stop"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+
+    data = run_batch(config, processes=args.processes or config.get("processes"))
+    write_results(data, args.output)
+    print(f"Wrote {len(data)} rows to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
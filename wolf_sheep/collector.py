@@ -0,0 +1,269 @@
+"""
+Streaming data collector
+========================
+
+A drop-in alternative to mesa.DataCollector for long runs. Reporter values
+are buffered in typed NumPy arrays and flushed in chunks, either to an
+on-disk column store or to a list of in-memory chunks, so memory stays flat
+however long the model runs.
+
+The column store is a directory holding one raw binary file per column,
+appended to chunk by chunk, and a columns.json manifest with the dtypes:
+
+    run/
+        columns.json
+        Step.bin
+        Mice.bin
+        ...
+
+read_columns(path) maps it back to NumPy arrays.
+
+A column takes the type of the first value its reporter returns (bool, int64
+or float64), and is widened, including what was already written, if a later
+value needs a wider one, e.g. a float after ints.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = "columns.json"
+_FLOAT = np.dtype(np.float64)
+
+
+def _dtype_of(value):
+    if isinstance(value, (bool, np.bool_)):
+        return np.dtype(bool)
+    if isinstance(value, (int, np.integer)):
+        return np.dtype(np.int64)
+    return np.dtype(np.float64)
+
+
+def read_columns(path):
+    """
+    Returns a dict of column name to NumPy array read from a column store
+    written by StreamingDataCollector.
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    return {
+        name: np.fromfile(os.path.join(path, f"{name}.bin"), dtype=np.dtype(dtype))
+        for name, dtype in manifest["columns"].items()
+    }
+
+
+class StreamingDataCollector:
+    """
+    Collects model-level reporters into typed buffers that are flushed every
+    chunk_size collections.
+
+    Only the recorded columns and the reporters some subscriber asked for are
+    evaluated. A collector that records nothing and has no subscribers does
+    not call any reporter at all.
+
+    Example:
+    >>> collector = StreamingDataCollector({"Mice": count_mice}, path="run")
+    >>> collector.subscribe(print_mice, ["Mice"])
+    """
+
+    def __init__(
+        self, model_reporters, path=None, columns=None, chunk_size=1024, overwrite=False
+    ):
+        """
+        Args:
+            model_reporters: Dictionary of reporter names and functions of
+                             the model, as for mesa.DataCollector
+            path: Directory of the column store to write, or None to keep
+                  the chunks in memory
+            columns: Names of the reporters to record, None for all of them
+            chunk_size: Number of collections buffered before a flush
+            overwrite: Whether to replace a column store already at path,
+                       rather than raise FileExistsError
+        """
+        self.model_reporters = dict(model_reporters)
+        self.path = path
+        self.columns = list(self.model_reporters if columns is None else columns)
+        self.chunk_size = chunk_size
+        self._subscribers = []
+        self._chunks = []
+        self._dtypes = {}
+        self._buffers = None
+        self._length = 0
+        self._update_active()
+
+        if path is not None:
+            self._open_store(path, overwrite)
+
+    def __getstate__(self):
+        # A pickled collector carries the columns it already wrote to disk
+        stored = self.get_columns() if self.path is not None else None
+        state = dict(self.__dict__)
+        state["_stored"] = stored
+        return state
+
+    def __setstate__(self, state):
+        stored = state.pop("_stored", None)
+        self.__dict__.update(state)
+        if self.path is not None:
+            # Keep what was stored in memory and leave the store on disk to
+            # the run that wrote it; see move_to
+            self.path = None
+            self._chunks = [stored] if stored else []
+
+    def move_to(self, path, overwrite=False):
+        """
+        Write everything collected so far to a new column store at path, and
+        write there from now on.
+        """
+        columns = self.get_columns()
+        self._open_store(path, overwrite)
+        self.path = path
+        self._chunks = []
+        if columns:
+            self._write(columns)
+
+    @staticmethod
+    def _open_store(path, overwrite):
+        # Refuse, or with overwrite replace, the columns of an earlier run
+        # written to the same place
+        os.makedirs(path, exist_ok=True)
+        manifest = os.path.join(path, MANIFEST)
+        if not os.path.exists(manifest):
+            return
+        if not overwrite:
+            raise FileExistsError(f"{path} already holds a column store")
+        with open(manifest) as f:
+            names = json.load(f)["columns"]
+        for name in names:
+            os.remove(os.path.join(path, f"{name}.bin"))
+        os.remove(manifest)
+
+    def _write(self, chunk):
+        for name, column in chunk.items():
+            with open(os.path.join(self.path, f"{name}.bin"), "ab") as f:
+                column.tofile(f)
+        self._write_manifest({name: column.dtype for name, column in chunk.items()})
+
+    def _write_manifest(self, dtypes):
+        with open(os.path.join(self.path, MANIFEST), "w") as f:
+            json.dump({"columns": {name: dtype.str for name, dtype in dtypes.items()}}, f)
+
+    def subscribe(self, callback, names):
+        """
+        Call callback(step, values) on every collection, with values a dict
+        holding the named reporters.
+        """
+        self._subscribers.append((callback, list(names)))
+        self._update_active()
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling a subscribed callback.
+        """
+        self._subscribers = [
+            (subscriber, names)
+            for subscriber, names in self._subscribers
+            if subscriber is not callback
+        ]
+        self._update_active()
+
+    def _update_active(self):
+        active = dict.fromkeys(self.columns)
+        for _, names in self._subscribers:
+            active.update(dict.fromkeys(names))
+        self._active = [(name, self.model_reporters[name]) for name in active]
+
+    def collect(self, model):
+        """
+        Evaluate the active reporters on the model and buffer the values of
+        the recorded columns.
+        """
+        if not self._active:
+            return
+        values = {name: reporter(model) for name, reporter in self._active}
+        step = model.schedule.steps
+        for callback, names in self._subscribers:
+            callback(step, {name: values[name] for name in names})
+        if not self.columns:
+            return
+
+        if self._buffers is None:
+            self._dtypes = {"Step": np.dtype(np.int64)}
+            for name in self.columns:
+                self._dtypes[name] = _dtype_of(values[name])
+            self._buffers = {
+                name: np.empty(self.chunk_size, dtype=dtype)
+                for name, dtype in self._dtypes.items()
+            }
+        i = self._length
+        self._buffers["Step"][i] = step
+        dtypes = self._dtypes
+        for name in self.columns:
+            value = values[name]
+            dtype = dtypes[name]
+            if dtype != _FLOAT:
+                wider = np.promote_types(dtype, _dtype_of(value))
+                if wider != dtype:
+                    self._widen(name, wider)
+            self._buffers[name][i] = value
+        self._length += 1
+        if self._length == self.chunk_size:
+            self.flush()
+
+    def _widen(self, name, dtype):
+        """
+        Convert a column to a wider type, in the buffer and in everything
+        written out before.
+        """
+        old = self._dtypes[name]
+        self._dtypes[name] = dtype
+        self._buffers[name] = self._buffers[name].astype(dtype)
+        for chunk in self._chunks:
+            chunk[name] = chunk[name].astype(dtype)
+        if self.path is not None:
+            column_path = os.path.join(self.path, f"{name}.bin")
+            if os.path.exists(column_path):
+                np.fromfile(column_path, dtype=old).astype(dtype).tofile(column_path)
+                self._write_manifest(self._dtypes)
+
+    def flush(self):
+        """
+        Write out the buffered collections.
+        """
+        if not self._length:
+            return
+        chunk = {name: buffer[: self._length] for name, buffer in self._buffers.items()}
+        if self.path is None:
+            self._chunks.append({name: column.copy() for name, column in chunk.items()})
+        else:
+            self._write(chunk)
+        self._length = 0
+
+    def get_columns(self):
+        """
+        Returns a dict of column name to NumPy array with everything
+        collected so far.
+        """
+        self.flush()
+        if self.path is not None:
+            if not os.path.exists(os.path.join(self.path, MANIFEST)):
+                return {}
+            return read_columns(self.path)
+        if not self._chunks:
+            return {}
+        return {
+            name: np.concatenate([chunk[name] for chunk in self._chunks])
+            for name in self._chunks[0]
+        }
+
+    def get_model_vars_dataframe(self):
+        """
+        Returns the collected values as a DataFrame indexed by step, like
+        mesa.DataCollector does.
+        """
+        columns = self.get_columns()
+        if not columns:
+            return pd.DataFrame(columns=self.columns)
+        return pd.DataFrame(columns).set_index("Step")
@@ -0,0 +1,109 @@
+"""
+Headless entry point
+====================
+
+Runs WolfSheep without loading the visualization server. mesa's package
+import always loads mesa.visualization, which in turn imports the tornado
+server if it is installed; this module makes that import fail before mesa is
+loaded, so mesa.visualization stays an empty module. Import it first (or run
+it with -m) in processes that never draw.
+
+A single run writes the collected data and reports how long the model took to
+build and to step:
+
+    $ python -m wolf_sheep.headless run --steps 100 --set width=2000 --set height=2000 --set soil=true -o run.csv
+
+and a parameter sweep takes the arguments of batch.py, except --from-server:
+
+    $ python -m wolf_sheep.headless batch config.json -o out.csv
+"""
+
+import sys
+
+if "mesa" not in sys.modules:
+    # A None entry makes "import mesa_viz_tornado" raise ImportError, which
+    # mesa.visualization silently ignores (as of mesa 2.4, see requirements.txt)
+    sys.modules.setdefault("mesa_viz_tornado", None)
+
+import argparse
+import json
+import time
+
+from .model import WolfSheep
+from .stopping import from_config
+
+
+def parse_setting(text):
+    """
+    Returns the (name, value) of a name=value model parameter, the value
+    parsed as JSON when it is valid JSON and kept as a string otherwise.
+    """
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected name=value, got {text!r}")
+    try:
+        return name, json.loads(value)
+    except json.JSONDecodeError:
+        return name, value
+
+
+def run(params, steps, seed=None, stop=()):
+    """
+    Build and run one model. Returns the model, why it stopped, and the
+    seconds it took to build and to step.
+    """
+    start = time.perf_counter()
+    model = WolfSheep(seed=seed, stop_conditions=from_config(stop), **params)
+    built = time.perf_counter()
+    stop_reason = model.run_model(steps)
+    return model, stop_reason, built - start, time.perf_counter() - built
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless WolfSheep runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    single = commands.add_parser("run", help="run one model")
+    single.add_argument("--steps", type=int, default=200, help="steps to run")
+    single.add_argument("--seed", type=int, help="model seed")
+    single.add_argument(
+        "--set",
+        type=parse_setting,
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="model parameter, the value as JSON (repeatable)",
+    )
+    single.add_argument(
+        "--stop",
+        type=json.loads,
+        default=(),
+        help="stop conditions as JSON, see stopping.from_config",
+    )
+    single.add_argument("-o", "--output", help="file the collected data is written to")
+    commands.add_parser("batch", help="run a parameter sweep, see batch.py", add_help=False)
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command == "batch":
+        if "--from-server" in rest:
+            parser.error("--from-server needs the visualization, use python -m wolf_sheep.batch")
+        from . import batch
+
+        return batch.main(rest)
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+
+    model, stop_reason, build_time, step_time = run(dict(args.set), args.steps, args.seed, args.stop)
+    steps = model.schedule.steps
+    print(
+        f"built in {build_time:.2f}s, {steps} steps in {step_time:.2f}s "
+        f"({steps / max(step_time, 1e-9):.1f} steps/s), stopped on {stop_reason}",
+        file=sys.stderr,
+    )
+    if args.output:
+        from .batch import collected_data, write_results
+
+        write_results(collected_data(model), args.output)
+
+
+if __name__ == "__main__":
+    main()
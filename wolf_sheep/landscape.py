@@ -0,0 +1,87 @@
+"""
+Landscape rasters
+=================
+
+Initial soil levels and plant stages read from files instead of drawn at
+random, e.g. WolfSheep(soil=True, soil_levels="soil.npy").
+
+A raster holds one int8 value per cell, indexed [x, y] like the model's own
+arrays: a .npy file of shape (width, height), or a raw binary file of
+width * height bytes in the same (x-major) order. Files are memory-mapped
+copy-on-write, so a model only reads the pages it needs and writes to private
+copies of the pages it changes; replicates running in other processes share
+every page they leave untouched through the operating system's page cache.
+Arrays passed directly are copied, as a model changes its soil levels and
+plants in place.
+"""
+
+import os
+
+import numpy as np
+
+from .agents import MAX_SOIL_LEVEL
+from .plants import TREE
+
+
+def load(source, shape, name, max_value):
+    """
+    Returns the raster in source, checked to have the given (width, height)
+    shape and values in 0..max_value, or None if source is None.
+
+    Args:
+        source: Path of a .npy or raw int8 file, an array, or None
+        shape: (width, height) of the grid
+        name: Name of the raster in error messages
+        max_value: Largest valid value
+    """
+    if source is None:
+        return None
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        if path.endswith(".npy"):
+            raster = np.load(path, mmap_mode="c")
+            if raster.dtype != np.int8:
+                # Converting would copy the whole raster into private memory
+                raise ValueError(
+                    f"{name} file {path} holds {raster.dtype} values; save it as "
+                    f"int8 so it can be mapped, e.g. np.save(path, raster.astype(np.int8))"
+                )
+        else:
+            size = os.path.getsize(path)
+            if size != shape[0] * shape[1]:
+                raise ValueError(
+                    f"{name} file {path} holds {size} bytes, expected "
+                    f"{shape[0]} x {shape[1]} int8 values"
+                )
+            raster = np.memmap(path, dtype=np.int8, mode="c", shape=shape)
+    else:
+        raster = np.array(source, dtype=np.int8)
+    if raster.shape != tuple(shape):
+        raise ValueError(f"{name} raster has shape {raster.shape}, the grid is {tuple(shape)}")
+    if raster.size and (raster.min() < 0 or raster.max() > max_value):
+        raise ValueError(f"{name} raster values must be in 0..{max_value}")
+    return raster
+
+
+def soil_levels(model, columns=None):
+    """
+    Returns the model's initial soil level raster, or None to draw the levels
+    at random. columns selects a range of columns as a slice.
+    """
+    raster = load(model.soil_levels, _shape(model), "soil_levels", MAX_SOIL_LEVEL)
+    return raster if raster is None or columns is None else raster[columns]
+
+
+def plant_stages(model, columns=None):
+    """
+    Returns the model's initial plant stage raster (see plants.NONE, GRASS,
+    BUSH and TREE), or None to grow grass on every fertile cell. columns
+    selects a range of columns as a slice.
+    """
+    raster = load(model.plant_stages, _shape(model), "plant_stages", TREE)
+    return raster if raster is None or columns is None else raster[columns]
+
+
+def _shape(model):
+    # Tiles only cover some columns of the grid_width wide grid
+    return (getattr(model, "grid_width", model.width), model.height)
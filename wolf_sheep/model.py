@@ -9,11 +9,65 @@ Replication of the model found in NetLogo:
     Northwestern University, Evanston, IL.
 """
 
+import gc
+import inspect
+import pickle
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from operator import attrgetter
+
 import mesa
 
-from .agents import SoilPatch, Grass, Bush, Tree, Mouse, Sheep, Cat, Wolf, FirePatch
-from .scheduler import RandomActivationByTypeFiltered
-import random
+import numpy as np
+
+from .agents import SoilPatch, Grass, Bush, Tree, Mouse, Sheep, Cat, Wolf
+from .scheduler import RandomActivationByTypeFiltered, extend_agent_set
+from .plants import PlantLayer, NONE, STAGE_TYPES, TYPE_STAGES
+from .space import LayeredMultiGrid
+from . import landscape
+from .rng import RandomStreams
+from .pool import AgentPool
+from .vectorized import AnimalEngine
+from .collector import StreamingDataCollector
+from .profiling import StepProfiler, GRID_OPERATIONS
+
+PLANT_TYPES = (Grass, Bush, Tree)
+# Energy an animal gains from eating each kind of food
+FOOD_ENERGIES = {
+    Grass: 4,
+    Bush: 8,
+    Tree: 12,
+    Mouse: 8,
+    Sheep: 20,
+    Cat: 12,
+}
+PROFILED_TYPES = (Mouse, Sheep, Cat, Wolf, SoilPatch, Grass, Bush, Tree)
+PROFILED_PHASES = (
+    "plants.step",
+    "animals.step",
+    "schedule.step",
+    "datacollector.collect",
+    "forest_fire",
+    "migration",
+)
+_NULL_CONTEXT = nullcontext()
+
+
+def _no_phase(name):
+    return _NULL_CONTEXT
+
+
+@contextmanager
+def _gc_paused():
+    # None of the objects allocated meanwhile is garbage; collecting while
+    # allocating millions of them only walks the growing heap again and again
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
 
 
 class WolfSheep(mesa.Model):
@@ -39,6 +93,11 @@ class WolfSheep(mesa.Model):
 
     verbose = False  # Print-monitoring
 
+    # While spawn_agents builds agents, the list they register into
+    _registering = None
+    # Set while load_checkpoint builds the model, which it then fills itself
+    _restoring = False
+
     description = (
         "A model simulating the phenomenon of ecological succession"
     )
@@ -63,11 +122,32 @@ class WolfSheep(mesa.Model):
         sheep_evolution_time=5,
         cat_evolution_time=5,
         wolf_evolution_time=5,
+        cat_hunt_radius=1,
+        wolf_hunt_radius=1,
         soil=False,
         grass_regrowth_time=30,
         grass_evolution_time = 5,
         bush_evolution_time = 5,
         soil_evolution_time = 5,
+        soil_levels=None,
+        plant_stages=None,
+        plant_engine="agents",
+        engine="agents",
+        fire_period=100,
+        fire_fraction=0.8,
+        fire_mode="sample",
+        fire_spread=0.6,
+        fire_ignitions=5,
+        migration=True,
+        agent_pool=False,
+        deferred_changes=False,
+        collector="mesa",
+        collect_interval=1,
+        collect_path=None,
+        collect_columns=None,
+        profile=False,
+        stop_conditions=(),
+        seed=None,
     ):
         """
         Create a new Wolf-Sheep model with the given parameters.
@@ -82,8 +162,56 @@ class WolfSheep(mesa.Model):
             grass_regrowth_time: How long it takes for a grass patch to regrow
                                  once it is eaten
             sheep_gain_from_food: Energy sheep gain from grass, if enabled.
+            cat_hunt_radius: How far away a cat senses mice
+            wolf_hunt_radius: How far away a wolf senses sheep and mice
+            soil_levels: Initial soil level of every cell, as a (width,
+                         height) array or the path of a .npy or raw int8
+                         file, which is memory-mapped (see landscape.py);
+                         None to draw the levels at random
+            plant_stages: Initial plant stage (plants.NONE, GRASS, BUSH or
+                          TREE) of every cell, given like soil_levels; None
+                          for grass on every cell with soil
+            plant_engine: "agents" to simulate soil and plants with one agent
+                          per patch, "timers" for the same agents woken only
+                          at the steps they change state, "vectorized" to
+                          keep them in a PlantLayer of NumPy arrays
+            engine: "agents" to simulate animals with one agent each,
+                    "vectorized" to keep them in an AnimalEngine of NumPy
+                    arrays (implies plant_engine="vectorized", and
+                    leaves the model without a grid)
+            fire_period: Steps between forest fires, 0 to disable them
+            fire_fraction: Fraction of the grid a fire burns (at most, when
+                           spreading)
+            fire_mode: "sample" to burn cells picked uniformly at random,
+                       "spread" to grow the fire from ignition points
+            fire_spread: Probability that a spreading fire jumps to each
+                         neighbor of a burning cell
+            fire_ignitions: Number of cells a spreading fire starts on
+            migration: Whether a random animal may migrate into the grid
+                       each step
+            agent_pool: Whether to recycle dead agents for new births
+            deferred_changes: Whether births and deaths during a step reach
+                              the schedule only when the step ends (animals
+                              leave and join the grid at once either way);
+                              dead agents do not act for the rest of the
+                              step and newborns first act on the next one
+            collector: "mesa" to collect into a mesa.DataCollector,
+                       "streaming" to use a StreamingDataCollector
+            collect_interval: Collect data every this many steps
+            collect_path: Directory the streaming collector writes its column
+                          store to, which must not hold one already, None
+                          to keep it in memory
+            collect_columns: Names of the series the streaming collector
+                             records, None for all of them
+            profile: Whether to record per-step timings per agent type and
+                     model phase, and grid operation counts (see
+                     profile_table)
+            stop_conditions: Conditions that end the run early, checked at
+                             the end of every step (see stopping.py)
+            seed: Seed for the model's random number generator
         """
         super().__init__()
+        self.streams = RandomStreams(self._seed)
         # Set parameters
         self.width = width
         self.height = height
@@ -92,7 +220,20 @@ class WolfSheep(mesa.Model):
         self.sheep_reproduce = sheep_reproduce
         self.wolf_reproduce = wolf_reproduce
         self.soil = soil
+        self.soil_levels = soil_levels
+        self.plant_stages = plant_stages
         self.grass_regrowth_time = grass_regrowth_time
+        self.engine = engine
+        self.plant_engine = "vectorized" if engine == "vectorized" else plant_engine
+        self.fire_period = fire_period
+        self.fire_fraction = fire_fraction
+        self.fire_mode = fire_mode
+        self.fire_spread = fire_spread
+        self.fire_ignitions = fire_ignitions
+        self.migration_enabled = migration
+        self.collect_interval = collect_interval
+        self.stop_conditions = list(stop_conditions)
+        self.stop_reason = None
 
         # counter
         self.cnt = 1
@@ -110,70 +251,114 @@ class WolfSheep(mesa.Model):
         self.sheep_evolution_time = sheep_evolution_time
         self.cat_evolution_time = cat_evolution_time
         self.wolf_evolution_time = wolf_evolution_time
+        self.cat_hunt_radius = cat_hunt_radius
+        self.wolf_hunt_radius = wolf_hunt_radius
 
         self.grass_evolution_time = grass_evolution_time
         self.bush_evolution_time = bush_evolution_time
         self.soil_evolution_time = soil_evolution_time
 
-        self.food_energies = {
-            Grass: 4,
-            Bush: 8,
-            Tree: 12,
-            Mouse: 8,
-            Sheep: 20,
-            Cat: 12,
-        }
+        self.food_energies = dict(FOOD_ENERGIES)
         ##
 
+        self.pool = AgentPool() if agent_pool else None
+        self.burned = np.zeros((self.width, self.height), dtype=bool)
+        self._burning = False
+
+        self.profiler = StepProfiler() if profile else None
         self.schedule = RandomActivationByTypeFiltered(self)
-        self.grid = mesa.space.MultiGrid(self.width, self.height, torus=True)
-        self.datacollector = mesa.DataCollector(
-            {
-                "Mice": lambda m: m.schedule.get_type_count(Mouse),
-                "Cats": lambda m: m.schedule.get_type_count(Cat),
-                "Wolves": lambda m: m.schedule.get_type_count(Wolf),
-                "Sheep": lambda m: m.schedule.get_type_count(Sheep),
-                "Grass": lambda m: m.schedule.get_type_count(Grass),
-                "Bush": lambda m: m.schedule.get_type_count(Bush),
-                "Tree": lambda m: m.schedule.get_type_count(Tree),
-            }
+        self.schedule.profiler = self.profiler
+        self.schedule.defer_changes = deferred_changes
+        self.schedule.register_filter(
+            "fully_grown", Grass, attrgetter("fully_grown")
         )
+        self._timed_plants = self.soil and self.plant_engine == "timers"
+        if self._timed_plants:
+            for agent_type in (SoilPatch, Grass, Bush, Tree):
+                self.schedule.register_timed_type(agent_type)
+        # The array engines keep every plant and animal off the grid, and a
+        # grid of tens of millions of empty cells takes seconds and
+        # gigabytes to build
+        self.grid = None
+        if self.engine != "vectorized":
+            self.grid = LayeredMultiGrid(
+                self.width,
+                self.height,
+                torus=True,
+                soil_types=(SoilPatch,),
+                plant_types=(Grass, Bush, Tree),
+            )
+            if self.profiler is not None:
+                self.grid.op_counts = self.profiler.grid_counts
+        # Reporters are picklable (no lambdas), so the model can be checkpointed
+        model_reporters = {
+            "Mice": partial(WolfSheep.animal_count, agent_type=Mouse),
+            "Cats": partial(WolfSheep.animal_count, agent_type=Cat),
+            "Wolves": partial(WolfSheep.animal_count, agent_type=Wolf),
+            "Sheep": partial(WolfSheep.animal_count, agent_type=Sheep),
+            "Grass": partial(WolfSheep.plant_count, plant_type=Grass),
+            "Bush": partial(WolfSheep.plant_count, plant_type=Bush),
+            "Tree": partial(WolfSheep.plant_count, plant_type=Tree),
+        }
+        if self.profiler is not None:
+            # The profile of a step is complete only after the step's data is
+            # collected, so these series hold the profile of the step before
+            columns = [f"time/{t.__name__}" for t in PROFILED_TYPES]
+            columns += [f"calls/{t.__name__}" for t in PROFILED_TYPES]
+            columns += [f"time/{phase}" for phase in PROFILED_PHASES]
+            columns += [f"grid/{operation}" for operation in GRID_OPERATIONS]
+            for column in columns:
+                model_reporters[column] = partial(WolfSheep.profile_value, column=column)
+        if collector == "streaming":
+            self.datacollector = StreamingDataCollector(
+                model_reporters, path=collect_path, columns=collect_columns
+            )
+        else:
+            self.datacollector = mesa.DataCollector(model_reporters)
 
-        # Create mouse:
-        for i in range(self.initial_mice):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            energy = self.random.randrange(10)
-            mouse = Mouse(self.next_id(), (x, y), self, True, energy)
-            self.grid.place_agent(mouse, (x, y))
-            self.schedule.add(mouse)
-
-        # Create sheep:
-        for i in range(self.initial_sheep):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            energy = self.random.randrange(20)
-            sheep = Sheep(self.next_id(), (x, y), self, True, energy)
-            self.grid.place_agent(sheep, (x, y))
-            self.schedule.add(sheep)
-
-        # Create cats:
-        for i in range(self.initial_cats):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            energy = self.random.randrange(20)
-            cat = Cat(self.next_id(), (x, y), self, True, energy)
-            self.grid.place_agent(cat, (x, y))
-            self.schedule.add(cat)
-
-        # Create wolves
-        for i in range(self.initial_wolves):
-            x = self.random.randrange(self.width)
-            y = self.random.randrange(self.height)
-            energy = self.random.randrange(30)
-            wolf = Wolf(self.next_id(), (x, y), self, True, energy)
-            self.grid.place_agent(wolf, (x, y))
-            self.schedule.add(wolf)
+        self.animals = AnimalEngine(self) if self.engine == "vectorized" else None
+        self.plants = None
+        # load_checkpoint fills the model from the checkpoint instead
+        if not self._restoring:
+            self._populate()
+            self.running = True
+            self.datacollector.collect(self)
+
+    def _populate(self):
+        """
+        Create the initial animals, soil and plants.
+        """
+        if self.animals is not None:
+            rng = self.streams.numpy("init")
+            for agent_type, n, max_energy in (
+                (Mouse, self.initial_mice, 10),
+                (Sheep, self.initial_sheep, 20),
+                (Cat, self.initial_cats, 20),
+                (Wolf, self.initial_wolves, 30),
+            ):
+                positions = np.column_stack(
+                    (
+                        rng.integers(0, self.width, size=n),
+                        rng.integers(0, self.height, size=n),
+                    )
+                )
+                self.animals.add(
+                    agent_type, positions, rng.integers(0, max_energy, size=n)
+                )
+        else:
+            for agent_type, n, max_energy in (
+                (Mouse, self.initial_mice, 10),
+                (Sheep, self.initial_sheep, 20),
+                (Cat, self.initial_cats, 20),
+                (Wolf, self.initial_wolves, 30),
+            ):
+                positions, energies = [], []
+                for i in range(n):
+                    x = self.random.randrange(self.width)
+                    y = self.random.randrange(self.height)
+                    positions.append((x, y))
+                    energies.append(self.random.randrange(max_energy))
+                self.spawn_agents(agent_type, positions, [True] * n, energies)
 
         # Create grass patches
         # if self.grass:
@@ -190,17 +375,40 @@ class WolfSheep(mesa.Model):
         #         self.schedule.add(patch)
 
         # Create soil patches
-        if self.soil:
-            for agent, (x, y) in self.grid.coord_iter():
-                level = self.random.choice([0, 1, 2, 3])
-                if level > 0:
-                    countdown = self.random.randrange(self.grass_regrowth_time)
-                    grass = Grass(self.next_id(), (x, y), self,countdown)
-                    self.grid.place_agent(grass, (x, y))
-                    self.schedule.add(grass)
-                patch = SoilPatch(self.next_id(), (x, y), self, level)
-                self.grid.place_agent(patch, (x, y))
-                self.schedule.add(patch)
+        if self.soil and self.plant_engine == "vectorized":
+            self.plants = PlantLayer(
+                self,
+                self.streams.numpy("succession"),
+                landscape.soil_levels(self),
+                landscape.plant_stages(self),
+            )
+        elif self.soil:
+            level_raster = landscape.soil_levels(self)
+            stage_raster = landscape.plant_stages(self)
+            cells = [(x, y) for x in range(self.width) for y in range(self.height)]
+            levels, countdowns = [], []
+            planted = {Grass: [], Bush: [], Tree: []}
+            for x, y in cells:
+                if level_raster is None:
+                    level = self.random.choice([0, 1, 2, 3])
+                else:
+                    level = int(level_raster[x, y])
+                levels.append(level)
+                if stage_raster is None:
+                    plant_type = Grass if level > 0 else None
+                else:
+                    plant_type = STAGE_TYPES[stage_raster[x, y]]
+                if plant_type is not None:
+                    planted[plant_type].append((x, y))
+                if plant_type is Grass:
+                    countdowns.append(self.random.randrange(self.grass_regrowth_time))
+            # Grass before the soil patches, so they see it when scheduled;
+            # bushes and trees look at their soil when scheduled, and
+            # reschedule it
+            self.spawn_agents(Grass, planted[Grass], countdowns)
+            self.spawn_agents(SoilPatch, cells, levels)
+            self.spawn_agents(Bush, planted[Bush])
+            self.spawn_agents(Tree, planted[Tree])
 
         # for i in range(self.initial_wolves):
         #     x = self.random.randrange(self.width)
@@ -210,30 +418,78 @@ class WolfSheep(mesa.Model):
         #     self.grid.place_agent(wolf, (x, y))
         #     self.schedule.add(wolf)
 
-        self.running = True
-        self.datacollector.collect(self)
-
     def step(self):
-        self.schedule.step()
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_step(self.schedule.steps + 1)
+            phase = profiler.phase
+        else:
+            phase = _no_phase
+
+        if self.plants is not None:
+            with phase("plants.step"):
+                self.plants.step()
+        if self.animals is not None:
+            with phase("animals.step"):
+                self.animals.step()
+        with phase("schedule.step"):
+            self.schedule.step()
+        if self.pool is not None:
+            self.pool.flush()
         self.cnt += 1
         # collect data
-        self.datacollector.collect(self)
+        if self.schedule.steps % self.collect_interval == 0:
+            with phase("datacollector.collect"):
+                self.datacollector.collect(self)
         if self.verbose:
             print(
                 [
                     self.schedule.time,
                     # self.schedule.get_type_count(Wolf),
                     # self.schedule.get_type_count(Sheep),
-                    self.schedule.get_type_count(Grass),
-                    self.schedule.get_type_count(Tree),
-                    self.schedule.get_type_count(Bush),
-                    self.schedule.get_type_count(SoilPatch), #, lambda x: x.fully_grown)
+                    self.plant_count(Grass),
+                    self.plant_count(Tree),
+                    self.plant_count(Bush),
+                    self.schedule.get_type_count(SoilPatch),
+                    self.schedule.get_type_count(Grass, "fully_grown"),
                 ]
             )
-        self.forest_fire()
-        self.migration()
+        with phase("forest_fire"):
+            self.forest_fire()
+        if self.migration_enabled:
+            with phase("migration"):
+                self.migration()
+        for condition in self.stop_conditions:
+            self.stop_reason = condition(self)
+            if self.stop_reason is not None:
+                self.running = False
+                break
+
+        if profiler is not None:
+            profiler.end_step()
+
+    def profile_value(self, column):
+        """
+        Returns a column of the profile of the last complete step.
+        """
+        return self.profiler.last(column)
+
+    def profile_table(self):
+        """
+        Returns the per-step profile as a DataFrame indexed by step, with the
+        wall time and calls per agent type, the wall time of the model phases
+        and the grid operation counts. Requires profile=True.
+        """
+        if self.profiler is None:
+            raise ValueError("profiling is off, create the model with profile=True")
+        return self.profiler.table()
 
     def run_model(self, step_count=200):
+        """
+        Run step_count steps, or fewer if a stop condition ends the run.
+        Returns why the run stopped: the reason given by the stop condition,
+        or "step_count".
+        """
         if self.verbose:
             # print("Initial number wolves: ", self.schedule.get_type_count(Wolf))
             # print("Initial number sheep: ", self.schedule.get_type_count(Sheep))
@@ -244,6 +500,8 @@ class WolfSheep(mesa.Model):
 
         for i in range(step_count):
             self.step()
+            if not self.running:
+                break
 
         if self.verbose:
             print("")
@@ -253,46 +511,557 @@ class WolfSheep(mesa.Model):
                 "Final number grass: ",
                 self.schedule.get_type_count(SoilPatch),
             )
+        return self.stop_reason or "step_count"
+
+    def save_checkpoint(self, path):
+        """
+        Write the complete state of the model to an archive of NumPy arrays
+        (see numpy.savez): the attributes of every agent, type by type in the
+        order the schedule keeps them, the arrays of the plant and animal
+        engines, and a small pickled record of the parameters, counters,
+        random number streams and data collected so far. A model loaded from
+        it continues exactly as this one would.
+        """
+        schedule = self.schedule
+        agent_types = schedule.agent_types()
+        arrays = {"burned": self.burned}
+        with _gc_paused():
+            for agent_type in agent_types:
+                arrays.update(self._agent_arrays(agent_type))
+        if self.plants is not None:
+            for name in PLANT_LAYER_ARRAYS:
+                arrays[f"plants/{name}"] = getattr(self.plants, name)
+        if self.animals is not None:
+            for agent_type, species in self.animals.species.items():
+                for name in SPECIES_ARRAYS:
+                    arrays[f"animals/{agent_type.__name__}/{name}"] = getattr(species, name)
+
+        parameters = {
+            "width": self.width,
+            "height": self.height,
+            "initial_sheep": self.initial_sheep,
+            "initial_wolves": self.initial_wolves,
+            "initial_mice": self.initial_mice,
+            "initial_cats": self.initial_cats,
+            "soil": self.soil,
+            "soil_levels": self.soil_levels,
+            "plant_stages": self.plant_stages,
+            "engine": self.engine,
+            "plant_engine": self.plant_engine,
+            "agent_pool": self.pool is not None,
+            "deferred_changes": schedule.defer_changes,
+            "collector": (
+                "streaming"
+                if isinstance(self.datacollector, StreamingDataCollector)
+                else "mesa"
+            ),
+            "profile": self.profiler is not None,
+            "seed": self._seed,
+        }
+        for name, attribute in CHECKPOINT_PARAMETERS.items():
+            parameters[name] = getattr(self, attribute)
+        state = {
+            "model": type(self).__name__,
+            "parameters": parameters,
+            "agent_types": [agent_type.__name__ for agent_type in agent_types],
+            "random": self.random.getstate(),
+            "streams": self.streams,
+            "current_id": self.current_id,
+            "cnt": self.cnt,
+            "running": self.running,
+            "stop_reason": self.stop_reason,
+            "steps": schedule.steps,
+            "time": schedule.time,
+            "burning": self._burning,
+            "food_energies": self.food_energies,
+            "datacollector": self.datacollector,
+            "profiler": self.profiler,
+        }
+        arrays["state"] = np.frombuffer(pickle.dumps(state, protocol=5), dtype=np.uint8)
+        with open(path, "wb") as f:
+            # Given a file rather than a path, numpy does not append .npz
+            np.savez(f, **arrays)
+
+    def _agent_arrays(self, agent_type):
+        """
+        Returns the arrays save_checkpoint stores for the agents of a type.
+        """
+        agents = self.schedule.agents_of_type(agent_type)
+        name = agent_type.__name__
+        columns, attributes = CHECKPOINT_STATE[agent_type]
+        names = ("unique_id", "pos") + columns + attributes
+        # One pass over the agents, rather than one per attribute
+        rows = list(map(attrgetter(*names), agents))
+        arrays = {}
+        for attribute, values in zip(names, zip(*rows) if rows else [()] * len(names)):
+            if attribute == "plant_type":
+                values = [NONE if value is None else TYPE_STAGES[value] for value in values]
+            arrays[f"{name}/{attribute}"] = np.array(values)
+        arrays[f"{name}/pos"] = arrays[f"{name}/pos"].reshape(-1, 2)
+        grid = self.grid
+        if agent_type not in grid.soil_types + grid.plant_types:
+            # random_agent_at picks by the order of the agents within a cell
+            arrays[f"{name}/cell_rank"] = np.array(grid.cell_ranks(agents), dtype=np.int64)
+        wakes = self.schedule.pending_wakes(agent_type)
+        if wakes:
+            index = {agent: i for i, agent in enumerate(agents)}
+            ticks, sequences, woken = zip(*wakes)
+            arrays[f"{name}/wake_tick"] = np.array(ticks, dtype=np.int64)
+            arrays[f"{name}/wake_sequence"] = np.array(sequences, dtype=np.int64)
+            arrays[f"{name}/wake_agent"] = np.array([index[agent] for agent in woken], dtype=np.int64)
+        return arrays
+
+    @classmethod
+    def load_checkpoint(cls, path, collect_path=None, **params):
+        """
+        Load a model written by save_checkpoint.
+
+        The model is built empty from the saved parameters, and its agents
+        are recreated from the saved arrays in bulk through spawn_agents'
+        path, rather than unpickled one object at a time.
+
+        Keyword arguments override model parameters of the same name, to
+        branch a scenario off the saved state, e.g.
+        WolfSheep.load_checkpoint("burn_in.ckpt", cat_reproduce=0.1).
+
+        A streaming collector keeps the data collected before the checkpoint
+        in memory, and goes on collecting there, unless collect_path names a
+        new column store to write it all to; the store of the original run is
+        left alone, so several branches can be loaded from one checkpoint.
+        """
+        with np.load(path) as archive:
+            if "state" not in archive.files:
+                raise ValueError(f"{path} is not a model checkpoint")
+            arrays = {name: archive[name] for name in archive.files}
+        state = pickle.loads(arrays.pop("state").tobytes())
+        if state["model"] != cls.__name__:
+            raise TypeError(f"{path} does not hold a {cls.__name__} checkpoint")
+        parameters = dict(state["parameters"])
+        for name, value in params.items():
+            if name in CONSTRUCTION_PARAMETERS:
+                raise TypeError(f"{name!r} is fixed when the model is built")
+            if name not in CHECKPOINT_PARAMETERS:
+                raise TypeError(f"{cls.__name__} has no parameter {name!r}")
+            parameters[name] = value
+
+        # The agents are recreated after the model is built with the
+        # overrides, so e.g. predators copy an overridden hunting radius
+        model = cls.__new__(cls, seed=parameters["seed"])
+        model._restoring = True
+        with _gc_paused():
+            model.__init__(**parameters)
+            model._restore(state, arrays)
+        model._restoring = False
+        if collect_path is not None:
+            if not isinstance(model.datacollector, StreamingDataCollector):
+                raise ValueError("collect_path needs collector='streaming'")
+            model.datacollector.move_to(collect_path)
+        return model
+
+    def _restore(self, state, arrays):
+        """
+        Fill a model built by load_checkpoint from the saved state and arrays.
+        """
+        schedule = self.schedule
+        agent_types = [CHECKPOINT_TYPES[name] for name in state["agent_types"]]
+        # Types whose agents all died still take part in the type shuffle
+        schedule.add_types(agent_types)
+        for agent_type in agent_types:
+            self._restore_agents(agent_type, arrays)
+        if "plants/level" in arrays:
+            self.plants = PlantLayer(self, None, arrays["plants/level"], arrays["plants/stage"])
+            for name in PLANT_LAYER_ARRAYS:
+                setattr(self.plants, name, arrays[f"plants/{name}"])
+        if self.animals is not None:
+            for agent_type, species in self.animals.species.items():
+                for name in SPECIES_ARRAYS:
+                    setattr(species, name, arrays[f"animals/{agent_type.__name__}/{name}"])
+
+        self.streams = state["streams"]
+        if self.plants is not None:
+            self.plants.rng = self.streams.numpy("succession")
+        self.random.setstate(state["random"])
+        self.current_id = state["current_id"]
+        self.cnt = state["cnt"]
+        self.running = state["running"]
+        self.stop_reason = state["stop_reason"]
+        schedule.steps = state["steps"]
+        schedule.time = state["time"]
+        self.burned = arrays["burned"]
+        self._burning = state["burning"]
+        self.food_energies = state["food_energies"]
+        self.datacollector = state["datacollector"]
+        self.profiler = schedule.profiler = state["profiler"]
+        if self.profiler is not None and self.grid is not None:
+            self.grid.op_counts = self.profiler.grid_counts
+
+    def _restore_agents(self, agent_type, arrays):
+        """
+        Recreate the agents of a type from the arrays _agent_arrays made,
+        in their saved order, cells and pending wake-ups.
+        """
+        name = agent_type.__name__
+        columns, attributes = CHECKPOINT_STATE[agent_type]
+        values = {
+            attribute: arrays[f"{name}/{attribute}"].tolist()
+            for attribute in columns + attributes
+        }
+        if "plant_type" in values:
+            values["plant_type"] = [STAGE_TYPES[stage] for stage in values["plant_type"]]
+        agents = self._build_agents(
+            agent_type,
+            arrays[f"{name}/unique_id"].tolist(),
+            zip(*arrays[f"{name}/pos"].T.tolist()),
+            [values[column] for column in columns],
+            {attribute: values[attribute] for attribute in attributes},
+            reschedule=False,
+        )
+        if f"{name}/cell_rank" in arrays:
+            self.grid.order_cells(agents, arrays[f"{name}/cell_rank"].tolist())
+        if f"{name}/wake_tick" in arrays:
+            self.schedule.restore_wakes(
+                (tick, sequence, agents[i])
+                for tick, sequence, i in zip(
+                    arrays[f"{name}/wake_tick"].tolist(),
+                    arrays[f"{name}/wake_sequence"].tolist(),
+                    arrays[f"{name}/wake_agent"].tolist(),
+                )
+            )
+
+    def spawn(self, agent_type, pos, *args):
+        """
+        Create a new agent of agent_type at pos, place it on the grid and add
+        it to the schedule. args are passed to the agent's constructor after
+        unique_id, pos and model.
+        """
+        if self.pool is not None:
+            agent = self.pool.acquire(agent_type, self.next_id(), pos, self, *args)
+        else:
+            agent = agent_type(self.next_id(), pos, self, *args)
+        self.grid.place_agents((agent,))
+        self.schedule.add(agent)
+        if self._timed_plants and agent_type in PLANT_TYPES:
+            self.grid.soil_at(pos).reschedule()
+        return agent
+
+    def spawn_agents(self, agent_type, positions, *columns):
+        """
+        Create one agent of agent_type per position, register them with the
+        model, place them on the grid and add them to the schedule in bulk.
+        Each of columns holds one constructor argument per agent, passed
+        after unique_id, pos and model, e.g.
+        spawn_agents(Mouse, positions, [True] * n, energies). Returns the new
+        agents.
+        """
+        positions = list(positions)
+        first_id = self.current_id + 1
+        self.current_id += len(positions)
+        agents = self._build_agents(
+            agent_type, range(first_id, first_id + len(positions)), positions, columns
+        )
+        if self._timed_plants and agent_type in PLANT_TYPES:
+            for agent in agents:
+                soil = self.grid.soil_at(agent.pos)
+                # Soil placed later schedules itself
+                if soil is not None:
+                    soil.reschedule()
+        return agents
+
+    def _build_agents(
+        self, agent_type, unique_ids, positions, columns, attributes=None, reschedule=True
+    ):
+        """
+        Create, register, place and schedule agents in bulk, for spawn_agents
+        and load_checkpoint. attributes maps attribute names to one value per
+        agent, set before the agents are scheduled, so registered filters see
+        them; with reschedule False, timed agents do not schedule their
+        wake-ups.
+        """
+        pool = self.pool
+        names = list(attributes or ())
+        with _gc_paused():
+            positions = [tuple(pos) for pos in positions]
+            agents = self._registering = []
+            try:
+                for unique_id, pos, *args in zip(unique_ids, positions, *columns):
+                    if pool is not None:
+                        pool.acquire(agent_type, unique_id, pos, self, *args)
+                    else:
+                        agent_type(unique_id, pos, self, *args)
+            finally:
+                self._registering = None
+            if names:
+                rows = zip(*(attributes[name] for name in names))
+                for agent, row in zip(agents, rows):
+                    agent.__dict__.update(zip(names, row))
+            self._register_agents(agents)
+            self.grid.place_agents(agents)
+            self.schedule.add_agents(agents, reschedule=reschedule)
+        return agents
+
+    def register_agent(self, agent):
+        if self._registering is not None:
+            # Registered in bulk by spawn_agents
+            self._registering.append(agent)
+        else:
+            super().register_agent(agent)
+
+    def _register_agents(self, agents):
+        """
+        Register agents of one type with the model, as register_agent does
+        one at a time. Fills the registries of mesa 2.4, which
+        requirements.txt pins.
+        """
+        if not agents:
+            return
+        self._agents.update(dict.fromkeys(agents))
+        agent_type = type(agents[0])
+        if agent_type not in self._agents_by_type:
+            self._agents_by_type[agent_type] = mesa.agent.AgentSet([], self)
+        extend_agent_set(self._agents_by_type[agent_type], agents)
+        extend_agent_set(self._all_agents, agents)
+
+    def kill(self, agent):
+        """
+        Remove an agent from the grid and the schedule.
+        """
+        pos = agent.pos
+        self.grid.remove_agent(agent)
+        self.schedule.remove(agent)
+        self._retire(agent)
+        if self._timed_plants and type(agent) in PLANT_TYPES:
+            self.grid.soil_at(pos).reschedule()
+
+    def kill_agents(self, agents):
+        """
+        Remove several agents from the grid and the schedule at once.
+        """
+        agents = list(agents)
+        if self._timed_plants:
+            planted = [agent.pos for agent in agents if type(agent) in PLANT_TYPES]
+        for agent in agents:
+            self.grid.remove_agent(agent)
+        self.schedule.remove_agents(agents)
+        for agent in agents:
+            self._retire(agent)
+        if self._timed_plants:
+            for pos in planted:
+                # The same batch may have removed the soil too
+                soil = self.grid.soil_at(pos)
+                if soil is not None:
+                    soil.reschedule()
+
+    def _retire(self, agent):
+        # Drop the model's own reference, so the agent can be freed or reused
+        if hasattr(self, "deregister_agent"):
+            self.deregister_agent(agent)
+        if self.pool is not None:
+            self.pool.release(agent)
+
+    def reset_randomizer(self, seed=None):
+        """
+        Reset the model random number generator and every subsystem stream.
 
-    def forest_fire(self, period=100):
-        if self.cnt % period == 0:
-            total_cells = self.width * self.height
-            cells_to_kill = random.sample(list(self.grid.coord_iter()), int(0.8*total_cells))
-            print(cells_to_kill)
-
-            for agents, (x, y) in cells_to_kill:
-                # cell_content, x, y = self.grid[x][y]
-                if agents:
-                    for agent in agents:
-                        if not isinstance(agent, SoilPatch):
-                            self.grid.remove_agent(agent)
-                            self.schedule.remove(agent)
-                    fire = FirePatch(self.next_id(), (x, y), self)
-                    self.grid.place_agent(fire, (x, y))
-                    self.schedule.add(fire)
+        Args:
+            seed: A new seed for the RNG; if None, reset using the current seed
+        """
+        super().reset_randomizer(seed)
+        self.streams.reset(self._seed)
+        if self.plants is not None:
+            self.plants.rng = self.streams.numpy("succession")
+
+    def plant_count(self, plant_type):
+        """
+        Returns the current number of plants of a type, whichever plant
+        engine is in use.
+        """
+        if self.plants is not None:
+            return self.plants.count(plant_type)
+        return self.schedule.get_type_count(plant_type)
+
+    def animal_count(self, agent_type):
+        """
+        Returns the current number of animals of a type, whichever animal
+        engine is in use.
+        """
+        if self.animals is not None:
+            return self.animals.count(agent_type)
+        return self.schedule.get_type_count(agent_type)
+
+    def forest_fire(self, period=None):
+        """
+        Every period steps, burn fire_fraction of the grid: all agents except
+        soil patches on the burned cells die. The burned cells are flagged in
+        self.burned until the next step, for drawing.
+        """
+        if self._burning:
+            self.burned[:] = False
+            self._burning = False
+
+        period = self.fire_period if period is None else period
+        if not period or self.cnt % period != 0:
+            return
+
+        total_cells = self.width * self.height
+        n_burned = int(self.fire_fraction * total_cells)
+        if self.fire_mode == "spread":
+            cells = self._spread_fire(n_burned)
+        else:
+            cells = self.streams.numpy("fire").choice(total_cells, n_burned, replace=False)
+        if len(cells) == 0:
+            return
+
+        burned = self.burned.reshape(-1)
+        burned[cells] = True
+        self._burning = True
+        if self.plants is not None:
+            self.plants.clear(self.burned)
+        if self.animals is not None:
+            self.animals.clear(self.burned)
+
+        if self.grid is None:
+            return
+        height = self.height
+        positions = [(int(i) // height, int(i) % height) for i in cells]
+        if self._timed_plants:
+            planted = [pos for pos in positions if self.grid.plant_at(pos) is not None]
+        removed = self.grid.clear_cells(positions, keep_types=(SoilPatch,))
+        self.schedule.remove_agents(removed)
+        for agent in removed:
+            self._retire(agent)
+        if self._timed_plants:
+            for pos in planted:
+                # The same batch may have removed the soil too
+                soil = self.grid.soil_at(pos)
+                if soil is not None:
+                    soil.reschedule()
+
+    def _spread_fire(self, n_burned):
+        """
+        Returns the flat indices of cells burned by a fire that starts on
+        fire_ignitions random cells and spreads to each von Neumann neighbor
+        of a burning cell with probability fire_spread, stopping once
+        n_burned cells have burned. The cost is proportional to the number
+        of burned cells.
+        """
+        rng = self.streams.fire
+        width, height = self.width, self.height
+        total_cells = width * height
+        burned = set()
+        front = []
+        for _ in range(min(self.fire_ignitions, n_burned)):
+            cell = rng.randrange(total_cells)
+            if cell not in burned:
+                burned.add(cell)
+                front.append(cell)
+
+        while front and len(burned) < n_burned:
+            next_front = []
+            for cell in front:
+                x, y = divmod(cell, height)
+                for nx, ny in (
+                    ((x + 1) % width, y),
+                    ((x - 1) % width, y),
+                    (x, (y + 1) % height),
+                    (x, (y - 1) % height),
+                ):
+                    neighbor = nx * height + ny
+                    if neighbor not in burned and rng.random() < self.fire_spread:
+                        burned.add(neighbor)
+                        next_front.append(neighbor)
+                        if len(burned) >= n_burned:
+                            return sorted(burned)
+            front = next_front
+        return sorted(burned)
 
     def migration(self):
-        x = self.random.randrange(self.width)
-        y = self.random.randrange(self.height)
+        rng = self.streams.migration
+        x = rng.randrange(self.width)
+        y = rng.randrange(self.height)
 
-        match random.random():
+        match rng.random():
             case p if 0.0 < p < 0.02:
-                energy = self.random.randrange(30)
-                agent = Wolf(self.next_id(), (x, y), self, True, energy)
-                self.grid.place_agent(agent, (x, y))
-                self.schedule.add(agent)
+                energy = rng.randrange(30)
+                self._migrate(Wolf, (x, y), energy)
             case p if 0.02 < p < 0.06:
-                energy = self.random.randrange(20)
-                agent = Cat(self.next_id(), (x, y), self, True, energy)
-                self.grid.place_agent(agent, (x, y))
-                self.schedule.add(agent)
+                energy = rng.randrange(20)
+                self._migrate(Cat, (x, y), energy)
             case p if 0.06 < p < 0.14:
-                energy = self.random.randrange(20)
-                agent = Sheep(self.next_id(), (x, y), self, True, energy)
-                self.grid.place_agent(agent, (x, y))
-                self.schedule.add(agent)
+                energy = rng.randrange(20)
+                self._migrate(Sheep, (x, y), energy)
             case p if 0.14 < p < 0.24:
-                energy = self.random.randrange(10)
-                agent = Mouse(self.next_id(), (x, y), self, True, energy)
-                self.grid.place_agent(agent, (x, y))
-                self.schedule.add(agent)
+                energy = rng.randrange(10)
+                self._migrate(Mouse, (x, y), energy)
+
+    def _migrate(self, agent_type, pos, energy):
+        """
+        Add a migrating animal to whichever animal engine is in use.
+        """
+        if self.animals is not None:
+            self.animals.add(agent_type, [pos], [energy])
+        else:
+            self.spawn(agent_type, pos, True, energy)
+
+
+# Parameters that only shape how a model is built, so load_checkpoint cannot
+# override them
+CONSTRUCTION_PARAMETERS = frozenset(
+    (
+        "width",
+        "height",
+        "initial_sheep",
+        "initial_wolves",
+        "initial_mice",
+        "initial_cats",
+        "soil",
+        "soil_levels",
+        "plant_stages",
+        "engine",
+        "plant_engine",
+        "agent_pool",
+        "deferred_changes",
+        "collector",
+        "collect_path",
+        "collect_columns",
+        "profile",
+        "seed",
+    )
+)
+# Model attribute of every parameter load_checkpoint can override; all but
+# migration are stored under their own name
+CHECKPOINT_PARAMETERS = {
+    name: name
+    for name in inspect.signature(WolfSheep.__init__).parameters
+    if name != "self" and name not in CONSTRUCTION_PARAMETERS
+}
+CHECKPOINT_PARAMETERS["migration"] = "migration_enabled"
+
+# State save_checkpoint stores for each agent type, besides unique_id and
+# pos: the arguments its constructor takes after pos, then the attributes
+# that change after it is built
+CHECKPOINT_STATE = {
+    Mouse: (("moore", "energy"), ("countup",)),
+    Sheep: (("moore", "energy"), ("countup",)),
+    Cat: (("moore", "energy"), ("countup",)),
+    Wolf: (("moore", "energy"), ()),
+    SoilPatch: (
+        ("level",),
+        ("countup", "countup_tree", "countup_bush", "countup_grass", "updated", "plant_type"),
+    ),
+    Grass: (("countdown",), ("fully_grown", "countup", "updated")),
+    Bush: ((), ("countup", "updated")),
+    Tree: ((), ()),
+}
+CHECKPOINT_TYPES = {agent_type.__name__: agent_type for agent_type in CHECKPOINT_STATE}
+PLANT_LAYER_ARRAYS = (
+    "level",
+    "stage",
+    "fully_grown",
+    "countdown",
+    "countup",
+    "soil_countup",
+    "countup_grass",
+    "countup_bush",
+    "countup_tree",
+)
+SPECIES_ARRAYS = ("x", "y", "energy", "countup")
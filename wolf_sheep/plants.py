@@ -0,0 +1,198 @@
+"""
+Array-backed soil and plant layer
+=================================
+
+Vectorized alternative to the per-cell SoilPatch, Grass, Bush and Tree agents.
+Every cell holds one soil patch and at most one plant, so the whole landscape
+is stored as NumPy arrays indexed ``[x, y]`` and advanced in a single pass.
+"""
+
+import numpy as np
+
+from .agents import (
+    Grass,
+    Bush,
+    Tree,
+    GRASS_SOIL_TIME,
+    BUSH_SOIL_TIME,
+    TREE_SOIL_TIME,
+    GRASS_SOIL_PROB,
+    BUSH_SOIL_PROB,
+    TREE_SOIL_PROB,
+    SPROUT_PROB,
+    MAX_SOIL_LEVEL,
+)
+
+
+# Plant stages, in order of succession
+NONE = 0
+GRASS = 1
+BUSH = 2
+TREE = 3
+
+STAGE_TYPES = (None, Grass, Bush, Tree)
+TYPE_STAGES = {Grass: GRASS, Bush: BUSH, Tree: TREE}
+
+
+class PlantLayer:
+    """
+    Soil levels and plant succession for the whole grid, kept in arrays.
+
+    Applies the SoilPatch, Grass and Bush step rules to every cell at once.
+    All transitions within one step are decided from the state at the start
+    of the step.
+    """
+
+    def __init__(self, model, rng=None, levels=None, stages=None):
+        """
+        Create a new plant layer and populate it the same way WolfSheep does
+        for the agent engine: a random soil level in 0..3 per cell and a
+        growing grass patch on every fertile cell, unless given.
+
+        Args:
+            model: The WolfSheep model owning the layer
+            rng: NumPy generator (or seed for one) driving succession
+            levels: Initial int8 soil levels, used (and changed) in place,
+                    e.g. a copy-on-write memory map (see landscape.py)
+            stages: Initial int8 plant stages, used in place like levels
+        """
+        self.model = model
+        self.width = model.width
+        self.height = model.height
+        self.rng = np.random.default_rng(rng)
+
+        shape = (self.width, self.height)
+        if levels is None:
+            levels = self.rng.integers(0, 4, size=shape, dtype=np.int8)
+        self.level = levels
+        if stages is None:
+            stages = np.where(self.level > 0, GRASS, NONE).astype(np.int8)
+        self.stage = stages
+        self.fully_grown = np.zeros(shape, dtype=bool)
+        self.countdown = np.where(
+            self.stage == GRASS,
+            self.rng.integers(0, model.grass_regrowth_time, size=shape),
+            0,
+        ).astype(np.int32)
+        self.countup = np.zeros(shape, dtype=np.int32)
+
+        # SoilPatch counters
+        self.soil_countup = np.zeros(shape, dtype=np.int32)
+        self.countup_grass = np.zeros(shape, dtype=np.int32)
+        self.countup_bush = np.zeros(shape, dtype=np.int32)
+        self.countup_tree = np.zeros(shape, dtype=np.int32)
+
+    def step(self):
+        """
+        Advance soil and plants by one step.
+        """
+        model = self.model
+        stage = self.stage
+        level = self.level
+        empty = stage == NONE
+        grass = stage == GRASS
+        bush = stage == BUSH
+        tree = stage == TREE
+        draws = self.rng.random(stage.shape)
+
+        # Grass.step
+        growing = grass & ~self.fully_grown
+        ready = growing & (self.countdown <= 0)
+        grown = grass & self.fully_grown
+        self.countdown[growing & ~ready] -= 1
+        self.countdown[ready] = model.grass_regrowth_time
+        self.fully_grown[ready] = True
+        self.countup[grown] += 1
+        to_bush = (
+            grown & (self.countup > model.grass_evolution_time) & (level > 1)
+        )
+
+        # Bush.step
+        self.countup[bush] += 1
+        to_tree = bush & (self.countup > model.bush_evolution_time) & (level > 2)
+
+        # SoilPatch.step
+        self.soil_countup[empty] += 1
+        sprout = (
+            empty
+            & (self.soil_countup > model.soil_evolution_time)
+            & (level >= 1)
+            & (draws < SPROUT_PROB)
+        )
+
+        self.countup_tree[tree] += 1
+        fell = tree & (self.countup_tree > TREE_SOIL_TIME) & (draws < TREE_SOIL_PROB)
+
+        self.countup_bush[bush] += 1
+        bush_enrich = (
+            bush
+            & (self.countup_bush > BUSH_SOIL_TIME)
+            & (level < MAX_SOIL_LEVEL)
+            & (draws < BUSH_SOIL_PROB)
+        )
+
+        self.countup_grass[grass] += 1
+        grass_enrich = (
+            grass
+            & (self.countup_grass > GRASS_SOIL_TIME)
+            & (level < MAX_SOIL_LEVEL)
+            & (draws < GRASS_SOIL_PROB)
+        )
+
+        # Apply transitions
+        stage[to_bush] = BUSH
+        self.fully_grown[to_bush] = False
+        self.countup[to_bush] = 0
+
+        stage[to_tree] = TREE
+        self.countup[to_tree] = 0
+
+        stage[sprout] = GRASS
+        self.countdown[sprout] = model.grass_regrowth_time
+        self.countup[sprout] = 0
+        self.soil_countup[sprout] = 0
+
+        level[fell] -= 1
+        self.countup_tree[fell] = 0
+        self.clear(fell)
+
+        level[bush_enrich] += 1
+        self.countup_bush[bush_enrich] = 0
+        level[grass_enrich] += 1
+        self.countup_grass[grass_enrich] = 0
+
+    def plant_at(self, pos):
+        """
+        Returns the plant type (Grass, Bush or Tree) growing at pos, or None.
+        """
+        return STAGE_TYPES[self.stage[pos]]
+
+    def level_at(self, pos):
+        """
+        Returns the soil level at pos.
+        """
+        return int(self.level[pos])
+
+    def remove_plant(self, pos):
+        """
+        Remove the plant growing at pos, e.g. when it is eaten.
+        """
+        self.stage[pos] = NONE
+        self.fully_grown[pos] = False
+        self.countdown[pos] = 0
+        self.countup[pos] = 0
+
+    def clear(self, mask):
+        """
+        Remove the plants from every cell selected by a boolean mask.
+        """
+        self.stage[mask] = NONE
+        self.fully_grown[mask] = False
+        self.countdown[mask] = 0
+        self.countup[mask] = 0
+
+    def count(self, plant_type):
+        """
+        Returns the number of cells holding a plant of the given type.
+        """
+        return int(np.count_nonzero(self.stage == TYPE_STAGES[plant_type]))
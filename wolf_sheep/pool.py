@@ -0,0 +1,56 @@
+"""
+Object pool for recycling dead agents
+"""
+
+
+class AgentPool:
+    """
+    Free lists of dead agents, one per agent type, that are reinitialized for
+    new births instead of allocating new objects.
+
+    Released agents are quarantined until flush is called at the end of the
+    model step: an agent that died earlier in a step may still be referenced
+    by the scheduler's iteration over that step, so it must not come back to
+    life as a newborn before the step is over.
+    """
+
+    def __init__(self, max_size=None):
+        """
+        Args:
+            max_size: Maximum number of free agents kept per type, or None
+                      for no limit
+        """
+        self.max_size = max_size
+        self._free = {}
+        self._released = []
+
+    def acquire(self, agent_type, *args):
+        """
+        Returns an agent of agent_type initialized with args, reusing a free
+        one if possible.
+        """
+        free = self._free.get(agent_type)
+        if free:
+            agent = free.pop()
+            agent.__init__(*args)
+            return agent
+        return agent_type(*args)
+
+    def release(self, agent):
+        """
+        Hand a dead agent back to the pool.
+        """
+        self._released.append(agent)
+
+    def flush(self):
+        """
+        Make the agents released during the last step available for reuse.
+        """
+        for agent in self._released:
+            free = self._free.setdefault(type(agent), [])
+            if self.max_size is None or len(free) < self.max_size:
+                free.append(agent)
+        self._released.clear()
+
+    def __len__(self):
+        return sum(len(free) for free in self._free.values())
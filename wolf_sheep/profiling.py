@@ -0,0 +1,89 @@
+"""
+Step profiler
+=============
+
+Opt-in instrumentation of a model step. The scheduler reports wall time and
+calls per agent type, the model times its phases, and the grid counts its
+operations. Every step becomes one row of a table:
+
+    Step  time/Mouse  calls/Mouse  ...  time/schedule.step  ...  grid/moves  ...
+
+Times are in seconds. Grid places and removes include those done as part
+of a move.
+"""
+
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+GRID_OPERATIONS = ("moves", "places", "removes")
+
+
+class StepProfiler:
+    """
+    Collects one row of timings and counts per model step.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.current = None
+        # Shared with the grid, which increments it in place
+        self.grid_counts = dict.fromkeys(GRID_OPERATIONS, 0)
+
+    def begin_step(self, step):
+        """
+        Start the row of a new step.
+        """
+        self.current = {"Step": step}
+        for operation in GRID_OPERATIONS:
+            self.grid_counts[operation] = 0
+
+    def end_step(self):
+        """
+        Close the row of the current step.
+        """
+        for operation, count in self.grid_counts.items():
+            self.current[f"grid/{operation}"] = count
+        self.rows.append(self.current)
+        self.current = None
+
+    def add(self, name, seconds, calls=None):
+        """
+        Add seconds (and calls, if given) to the entry called name in the
+        current step.
+        """
+        row = self.current
+        row[f"time/{name}"] = row.get(f"time/{name}", 0.0) + seconds
+        if calls is not None:
+            row[f"calls/{name}"] = row.get(f"calls/{name}", 0) + calls
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the body of the with statement as the model phase called name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def last(self, column):
+        """
+        Returns the value of column in the last complete step, 0 if there is
+        none. Times are always floats, so that a collector typing its columns
+        by their first value stores them as such.
+        """
+        empty = 0.0 if column.startswith("time/") else 0
+        if not self.rows:
+            return empty
+        return self.rows[-1].get(column, empty)
+
+    def table(self):
+        """
+        Returns the profile of every step as a DataFrame indexed by step.
+        """
+        if not self.rows:
+            return pd.DataFrame()
+        return pd.DataFrame(self.rows).set_index("Step").fillna(0)
@@ -35,7 +35,12 @@ class RandomWalker(mesa.Agent):
         Step one cell in any allowable direction.
         """
         # Pick the next cell from the adjacent cells.
-        next_moves = self.model.grid.get_neighborhood(self.pos, self.moore, True)
-        next_move = self.random.choice(next_moves)
+        grid = self.model.grid
+        if hasattr(grid, "random_neighbor"):
+            next_move = grid.random_neighbor(self.pos, self.moore, self.model.streams.movement)
+        else:
+            # A plain mesa grid, as in test_random_walk.py
+            next_moves = grid.get_neighborhood(self.pos, self.moore, True)
+            next_move = self.model.streams.movement.choice(next_moves)
         # Now move:
         self.model.grid.move_agent(self, next_move)
@@ -0,0 +1,133 @@
+"""
+Per-cell rasters of a model
+===========================
+
+Array summaries of the grid: soil level, plant stage and the number of
+animals of each species per cell, computed with array operations on the
+array engines and read from the grid's slots and indexes on the agent
+engine, never by visiting every agent. They
+can be downsampled to a display resolution, colored and encoded as PNG, so
+drawing a large world costs about as much as drawing a small one.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+from .plants import NONE, TYPE_STAGES
+
+
+def animal_counts(model, agent_type, factor=1):
+    """
+    Returns a (width, height) array with the number of animals of agent_type
+    on every cell, or on every factor x factor block of cells.
+    """
+    width = -(-model.width // factor)
+    height = -(-model.height // factor)
+    if model.animals is not None:
+        species = model.animals.species[agent_type]
+        xs, ys = species.x, species.y
+        weights = None
+    else:
+        cells = model.grid.cells_of_type(agent_type)
+        positions = np.array(list(cells), dtype=np.int64).reshape(-1, 2)
+        xs, ys = positions[:, 0], positions[:, 1]
+        weights = np.fromiter(cells.values(), dtype=np.int64, count=len(cells))
+    flat = (xs // factor) * height + ys // factor
+    counts = np.bincount(flat, weights, minlength=width * height)
+    return counts.astype(np.int64).reshape(width, height)
+
+
+def soil_levels(model):
+    """
+    Returns a (width, height) array with the soil level of every cell, -1
+    where there is no soil.
+    """
+    if model.plants is not None:
+        return model.plants.level.astype(np.int8)
+    if model.grid is None:
+        # The array animal engine without soil
+        return np.full((model.width, model.height), -1, dtype=np.int8)
+    return model.grid.soil_levels()
+
+
+def plant_stages(model):
+    """
+    Returns a (width, height) array with the plant stage of every cell (see
+    plants.NONE, GRASS, BUSH and TREE).
+    """
+    if model.plants is not None:
+        return model.plants.stage.copy()
+    grid = model.grid
+    if grid is None:
+        return np.full((model.width, model.height), NONE, dtype=np.int8)
+    stages = np.array([NONE, *(TYPE_STAGES[t] for t in grid.plant_types)], dtype=np.int8)
+    return stages[grid.plant_codes()]
+
+
+def downsample(raster, factor, reduce="mean"):
+    """
+    Shrink a (width, height) raster by an integer factor, combining each
+    factor x factor block with "mean", "sum" or "max". Edges that do not
+    fill a block are padded with zeros.
+    """
+    if factor <= 1:
+        return raster
+    width, height = raster.shape
+    padded_width = -(-width // factor) * factor
+    padded_height = -(-height // factor) * factor
+    if (padded_width, padded_height) != (width, height):
+        padded = np.zeros((padded_width, padded_height), dtype=raster.dtype)
+        padded[:width, :height] = raster
+        raster = padded
+    # Combine the rows of each block first, which works on whole contiguous
+    # rows, then the columns of the factor times smaller result
+    rows = raster.reshape(padded_width // factor, factor, padded_height)
+    blocks_shape = (padded_width // factor, padded_height // factor, factor)
+    if reduce == "max":
+        return rows.max(axis=1).reshape(blocks_shape).max(axis=2)
+    dtype = np.float64 if raster.dtype.kind == "f" else np.int64
+    sums = rows.sum(axis=1, dtype=dtype).reshape(blocks_shape).sum(axis=2)
+    if reduce == "sum":
+        return sums
+    return sums / (factor * factor)
+
+
+def colorize(values, color, vmax):
+    """
+    Returns an RGB image (float, 0-255) shading values from black to color,
+    saturating at vmax.
+    """
+    intensity = np.clip(values / max(vmax, 1e-12), 0.0, 1.0)
+    return intensity[..., None] * np.asarray(color, dtype=np.float64)
+
+
+def to_image(rgb):
+    """
+    Turn a (width, height, 3) raster into a (height, width, 3) uint8 image
+    with y pointing up, as the grid is drawn.
+    """
+    return np.clip(rgb, 0, 255).astype(np.uint8).transpose(1, 0, 2)[::-1]
+
+
+def encode_png(image, level=1):
+    """
+    Returns the PNG file bytes of a (height, width, 3) uint8 image.
+    """
+    height, width, _ = image.shape
+    # Every row starts with filter type 0 (none)
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(rows.tobytes(), level))
+        + chunk(b"IEND", b"")
+    )
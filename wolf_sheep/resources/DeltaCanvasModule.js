@@ -0,0 +1,99 @@
+/**
+Delta canvas for the Wolf-Sheep server
+======================================
+
+Draws the frames sent by DeltaCanvasGrid in server.py. A frame is
+
+  {"full": true, "width": 20, "height": 20,
+   "portrayals": {"soil1": {...}, "mouse": {...}, ...},
+   "cells": [[x, y, ["soil1", "grass", "mouse"]], ...]}
+
+for the first frame of a model, and {"full": false, "cells": [...]} with
+only the cells that changed afterwards. Cells are redrawn from the cached
+portrayals, bottom key first; a cell with no keys is cleared. Frames the
+server skipped arrive as null.
+*/
+
+const DeltaCanvasModule = function (canvas_width, canvas_height) {
+  const parent = document.createElement("div");
+  parent.style.height = `${canvas_height}px`;
+  parent.className = "world-grid-parent";
+  const canvas = document.createElement("canvas");
+  canvas.width = canvas_width;
+  canvas.height = canvas_height;
+  canvas.className = "world-grid";
+  parent.appendChild(canvas);
+  document.getElementById("elements").appendChild(parent);
+  const context = canvas.getContext("2d");
+
+  let gridWidth = 1;
+  let gridHeight = 1;
+  let cellWidth = canvas_width;
+  let cellHeight = canvas_height;
+  let portrayals = {};
+  let images = {};
+  // x * gridHeight + y -> [x, y, keys], for every non-empty cell
+  let cells = new Map();
+
+  const drawCell = (x, y, keys) => {
+    const cx = x * cellWidth;
+    const cy = (gridHeight - y - 1) * cellHeight;
+    context.clearRect(cx, cy, cellWidth, cellHeight);
+    for (const key of keys) {
+      const p = portrayals[key];
+      if (p.Shape === "rect") {
+        context.fillStyle = p.Color;
+        context.fillRect(cx, cy, cellWidth * p.w, cellHeight * p.h);
+      } else if (images[key].complete) {
+        const scale = p.scale === undefined ? 1 : p.scale;
+        const w = cellWidth * scale;
+        const h = cellHeight * scale;
+        context.drawImage(
+          images[key],
+          cx + (cellWidth - w) / 2,
+          cy + (cellHeight - h) / 2,
+          w,
+          h
+        );
+      }
+    }
+  };
+
+  const redrawAll = () => {
+    context.clearRect(0, 0, canvas_width, canvas_height);
+    for (const [x, y, keys] of cells.values()) drawCell(x, y, keys);
+  };
+
+  this.render = (data) => {
+    if (!data) return;
+    if (data.full) {
+      gridWidth = data.width;
+      gridHeight = data.height;
+      cellWidth = canvas_width / gridWidth;
+      cellHeight = canvas_height / gridHeight;
+      cells = new Map();
+      context.clearRect(0, 0, canvas_width, canvas_height);
+      portrayals = data.portrayals;
+      images = {};
+      for (const key in portrayals) {
+        if (portrayals[key].Shape === "rect") continue;
+        const img = new Image();
+        // Images load asynchronously; draw them once they are there
+        img.onload = redrawAll;
+        img.src = "local/custom/".concat(portrayals[key].Shape);
+        images[key] = img;
+      }
+    }
+    for (const [x, y, keys] of data.cells) {
+      const index = x * gridHeight + y;
+      if (keys.length) cells.set(index, [x, y, keys]);
+      else cells.delete(index);
+      drawCell(x, y, keys);
+    }
+  };
+
+  this.reset = () => {
+    cells = new Map();
+    context.clearRect(0, 0, canvas_width, canvas_height);
+  };
+};
@@ -0,0 +1,36 @@
+/**
+Raster heatmap for the Wolf-Sheep server
+========================================
+
+Draws the PNG frames sent by RasterHeatmap in server.py, stretched to the
+canvas with no smoothing, so every pixel of the image (a cell, or a block
+of cells) stays a sharp square. Frames the server skipped arrive as null.
+*/
+
+const RasterModule = function (canvas_width, canvas_height, title) {
+  const parent = document.createElement("div");
+  const caption = document.createElement("p");
+  caption.textContent = title;
+  const canvas = document.createElement("canvas");
+  canvas.width = canvas_width;
+  canvas.height = canvas_height;
+  parent.appendChild(caption);
+  parent.appendChild(canvas);
+  document.getElementById("elements").appendChild(parent);
+  const context = canvas.getContext("2d");
+  context.imageSmoothingEnabled = false;
+
+  const img = new Image();
+  img.onload = () => {
+    context.clearRect(0, 0, canvas_width, canvas_height);
+    context.drawImage(img, 0, 0, canvas_width, canvas_height);
+  };
+
+  this.render = (data) => {
+    if (data) img.src = data.image;
+  };
+
+  this.reset = () => {
+    context.clearRect(0, 0, canvas_width, canvas_height);
+  };
+};
@@ -0,0 +1,42 @@
+/**
+Run rates for the Wolf-Sheep background server
+==============================================
+
+Shows the model step and the measured step and frame rates sent by
+RunRates in server.py:
+
+  {"step": 1200, "steps_per_s": 85.3, "frames_per_s": 4.9}
+
+and tells the server when the run is started and stopped, so it steps the
+model in the background while the run is on. The frame rate slider sets how
+often frames are asked for; the model steps at full speed regardless.
+*/
+
+const RunRatesModule = function () {
+  const tag = document.createElement("p");
+  document.getElementById("elements").appendChild(tag);
+
+  const start = controller.start.bind(controller);
+  const stop = controller.stop.bind(controller);
+  controller.start = () => {
+    send({ type: "run", running: true });
+    start();
+  };
+  controller.stop = () => {
+    send({ type: "run", running: false });
+    stop();
+  };
+
+  this.render = (data) => {
+    if (!data) return;
+    // The tick counts frames; show the model's own step instead
+    stepDisplay.innerText = data.step;
+    tag.textContent =
+      `${data.steps_per_s.toFixed(1)} steps/s, ` +
+      `${data.frames_per_s.toFixed(1)} frames/s`;
+  };
+
+  this.reset = () => {
+    tag.textContent = "";
+  };
+};
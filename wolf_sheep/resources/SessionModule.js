@@ -0,0 +1,62 @@
+/**
+Shared session for the Wolf-Sheep broadcast server
+==================================================
+
+Shows the state of the session sent by Session in server.py:
+
+  {"generation": 3, "step": 120, "viewers": 4, "controller": 2, "you": 1}
+
+("you", this viewer's id, only comes with the frame sent when it joins) and
+tells the server when this viewer starts and stops the run. Every viewer
+gets the same frames, so the step shown is the model's rather than the
+count of frames this page asked for, and when another viewer resets the
+model the other elements are cleared before they draw its first frame.
+*/
+
+const SessionModule = function () {
+  const tag = document.createElement("p");
+  document.getElementById("elements").appendChild(tag);
+  let you = null;
+  let generation = null;
+
+  const start = controller.start.bind(controller);
+  const stop = controller.stop.bind(controller);
+  controller.start = () => {
+    send({ type: "run", running: true });
+    start();
+  };
+  controller.stop = () => {
+    send({ type: "run", running: false });
+    stop();
+  };
+
+  this.render = (data) => {
+    if (data.you !== undefined) you = data.you;
+    if (generation !== null && data.generation !== generation) {
+      // Another viewer reset the model
+      vizElements.forEach((element) => {
+        if (element !== this) element.reset();
+      });
+      if (controller.finished) {
+        controller.finished = false;
+        startModelButton.firstElementChild.innerText = "Start";
+      }
+    }
+    generation = data.generation;
+    controller.tick = data.step;
+    stepDisplay.innerText = data.step;
+
+    let control = "nobody is running the model";
+    if (data.controller === you) {
+      control = "you are running the model";
+    } else if (data.controller !== null) {
+      control = `viewer ${data.controller} is running the model`;
+    }
+    tag.textContent = `${data.viewers} viewer${data.viewers === 1 ? "" : "s"}, ${control}`;
+  };
+
+  this.reset = () => {
+    // This viewer's own reset: its elements are already cleared
+    generation = null;
+  };
+};
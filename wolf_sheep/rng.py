@@ -0,0 +1,58 @@
+"""
+Seeded random number streams
+"""
+
+import hashlib
+import random
+
+import numpy as np
+
+
+def derive_seed(seed, name):
+    """
+    Returns a 64-bit integer seed for the stream called name, derived from the
+    model seed. The derivation does not depend on the process or on hash
+    randomization, so it is the same in every worker.
+    """
+    digest = hashlib.sha256(f"{seed!r}:{name}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+class RandomStreams:
+    """
+    Independent random number streams, one per model subsystem, all derived
+    from a single model seed.
+
+    Each stream is a random.Random, so a subsystem consumes draws from its own
+    sequence regardless of how many draws the others make.
+    """
+
+    names = ("movement", "feeding", "reproduction", "fire", "migration", "succession")
+
+    def __init__(self, seed):
+        """
+        Args:
+            seed: The model seed all streams are derived from
+        """
+        self.reset(seed)
+
+    def reset(self, seed):
+        """
+        Reseed every stream from a new model seed.
+        """
+        self.seed = seed
+        self._numpy = {}
+        for name in self.names:
+            setattr(self, name, random.Random(derive_seed(seed, name)))
+
+    def numpy(self, name):
+        """
+        Returns the NumPy generator for the stream called name, for subsystems
+        that draw whole arrays at once.
+        """
+        try:
+            return self._numpy[name]
+        except KeyError:
+            rng = np.random.default_rng(derive_seed(self.seed, name))
+            self._numpy[name] = rng
+            return rng
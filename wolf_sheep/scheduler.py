@@ -1,4 +1,8 @@
-from typing import Callable, Optional, Type
+import heapq
+import time
+import weakref
+from operator import itemgetter
+from typing import Callable, Optional, Type, Union
 
 import mesa
 
@@ -8,22 +12,357 @@ class RandomActivationByTypeFiltered(mesa.time.RandomActivationByType):
     A scheduler that overrides the get_type_count method to allow for filtering
     of agents by a function before counting.
 
+    Counts per type are maintained as agents are added and removed. Filters
+    that are queried every step can be registered under a name, in which case
+    the matching agents are tracked incrementally and agents have to call
+    update_filters whenever the state the filter looks at changes.
+
+    Agent types registered with register_timed_type are not stepped every
+    tick. Their agents instead ask to be woken at a given tick with wake_at,
+    and only the agents due are activated, by calling their wake method, so
+    the cost of a tick follows the number of transitions rather than the
+    number of agents. A timed agent's reschedule method is called when it is
+    added, to schedule its first wake-up.
+
+    With defer_changes set, agents added or removed while the schedule steps
+    are buffered and applied in one pass when the step ends, so the per-type
+    agent sets are not changed while they are iterated. An agent removed
+    during a step does not act for the rest of it, even if its type has not
+    been stepped yet (an animal eaten before its turn stays dead). An agent
+    added during a step first acts on the next step, and one that is removed
+    again in the same step is never added. Type counts and filters follow the
+    buffered changes only once they are applied.
+
+    If a StepProfiler is assigned to the profiler attribute, the wall time
+    and number of agents stepped are recorded per agent type.
+
     Example:
     >>> scheduler = RandomActivationByTypeFiltered(model)
     >>> scheduler.get_type_count(AgentA, lambda agent: agent.some_attribute > 10)
+    >>> scheduler.register_filter("big", AgentA, lambda agent: agent.some_attribute > 10)
+    >>> scheduler.get_type_count(AgentA, "big")
     """
 
+    def __init__(self, model, agents=None):
+        self._type_counts = {}
+        self._filters = {}
+        self._filters_by_type = {}
+        self._filtered = {}
+        # agent type -> heap of (tick, sequence number, agent)
+        self._timers = {}
+        # agent -> sequence number of its pending wake-up; heap entries with
+        # another number are stale and skipped, even if an agent rescheduled
+        # or recycled by the pool asks for the same tick again
+        self._pending = {}
+        self._timer_sequence = 0
+        self.defer_changes = False
+        self._buffering = False
+        # Agents added and removed during the current step, in order
+        self._births = {}
+        self._deaths = {}
+        self.profiler = None
+        super().__init__(model, agents)
+        for agent in agents or ():
+            self._count(agent, 1)
+
+    def add(self, agent: mesa.Agent) -> None:
+        """
+        Add an Agent object to the schedule and to the matching counters.
+        """
+        if self._buffering:
+            self._births[agent] = None
+            return
+        super().add(agent)
+        self._count(agent, 1)
+        for name in self._filters_by_type.get(type(agent), ()):
+            if self._filters[name][1](agent):
+                self._filtered[name].add(agent)
+        if type(agent) in self._timers:
+            agent.reschedule()
+
+    def remove(self, agent: mesa.Agent) -> None:
+        """
+        Remove an Agent object from the schedule and from all counters.
+        """
+        self._pending.pop(agent, None)
+        if self._buffering:
+            if agent in self._births:
+                del self._births[agent]
+                self._unfilter(agent)
+            else:
+                self._deaths[agent] = None
+            return
+        super().remove(agent)
+        self._count(agent, -1)
+        self._unfilter(agent)
+
+    def _unfilter(self, agent):
+        for name in self._filters_by_type.get(type(agent), ()):
+            self._filtered[name].discard(agent)
+
+    def step(self, shuffle_types: bool = True, shuffle_agents: bool = True) -> None:
+        """
+        Executes the step of each agent type, one at a time, in random order,
+        waking only the due agents of timed types and timing each type if
+        profiling. Changes are buffered until the end of the step if
+        defer_changes is set.
+        """
+        profiler = self.profiler
+        if profiler is None and not self._timers and not self.defer_changes:
+            super().step(shuffle_types, shuffle_agents)
+            return
+
+        self._buffering = self.defer_changes
+
+        type_keys = list(self._agents_by_type.keys())
+        if shuffle_types:
+            self.model.random.shuffle(type_keys)
+        for agent_class in type_keys:
+            if profiler is not None:
+                start = time.perf_counter()
+            if agent_class in self._timers:
+                calls = self._wake_due(agent_class, shuffle_agents)
+            else:
+                calls = len(self._agents_by_type[agent_class])
+                self.step_type(agent_class, shuffle_agents=shuffle_agents)
+            if profiler is not None:
+                profiler.add(agent_class.__name__, time.perf_counter() - start, calls)
+        if self._buffering:
+            self._buffering = False
+            self._apply_changes()
+        self.steps += 1
+        self.time += 1
+
+    def step_type(self, agenttype: Type[mesa.Agent], shuffle_agents: bool = True) -> None:
+        """
+        Shuffle order and run all agents of a given type, skipping those
+        removed earlier in a buffered step.
+        """
+        if not self._buffering:
+            super().step_type(agenttype, shuffle_agents)
+            return
+        agents = self._agents_by_type[agenttype]
+        if shuffle_agents:
+            agents.shuffle(inplace=True)
+        deaths = self._deaths
+        # Nothing joins or leaves the set while buffering
+        for agent in agents:
+            if agent not in deaths:
+                agent.step()
+
+    def _apply_changes(self):
+        """
+        Apply the removals, then the additions, buffered during the step.
+        """
+        deaths = list(self._deaths)
+        births = list(self._births)
+        self._deaths.clear()
+        self._births.clear()
+        self.remove_agents(deaths)
+        self.add_agents(births)
+
+    def register_timed_type(self, type_class: Type[mesa.Agent]) -> None:
+        """
+        Activate the agents of type_class only at the ticks they ask for with
+        wake_at, instead of every step.
+        """
+        self._timers.setdefault(type_class, [])
+        for agent in list(self._agents_by_type.get(type_class, ())):
+            agent.reschedule()
+
+    def wake_at(self, agent: mesa.Agent, tick: int) -> None:
+        """
+        Wake a timed agent at tick, replacing any earlier request. A tick that
+        has already been processed for the agent's type wakes it on the next
+        step.
+        """
+        # The sequence number keeps agents, which do not compare, out of ties
+        self._timer_sequence += 1
+        self._pending[agent] = self._timer_sequence
+        heapq.heappush(
+            self._timers[type(agent)], (tick, self._timer_sequence, agent)
+        )
+
+    def cancel_wake(self, agent: mesa.Agent) -> None:
+        """
+        Drop the pending wake-up of a timed agent.
+        """
+        self._pending.pop(agent, None)
+
+    def _wake_due(self, agent_class, shuffle_agents):
+        heap = self._timers[agent_class]
+        now = self.steps
+        due = []
+        while heap and heap[0][0] <= now:
+            _, sequence, agent = heapq.heappop(heap)
+            if self._pending.get(agent) == sequence:
+                due.append((sequence, agent))
+        if shuffle_agents:
+            self.model.random.shuffle(due)
+        for sequence, agent in due:
+            # An agent woken earlier may have rescheduled or removed this one
+            if self._pending.get(agent) == sequence:
+                del self._pending[agent]
+                agent.wake()
+        return len(due)
+
+    def add_agents(self, agents, reschedule: bool = True) -> None:
+        """
+        Add several Agent objects, none of them in the schedule yet, at once.
+
+        The agents are added type by type, in bulk, and then the timed ones
+        are rescheduled in the order given, unless reschedule is False (their
+        wake-ups are then restored with restore_wakes).
+        """
+        agents = list(agents)
+        if self._buffering:
+            self._births.update(dict.fromkeys(agents))
+            return
+        by_type = {}
+        for agent in agents:
+            by_type.setdefault(type(agent), []).append(agent)
+        for agent_type, group in by_type.items():
+            extend_agent_set(self._agents, group)
+            if agent_type not in self._agents_by_type:
+                self._agents_by_type[agent_type] = mesa.agent.AgentSet([], self.model)
+            extend_agent_set(self._agents_by_type[agent_type], group)
+            self._type_counts[agent_type] = self._type_counts.get(agent_type, 0) + len(group)
+            for name in self._filters_by_type.get(agent_type, ()):
+                filter_func = self._filters[name][1]
+                self._filtered[name].update(agent for agent in group if filter_func(agent))
+        if reschedule and self._timers:
+            timers = self._timers
+            for agent in agents:
+                if type(agent) in timers:
+                    agent.reschedule()
+
+    def agent_types(self) -> list:
+        """
+        Returns the agent types in the order step takes them before shuffling,
+        including types whose agents have all been removed.
+        """
+        return list(self._agents_by_type)
+
+    def add_types(self, types) -> None:
+        """
+        Give each of types that has none an empty agent set, in the order
+        given, as adding the first agent of the type would.
+        """
+        for type_class in types:
+            if type_class not in self._agents_by_type:
+                self._agents_by_type[type_class] = mesa.agent.AgentSet([], self.model)
+
+    def agents_of_type(self, type_class: Type[mesa.Agent]) -> list:
+        """
+        Returns the agents of type_class in the order the schedule keeps them.
+        """
+        return list(self._agents_by_type.get(type_class, ()))
+
+    def pending_wakes(self, type_class: Type[mesa.Agent]) -> list:
+        """
+        Returns the pending wake-ups of the timed agents of type_class as
+        (tick, sequence number, agent) tuples, in the order they are due.
+        """
+        pending = self._pending
+        return sorted(
+            (
+                entry
+                for entry in self._timers.get(type_class, ())
+                if pending.get(entry[2]) == entry[1]
+            ),
+            key=itemgetter(0, 1),
+        )
+
+    def restore_wakes(self, entries) -> None:
+        """
+        Schedule wake-ups listed by pending_wakes, keeping their sequence
+        numbers so that agents due at the same tick are woken in the same
+        order.
+        """
+        timers = self._timers
+        for tick, sequence, agent in entries:
+            self._pending[agent] = sequence
+            self._timer_sequence = max(self._timer_sequence, sequence)
+            timers[type(agent)].append((tick, sequence, agent))
+        for heap in timers.values():
+            heapq.heapify(heap)
+
+    def remove_agents(self, agents) -> None:
+        """
+        Remove several Agent objects from the schedule at once.
+        """
+        for agent in agents:
+            self.remove(agent)
+
+    def _count(self, agent, delta):
+        agent_type = type(agent)
+        self._type_counts[agent_type] = self._type_counts.get(agent_type, 0) + delta
+
+    def register_filter(
+        self,
+        name: str,
+        type_class: Type[mesa.Agent],
+        filter_func: Callable[[mesa.Agent], bool],
+    ) -> None:
+        """
+        Register a named filter whose count is kept up to date incrementally.
+        """
+        self._filters[name] = (type_class, filter_func)
+        self._filters_by_type.setdefault(type_class, []).append(name)
+        self._filtered[name] = {
+            agent
+            for agent in self._agents_by_type.get(type_class, ())
+            if filter_func(agent)
+        }
+
+    def filtered_agents(self, name: str) -> set:
+        """
+        Returns the set of agents that pass the registered filter name. The
+        set is live; do not change it.
+        """
+        return self._filtered[name]
+
+    def update_filters(self, agent: mesa.Agent) -> None:
+        """
+        Re-evaluate the named filters for an agent whose state has changed.
+        """
+        for name in self._filters_by_type.get(type(agent), ()):
+            if self._filters[name][1](agent):
+                self._filtered[name].add(agent)
+            else:
+                self._filtered[name].discard(agent)
+
     def get_type_count(
         self,
         type_class: Type[mesa.Agent],
-        filter_func: Optional[Callable[[mesa.Agent], bool]] = None,
+        filter_func: Optional[Union[str, Callable[[mesa.Agent], bool]]] = None,
     ) -> int:
         """
         Returns the current number of agents of certain type in the queue
         that satisfy the filter function.
+
+        Unfiltered counts and counts of registered filters (passed by name)
+        are O(1); any other filter function is evaluated on every agent of
+        the type.
         """
+        if filter_func is None:
+            return self._type_counts.get(type_class, 0)
+        if isinstance(filter_func, str):
+            return len(self._filtered[filter_func])
         count = 0
-        for agent in self.agents_by_type[type_class].values():
-            if filter_func is None or filter_func(agent):
+        for agent in self._agents_by_type.get(type_class, ()):
+            if filter_func(agent):
                 count += 1
         return count
+
+
+def extend_agent_set(agent_set, agents):
+    """
+    Add agents to a mesa AgentSet in one update of its weak dictionary,
+    rather than one WeakKeyDictionary.__setitem__ call per agent.
+
+    Writes to AgentSet._agents as laid out in mesa 2.4, which
+    requirements.txt pins.
+    """
+    weak = agent_set._agents
+    weak.data.update(dict.fromkeys([weakref.ref(agent, weak._remove) for agent in agents]))
@@ -1,89 +1,772 @@
+import asyncio
+import base64
+import collections
+import math
 import mesa
 import os
+import threading
+import time
 
-from wolf_sheep.agents import SoilPatch, Grass, Bush, Tree, Mouse, Sheep, Cat, Wolf, FirePatch
+import numpy as np
+import tornado.escape
+import tornado.ioloop
+import tornado.websocket
+
+from wolf_sheep.agents import SoilPatch, Grass, Bush, Tree, Mouse, Sheep, Cat, Wolf
 from wolf_sheep.model import WolfSheep
+from wolf_sheep import raster
+from wolf_sheep.plants import GRASS, BUSH, TREE
 
 script_dir = os.path.dirname(os.path.realpath(__file__))
 
+SOIL_COLORS = ("#D2B48C", "#9C814A", "#67552D", "#000000")
+
+
+def _image(name, layer):
+    return {
+        "Shape": os.path.join(script_dir, "resources", name),
+        "scale": 0.9,
+        "Layer": layer,
+    }
+
+
+# Every portrayal the server draws, built once and keyed by (type, state).
+# https://icons8.com/web-app/433/sheep
+# https://icons8.com/web-app/36821/German-Shepherd
+PORTRAYALS = {
+    **{
+        f"soil{level}": {
+            "Color": color,
+            "Shape": "rect",
+            "Filled": "true",
+            "Layer": 0,
+            "w": 1,
+            "h": 1,
+        }
+        for level, color in enumerate(SOIL_COLORS)
+    },
+    "grass": _image("grass.png", 1),
+    "grass_2": _image("grass_2.png", 1),
+    "bush": _image("bush.png", 1),
+    "tree": _image("tree.png", 1),
+    "mouse": _image("mouse.png", 2),
+    "sheep": _image("sheep.png", 2),
+    "cat": _image("cat.png", 2),
+    "wolf": _image("wolf.png", 2),
+    "fire": _image("fire.png", 3),
+}
+
+# Keys of the plant codes of a frame, see frame_layers
+PLANT_KEYS = (None, "grass", "grass_2", "bush", "tree")
+PLANT_CODES = {Grass: 1, Bush: 3, Tree: 4}
+# Bits of the animal codes of a frame
+ANIMAL_BITS = {Mouse: 1, Sheep: 2, Cat: 4, Wolf: 8}
+ANIMAL_KEYS = tuple(
+    (bit, agent_type.__name__.lower()) for agent_type, bit in ANIMAL_BITS.items()
+)
+
+
+def portrayal_key(agent):
+    """
+    Returns the key of the cached portrayal of an agent.
+    """
+    agent_type = type(agent)
+    if agent_type is SoilPatch:
+        return f"soil{min(agent.level, 3)}"
+    if agent_type is Grass:
+        return "grass_2" if agent.fully_grown else "grass"
+    return agent_type.__name__.lower()
+
+
 def wolf_sheep_portrayal(agent):
     if agent is None:
         return
+    # CanvasGrid adds the position to the portrayal, so hand out a copy
+    return dict(PORTRAYALS[portrayal_key(agent)])
+
+
+def frame_layers(model):
+    """
+    Returns the state of every cell as four (width, height) uint8 arrays:
+    soil (0 for none, 1 + level otherwise), plant (an index into
+    PLANT_KEYS), animals (the ANIMAL_BITS of the types present) and fire.
+    Works with the agent and the array engines alike.
+    """
+    shape = (model.width, model.height)
+    soil = np.zeros(shape, dtype=np.uint8)
+    plant = np.zeros(shape, dtype=np.uint8)
+    animals = np.zeros(shape, dtype=np.uint8)
+
+    if model.plants is not None:
+        soil[:] = np.minimum(model.plants.level, 3) + 1
+        plant[:] = model.plants.stage
+        # Stages are NONE, GRASS, BUSH, TREE; fully grown grass gets its own code
+        plant[plant > 1] += 1
+        plant[(plant == 1) & model.plants.fully_grown] = 2
+    if model.animals is not None:
+        for agent_type, species in model.animals.species.items():
+            animals[species.x, species.y] |= ANIMAL_BITS[agent_type]
+
+    grid = model.grid
+    if model.plants is None and grid is not None:
+        # Read the grid's soil and plant slots, not every agent
+        levels = grid.soil_levels()
+        soil[:] = np.where(levels < 0, 0, np.minimum(levels, 3) + 1)
+        codes = np.array([0, *(PLANT_CODES[t] for t in grid.plant_types)], dtype=np.uint8)
+        plant[:] = codes[grid.plant_codes()]
+        grown = model.schedule.filtered_agents("fully_grown")
+        if grown:
+            xs, ys = np.array([agent.pos for agent in grown]).T
+            plant[xs, ys] = 2
+    if model.animals is None and grid is not None:
+        for agent_type, bit in ANIMAL_BITS.items():
+            cells = grid.cells_of_type(agent_type)
+            if cells:
+                xs, ys = np.array(list(cells)).T
+                animals[xs, ys] |= bit
+    return np.stack([soil, plant, animals, model.burned.astype(np.uint8)])
+
+
+def cell_keys(soil, plant, animals, fire):
+    """
+    Returns the portrayal keys of a cell, bottom layer first.
+    """
+    keys = []
+    if soil:
+        keys.append(f"soil{soil - 1}")
+    if plant:
+        keys.append(PLANT_KEYS[plant])
+    for bit, key in ANIMAL_KEYS:
+        if animals & bit:
+            keys.append(key)
+    if fire:
+        keys.append("fire")
+    return keys
+
+
+class DeltaCanvasGrid(mesa.visualization.VisualizationElement):
+    """
+    Grid canvas that sends the full grid only for the first frame of a
+    model, and after that only the cells whose portrayals changed. The grid
+    size is taken from the model.
+
+    Portrayals are cached per (type, state) and sent once; cells refer to
+    them by key. The matching JavaScript is resources/DeltaCanvasModule.js.
+
+    The frame last sent is kept per viewer, the connection a CanvasServer
+    sets as viewer while it renders, so each page gets the cells changed
+    since its own last frame. The layers of a step are computed once for
+    all viewers.
+    """
+
+    local_includes = ["resources/DeltaCanvasModule.js"]
+    local_dir = script_dir
+
+    def __init__(self, canvas_width=500, canvas_height=500, render_every=1):
+        """
+        Args:
+            canvas_width, canvas_height: Size of the canvas, in pixels
+            render_every: Only draw every this many steps
+        """
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.render_every = render_every
+        self.viewer = None
+        # viewer -> (model, layers) of the frame last sent to it
+        self._views = {}
+        # (model, step, layers) of the last step drawn
+        self._layers = (None, None, None)
+        self.js_code = (
+            f"elements.push(new DeltaCanvasModule({canvas_width}, {canvas_height}));"
+        )
+
+    def render(self, model):
+        previous_model, previous = self._views.get(self.viewer, (None, None))
+        full = model is not previous_model
+        if not full and model.schedule.steps % self.render_every != 0:
+            return None
+
+        layers = self._current_layers(model)
+        changed = None if full else (layers != previous).any(axis=0)
+        self._views[self.viewer] = (model, layers)
+        return self._frame(model, layers, changed)
+
+    def keyframe(self, model):
+        """
+        Returns a full frame of the state last drawn for model, without
+        touching the delta state, for a viewer joining a broadcast: the next
+        deltas then apply to what it shows.
+        """
+        previous_model, previous = self._views.get(self.viewer, (None, None))
+        layers = previous if model is previous_model else frame_layers(model)
+        return self._frame(model, layers)
+
+    def forget(self, viewer):
+        """
+        Drop the delta state of a viewer that disconnected.
+        """
+        self._views.pop(viewer, None)
+
+    def _current_layers(self, model):
+        cached_model, step, layers = self._layers
+        if cached_model is not model or step != model.schedule.steps:
+            layers = frame_layers(model)
+            self._layers = (model, model.schedule.steps, layers)
+        return layers
+
+    def _frame(self, model, layers, changed=None):
+        # changed masks the cells to send; None sends a full frame
+        full = changed is None
+        changed = np.argwhere(layers.any(axis=0) if full else changed)
+
+        # Build the key list once per distinct cell state, not once per cell
+        xs, ys = changed[:, 0], changed[:, 1]
+        states, inverse = np.unique(layers[:, xs, ys], axis=1, return_inverse=True)
+        keys = [cell_keys(*(int(v) for v in state)) for state in states.T]
+        cells = [
+            [x, y, keys[i]]
+            for x, y, i in zip(xs.tolist(), ys.tolist(), inverse.reshape(-1).tolist())
+        ]
+        if not full:
+            return {"full": False, "cells": cells}
+        return {
+            "full": True,
+            "width": model.width,
+            "height": model.height,
+            "portrayals": PORTRAYALS,
+            "cells": cells,
+        }
+
+
+def _rgb(color):
+    return [int(color[i : i + 2], 16) for i in (1, 3, 5)]
+
+
+PLANT_COLORS = {GRASS: _rgb("#00EA00"), BUSH: _rgb("#33AA33"), TREE: _rgb("#116611")}
+ANIMAL_COLORS = {
+    Mouse: _rgb("#AAAAAA"),
+    Sheep: _rgb("#CC00CC"),
+    Cat: _rgb("#FF2222"),
+    Wolf: _rgb("#4444FF"),
+}
+FIRE_COLOR = _rgb("#FF8800")
+HEATMAP_LAYERS = ("soil", "plants", "animals") + tuple(t.__name__ for t in ANIMAL_COLORS)
+
+
+def heatmap_rgb(model, layer, factor=1):
+    """
+    Returns a (width / factor, height / factor, 3) RGB raster of a layer:
+    "soil" (soil level), "plants" (share of each plant stage, burned cells
+    in orange), "animals" (all species, blended) or the name of one animal
+    type (number of animals, on a log scale).
+    """
+    if layer == "soil":
+        levels = raster.downsample(raster.soil_levels(model), factor)
+        stops = np.arange(len(SOIL_COLORS))
+        colors = np.array([_rgb(color) for color in SOIL_COLORS], dtype=np.float64)
+        return np.stack(
+            [np.interp(levels, stops, colors[:, i]) for i in range(3)], axis=-1
+        )
+
+    if layer == "plants":
+        stages = raster.plant_stages(model)
+        rgb = 0.0
+        for stage, color in PLANT_COLORS.items():
+            share = raster.downsample(stages == stage, factor)
+            rgb = rgb + raster.colorize(share, color, 1.0)
+        burned = raster.downsample(model.burned, factor)
+        return rgb * (1 - burned[..., None]) + raster.colorize(burned, FIRE_COLOR, 1.0)
+
+    if layer == "animals":
+        types = list(ANIMAL_COLORS)
+    else:
+        types = [t for t in ANIMAL_COLORS if t.__name__ == layer]
+        if not types:
+            raise ValueError(f"Unknown heatmap layer {layer!r}, use one of {HEATMAP_LAYERS}")
+    rgb = 0.0
+    for agent_type in types:
+        counts = raster.animal_counts(model, agent_type, factor)
+        scaled = np.log1p(counts)
+        rgb = rgb + raster.colorize(scaled, ANIMAL_COLORS[agent_type], scaled.max())
+    return rgb
+
+
+class RasterHeatmap(mesa.visualization.VisualizationElement):
+    """
+    Draws one layer of the grid as an image, one pixel per cell, or per
+    block of cells when the grid is larger than the canvas. The layer is
+    computed with array operations and sent as a single PNG per frame, so
+    the cost hardly depends on the size of the world.
+
+    The matching JavaScript is resources/RasterModule.js.
+    """
+
+    local_includes = ["resources/RasterModule.js"]
+    local_dir = script_dir
+
+    def __init__(self, layer="plants", canvas_width=500, canvas_height=500, render_every=1):
+        """
+        Args:
+            layer: One of HEATMAP_LAYERS, see heatmap_rgb
+            canvas_width, canvas_height: Size of the canvas, in pixels
+            render_every: Only draw every this many steps
+        """
+        if layer not in HEATMAP_LAYERS:
+            raise ValueError(f"Unknown heatmap layer {layer!r}, use one of {HEATMAP_LAYERS}")
+        self.layer = layer
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.render_every = render_every
+        self.js_code = (
+            f"elements.push(new RasterModule({canvas_width}, {canvas_height}, "
+            f"{layer!r}));"
+        )
+
+    def render(self, model):
+        if model.schedule.steps % self.render_every != 0:
+            return None
+        # Downsample to the canvas resolution
+        factor = max(
+            1,
+            math.ceil(model.width / self.canvas_width),
+            math.ceil(model.height / self.canvas_height),
+        )
+        image = raster.to_image(heatmap_rgb(model, self.layer, factor))
+        png = base64.b64encode(raster.encode_png(image)).decode("ascii")
+        return {"image": "data:image/png;base64," + png}
+
+
+class CanvasSocketHandler(mesa.visualization.SocketHandler):
+    """
+    Websocket handler of a CanvasServer: renders every frame for this
+    connection.
+    """
+
+    @property
+    def viz_state_message(self):
+        return {"type": "viz_state", "data": self.application.render_model(self)}
+
+    def on_close(self):
+        self.application.forget_viewer(self)
+
+
+class CanvasServer(mesa.visualization.ModularServer):
+    """
+    A ModularServer whose DeltaCanvasGrid elements keep their delta state
+    per connection, so several pages watching the model each get the cells
+    changed since the frame they were sent last.
+    """
+
+    socket_handler = CanvasSocketHandler
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Takes precedence over ModularServer's own /ws handler
+        self.add_handlers(r".*", [(r"/ws", self.socket_handler)])
+
+    def _canvases(self):
+        return [e for e in self.visualization_elements if isinstance(e, DeltaCanvasGrid)]
+
+    def render_model(self, viewer=None):
+        """
+        Turn the current state of the model into a dictionary of
+        visualizations, with the canvases' deltas taken against the last
+        frame sent to viewer.
+        """
+        canvases = self._canvases()
+        for canvas in canvases:
+            canvas.viewer = viewer
+        try:
+            return super().render_model()
+        finally:
+            for canvas in canvases:
+                canvas.viewer = None
+
+    def forget_viewer(self, viewer):
+        """
+        Drop the delta state of a viewer that disconnected.
+        """
+        for canvas in self._canvases():
+            canvas.forget(viewer)
+
+
+class RateMeter:
+    """
+    Counts events and reports their rate per second over the last window
+    seconds.
+    """
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self._times = collections.deque()
+
+    def tick(self):
+        now = time.perf_counter()
+        self._times.append(now)
+        while now - self._times[0] > self.window:
+            self._times.popleft()
+
+    def rate(self):
+        times = list(self._times)
+        if len(times) < 2 or time.perf_counter() - times[-1] > self.window:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
 
-    portrayal = {}
+    def reset(self):
+        self._times.clear()
 
-    if type(agent) is SoilPatch:
-        if agent.level == 0:
-            portrayal["Color"] = "#D2B48C" #["#00FF00", "#00CC00", "#009900"]
-        elif agent.level == 1:
-            portrayal["Color"] = "#9C814A"
-        elif agent.level == 2:
-            portrayal["Color"] = "#67552D"
+
+class RunRates(mesa.visualization.VisualizationElement):
+    """
+    Shows the model step and the step and frame rates of a BackgroundServer,
+    and tells the server when the run is started and stopped. The matching
+    JavaScript is resources/RunRatesModule.js.
+    """
+
+    local_includes = ["resources/RunRatesModule.js"]
+    local_dir = script_dir
+    js_code = "elements.push(new RunRatesModule());"
+
+    def __init__(self, server):
+        self.server = server
+
+    def render(self, model):
+        return {
+            "step": model.schedule.steps,
+            "steps_per_s": self.server.step_rate.rate(),
+            "frames_per_s": self.server.frame_rate.rate(),
+        }
+
+
+class BackgroundSocketHandler(CanvasSocketHandler):
+    """
+    Websocket handler of a BackgroundServer: while the run is on, a frame
+    request is answered with the latest state of the model stepping in the
+    background, instead of stepping it.
+    """
+
+    async def on_message(self, message):
+        server = self.application
+        msg = tornado.escape.json_decode(message)
+        if msg["type"] == "run":
+            if msg["running"]:
+                await server.start_stepping()
+            else:
+                server.stop_stepping()
+        elif msg["type"] == "get_step":
+            data = await server.next_frame(self)
+            if data is None:
+                # Not running in the background: step once, as ModularServer does
+                await server.wait_stopped()
+                if not server.model.running:
+                    self.write_message({"type": "end"})
+                    return
+                server.model.step()
+                data = server.render_model(self)
+            server.frame_rate.tick()
+            self.write_message({"type": "viz_state", "data": data})
+        elif msg["type"] == "reset":
+            # The page keeps running through a reset, and so does the stepping
+            stepping = server.stepping
+            server.stop_stepping()
+            await server.wait_stopped()
+            server.step_rate.reset()
+            server.frame_rate.reset()
+            super().on_message(message)
+            if stepping:
+                await server.start_stepping()
         else:
-            portrayal["Color"] = "#000000"
-        portrayal["Shape"] = "rect"
-        portrayal["Filled"] = "true"
-        portrayal["Layer"] = 0
-        portrayal["w"] = 1
-        portrayal["h"] = 1
-
-    elif type(agent) is Grass:
-        if agent.fully_grown:
-            portrayal["Shape"] = os.path.join(script_dir, "resources/grass_2.png")
+            super().on_message(message)
+
+
+class BackgroundServer(CanvasServer):
+    """
+    A CanvasServer that, while the run is on, steps the model at full speed
+    in a background thread rather than once per frame, so a slow browser or
+    network no longer holds the model back.
+
+    Each frame the browser asks for is rendered by the stepping thread from
+    the state after its latest completed step, so the model is never read
+    halfway through a step; the states in between are not rendered at all.
+    The browser's frame rate slider sets how often frames are asked for, and
+    a RunRates element shows the step and frame rates. Pressing Step while
+    the run is off steps the model once, as before.
+    """
+
+    socket_handler = BackgroundSocketHandler
+
+    def __init__(self, model_cls, visualization_elements, *args, **kwargs):
+        self.step_rate = RateMeter()
+        self.frame_rate = RateMeter()
+        self._worker = None
+        self._halt = threading.Event()
+        self._finished = True
+        # Whether a start_stepping waiting for the last worker should go on
+        self._start_wanted = False
+        self._frame_wanted = threading.Event()
+        # (viewer, future) of the frame requests not answered yet, shared
+        # with the stepping thread under _lock
+        self._waiting = []
+        self._lock = threading.Lock()
+        self._io_loop = None
+        super().__init__(
+            model_cls, [*visualization_elements, RunRates(self)], *args, **kwargs
+        )
+
+    @property
+    def stepping(self):
+        """
+        Whether the model is stepping in the background and not asked to
+        stop.
+        """
+        return not self._finished and not self._halt.is_set()
+
+    async def start_stepping(self):
+        """
+        Start stepping the model in the background, until stop_stepping is
+        called or the model stops running.
+        """
+        if self.stepping:
+            return
+        self._start_wanted = True
+        # A worker may still be finishing its last step; wait it out without
+        # blocking the server
+        await self.wait_stopped()
+        # The run may have been stopped, or started by another request,
+        # while waiting
+        if not self._start_wanted or self.stepping:
+            return
+        self._io_loop = tornado.ioloop.IOLoop.current()
+        self._halt.clear()
+        self._finished = False
+        self._worker = threading.Thread(target=self._step_loop, daemon=True)
+        self._worker.start()
+
+    def stop_stepping(self):
+        """
+        Ask the background stepping to stop after the current step.
+        """
+        self._start_wanted = False
+        self._halt.set()
+
+    async def wait_stopped(self):
+        """
+        Wait, without blocking the server, until no step is in progress.
+        """
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            await self._io_loop.run_in_executor(None, worker.join)
+
+    async def next_frame(self, viewer):
+        """
+        Returns the visualization state for viewer after the next step
+        completed in the background, or None if the model is not stepping in
+        the background.
+        """
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            # Not the thread's liveness: it may have taken the last requests
+            # already, and a request added after that would never be answered
+            if not self.stepping:
+                return None
+            self._waiting.append((viewer, future))
+            self._frame_wanted.set()
+        return await future
+
+    def _step_loop(self):
+        model = self.model
+        while not self._halt.is_set() and model.running:
+            model.step()
+            self.step_rate.tick()
+            if self._frame_wanted.is_set():
+                self._answer(self._take_waiting())
+        # Requests still waiting get the final state
+        with self._lock:
+            self._finished = True
+            waiting = self._take_waiting()
+        self._answer(waiting)
+
+    def _take_waiting(self):
+        waiting, self._waiting = self._waiting, []
+        self._frame_wanted.clear()
+        return waiting
+
+    def _answer(self, waiting):
+        # Render each viewer's frame here, between steps, and hand them over
+        frames = [(future, self.render_model(viewer)) for viewer, future in waiting]
+        self._io_loop.add_callback(self._deliver, frames)
+
+    def _deliver(self, frames):
+        for future, data in frames:
+            if not future.done():
+                future.set_result(data)
+
+
+class Session(mesa.visualization.VisualizationElement):
+    """
+    Shows the step, the number of viewers and who is running the shared
+    model of a BroadcastServer, and tells the server when this viewer starts
+    and stops the run. The matching JavaScript is resources/SessionModule.js.
+    """
+
+    local_includes = ["resources/SessionModule.js"]
+    local_dir = script_dir
+    js_code = "elements.push(new SessionModule());"
+
+    def __init__(self, server):
+        self.server = server
+
+    def render(self, model):
+        controller = self.server.controller
+        return {
+            "generation": self.server.generation,
+            "step": model.schedule.steps,
+            "viewers": len(self.server.viewers),
+            "controller": None if controller is None else controller.viewer_id,
+        }
+
+
+class BroadcastSocketHandler(mesa.visualization.SocketHandler):
+    """
+    Websocket handler of a BroadcastServer: steps, resets and parameter
+    changes act on the shared model only if this viewer may control it.
+    """
+
+    def open(self):
+        self.running = False
+        self.joined = False
+        self.application.join(self)
+        super().open()
+
+    def on_close(self):
+        self.application.leave(self)
+
+    def on_message(self, message):
+        server = self.application
+        msg = tornado.escape.json_decode(message)
+        if msg["type"] == "run":
+            server.set_running(self, msg["running"])
+        elif msg["type"] == "get_step":
+            if server.has_control(self):
+                server.step_session()
+        elif msg["type"] == "reset":
+            if self.joined and server.has_control(self):
+                server.reset_session()
+            else:
+                # A page asks for a reset as soon as it opens, and a viewer
+                # without control cannot reset: show the session as it is
+                self.joined = True
+                server.send_keyframe(self)
+        elif msg["type"] == "submit_params":
+            if server.has_control(self):
+                super().on_message(message)
         else:
-            portrayal["Shape"] = os.path.join(script_dir, "resources/grass.png")
-        portrayal["scale"] = 0.9
-        portrayal["Layer"] = 1
-        portrayal["text"] = agent.countdown, agent.countup
-        portrayal["text_color"] = "White"
-    
-    elif type(agent) is Bush:
-        portrayal["Shape"] = os.path.join(script_dir, "resources/bush.png")
-        portrayal["scale"] = 0.9
-        portrayal["Layer"] = 1
-        portrayal["text"] = agent.countup
-        portrayal["text_color"] = "White"
-
-    elif type(agent) is Tree:
-        portrayal["Shape"] = os.path.join(script_dir, "resources/tree.png")
-        portrayal["scale"] = 0.9
-        portrayal["Layer"] = 1
-        portrayal["text_color"] = "White"
-
-    elif type(agent) is Mouse:
-        portrayal["Shape"] = os.path.join(script_dir, "resources/mouse.png")
-        # https://icons8.com/web-app/433/sheep
-        portrayal["scale"] = 0.9
-        portrayal["Layer"] = 2
-
-    elif type(agent) is Sheep:
-        portrayal["Shape"] = os.path.join(script_dir, "resources/sheep.png")
-        # https://icons8.com/web-app/433/sheep
-        portrayal["scale"] = 0.9
-        portrayal["Layer"] = 2
-
-    elif type(agent) is Cat:
-        portrayal["Shape"] = os.path.join(script_dir, "resources/cat.png")
-        # https://icons8.com/web-app/433/sheep
-        portrayal["scale"] = 0.9
-        portrayal["Layer"] = 2
-
-    elif type(agent) is Wolf:
-        portrayal["Shape"] = os.path.join(script_dir, "resources/wolf.png")
-        # https://icons8.com/web-app/36821/German-Shepherd
-        portrayal["scale"] = 0.9
-        portrayal["Layer"] = 2
-
-    elif type(agent) is FirePatch:
-        portrayal["Shape"] = os.path.join(script_dir, "resources/fire.png")
-        # https://icons8.com/web-app/36821/German-Shepherd
-        portrayal["scale"] = 0.9
-        portrayal["Layer"] = 3
-
-    return portrayal
-
-
-canvas_element = mesa.visualization.CanvasGrid(wolf_sheep_portrayal, 20, 20, 500, 500)
+            super().on_message(message)
+
+
+class BroadcastServer(CanvasServer):
+    """
+    A CanvasServer whose viewers all watch one shared model: each step is
+    taken once, rendered once and encoded once, and the same message is sent
+    to every connected page, so the cost no longer grows with the number of
+    viewers.
+
+    Frames are rendered for no particular viewer, so all of them share the
+    canvases' delta state, and a viewer joining the session gets a full
+    frame of what the others see,
+    instead of resetting the model. Control is arbitrated: while a viewer is
+    running the model, only its frame requests step it, and the others'
+    steps, resets and parameter changes are ignored; control passes to
+    another running viewer, if any, when it stops or leaves. While nobody is
+    running the model, any viewer can step or reset it. Parameter changes
+    take effect on the next reset.
+    """
+
+    socket_handler = BroadcastSocketHandler
+
+    def __init__(self, model_cls, visualization_elements, *args, **kwargs):
+        self.viewers = []
+        self.controller = None
+        self.generation = 0
+        self._next_viewer_id = 1
+        super().__init__(
+            model_cls, [Session(self), *visualization_elements], *args, **kwargs
+        )
+
+    def reset_model(self):
+        # Tells the viewers that did not ask for the reset to clear their elements
+        self.generation += 1
+        super().reset_model()
+
+    def join(self, viewer):
+        viewer.viewer_id = self._next_viewer_id
+        self._next_viewer_id += 1
+        self.viewers.append(viewer)
+
+    def leave(self, viewer):
+        if viewer in self.viewers:
+            self.viewers.remove(viewer)
+        viewer.running = False
+        if self.controller is viewer:
+            self._hand_over()
+
+    def has_control(self, viewer):
+        """
+        Returns whether viewer may step, reset or change the shared model.
+        """
+        return self.controller is None or self.controller is viewer
+
+    def set_running(self, viewer, running):
+        viewer.running = running
+        if running and self.controller is None:
+            self.controller = viewer
+        elif not running and self.controller is viewer:
+            self._hand_over()
+
+    def step_session(self):
+        """
+        Step the shared model and send the new frame to every viewer.
+        """
+        if not self.model.running:
+            self.broadcast({"type": "end"})
+            return
+        self.model.step()
+        self.broadcast({"type": "viz_state", "data": self.render_model()})
+
+    def reset_session(self):
+        """
+        Reset the shared model and send its first frame to every viewer.
+        """
+        self.reset_model()
+        self.broadcast({"type": "viz_state", "data": self.render_model()})
+
+    def send_keyframe(self, viewer):
+        """
+        Send one viewer a full frame of the current state of the session.
+        """
+        data = [
+            getattr(element, "keyframe", element.render)(self.model)
+            for element in self.visualization_elements
+        ]
+        data[0] = {**data[0], "you": viewer.viewer_id}
+        viewer.write_message({"type": "viz_state", "data": data})
+
+    def broadcast(self, message):
+        """
+        Encode message once and send it to every viewer.
+        """
+        text = tornado.escape.json_encode(message)
+        for viewer in list(self.viewers):
+            try:
+                viewer.write_message(text)
+            except tornado.websocket.WebSocketClosedError:
+                self.leave(viewer)
+
+    def _hand_over(self):
+        self.controller = next((v for v in self.viewers if v.running), None)
+
+
+canvas_element = DeltaCanvasGrid(500, 500)
 plant_chart = mesa.visualization.ChartModule(
     [
         {"Label": "Grass", "Color": "#00EA00"},
@@ -103,6 +786,8 @@ animal_chart = mesa.visualization.ChartModule(
 model_params = {
     # The following line is an example to showcase StaticText.
     "title": mesa.visualization.StaticText("Parameters:"),
+    "width": mesa.visualization.NumberInput("Grid width", 20),
+    "height": mesa.visualization.NumberInput("Grid height", 20),
     # "grass": mesa.visualization.Checkbox("Grass Enabled", True),
     "soil": mesa.visualization.Checkbox("Grass Enabled", True),
 
@@ -134,6 +819,8 @@ model_params = {
         0.01,
         description="The rate at which wolf agents reproduce.",
     ),
+    "cat_hunt_radius": mesa.visualization.Slider("Cat hunting radius", 1, 1, 10),
+    "wolf_hunt_radius": mesa.visualization.Slider("Wolf hunting radius", 1, 1, 10),
     "mouse_evolution_time": mesa.visualization.Slider("Mouse evolution time", 8, 1, 50),
     "cat_evolution_time": mesa.visualization.Slider("Cat evolution time", 20, 1, 50),
     "grass_evolution_time": mesa.visualization.Slider("Grass evolution time", 4, 1, 50),
@@ -142,7 +829,58 @@ model_params = {
 
 }
 
-server = mesa.visualization.ModularServer(
-    WolfSheep, [canvas_element, plant_chart, animal_chart], "Ecological Succession", model_params
-)
-server.port = 8521
+
+def _server():
+    return CanvasServer(
+        WolfSheep, [canvas_element, plant_chart, animal_chart], "Ecological Succession", model_params
+    )
+
+
+def _heatmap_server():
+    # For worlds too large to draw agent by agent
+    return mesa.visualization.ModularServer(
+        WolfSheep,
+        [RasterHeatmap("plants"), RasterHeatmap("animals"), plant_chart, animal_chart],
+        "Ecological Succession (heatmaps)",
+        model_params,
+    )
+
+
+def _background_server():
+    # Steps the model in the background while running, and only renders the
+    # frames the browser asks for
+    return BackgroundServer(
+        WolfSheep,
+        [DeltaCanvasGrid(500, 500), plant_chart, animal_chart],
+        "Ecological Succession (background stepping)",
+        model_params,
+    )
+
+
+def _broadcast_server():
+    # One shared model, stepped once per frame and sent to every viewer
+    return BroadcastServer(
+        WolfSheep,
+        [DeltaCanvasGrid(500, 500), plant_chart, animal_chart],
+        "Ecological Succession (shared session)",
+        model_params,
+    )
+
+
+# Every server builds a model as soon as it is created, so they are only
+# created when imported, e.g. "from wolf_sheep.server import heatmap_server"
+SERVER_FACTORIES = {
+    "server": _server,
+    "heatmap_server": _heatmap_server,
+    "background_server": _background_server,
+    "broadcast_server": _broadcast_server,
+}
+
+
+def __getattr__(name):
+    factory = SERVER_FACTORIES.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    server = globals()[name] = factory()
+    server.port = 8521
+    return server
@@ -0,0 +1,499 @@
+"""
+Grid with a per-cell occupancy index
+"""
+
+import mesa
+import numpy as np
+
+
+class LayeredMultiGrid(mesa.space.MultiGrid):
+    """
+    A MultiGrid that also indexes the contents of every cell by layer.
+
+    Each cell holds at most one soil agent and one plant agent, which are
+    stored in dedicated slots. All other agents are bucketed by their exact
+    type. The index is kept in sync by place_agent, remove_agent and
+    move_agent, so agents can look up what shares their cell without
+    building and filtering the cell's content list.
+
+    Neighborhoods are computed from offsets kept once per combination of
+    moore, include_center and radius (see neighbor_offsets), wrapped
+    arithmetically, so no per-cell table has to be built or stored.
+
+    If op_counts is set to a dict with "moves", "places" and "removes"
+    entries, the grid operations are counted in it.
+    """
+
+    def __init__(self, width, height, torus, soil_types=(), plant_types=()):
+        """
+        Create a new layered grid.
+
+        Args:
+            width, height: The width and height of the grid
+            torus: Boolean whether the grid wraps or not.
+            soil_types: Agent types stored in the soil layer
+            plant_types: Agent types stored in the plant layer
+        """
+        super().__init__(width, height, torus)
+        self.soil_types = tuple(soil_types)
+        self.plant_types = tuple(plant_types)
+        self._soil = [[None] * height for _ in range(width)]
+        self._plants = [[None] * height for _ in range(width)]
+        # pos -> {agent type -> [agents]}, only for occupied cells
+        self._typed = {}
+        # agent type -> {pos -> number of agents of the type at pos}
+        self._cells_by_type = {}
+        # radius -> window offsets sorted by Manhattan distance
+        self._window_offsets = {}
+        # radius -> {window offset: its index in _window_offsets[radius]}
+        self._window_ranks = {}
+        # (moore, include_center, radius) -> neighbor offsets in mesa's order
+        self._neighbor_offsets = {}
+        self.op_counts = None
+
+    def neighbor_offsets(self, moore, include_center=False, radius=1):
+        """
+        Returns the (dx, dy) offsets of a neighborhood, in the order
+        get_neighborhood lists the cells.
+        """
+        key = (moore, include_center, radius)
+        offsets = self._neighbor_offsets.get(key)
+        if offsets is None:
+            offsets = self._neighbor_offsets[key] = tuple(
+                (dx, dy)
+                for dx in range(-radius, radius + 1)
+                for dy in range(-radius, radius + 1)
+                if (moore or abs(dx) + abs(dy) <= radius)
+                and (include_center or dx or dy)
+            )
+        return offsets
+
+    def _wraps_cleanly(self, radius):
+        # On a torus wider and higher than the neighborhood, every offset
+        # reaches a distinct cell
+        return self.torus and self.width > 2 * radius and self.height > 2 * radius
+
+    def get_neighborhood(self, pos, moore, include_center=False, radius=1):
+        """
+        Returns the cells in the neighborhood of pos, in mesa's order,
+        computed from the neighbor offsets.
+        """
+        if self.out_of_bounds(pos):
+            raise Exception("The `pos` tuple passed is out of bounds.")
+        x, y = pos
+        width, height = self.width, self.height
+        offsets = self.neighbor_offsets(moore, True, radius)
+        if self._wraps_cleanly(radius):
+            cells = [((x + dx) % width, (y + dy) % height) for dx, dy in offsets]
+        else:
+            # A dict keeps the order and drops cells reached twice
+            neighborhood = {}
+            for dx, dy in offsets:
+                nx, ny = x + dx, y + dy
+                if self.torus:
+                    nx %= width
+                    ny %= height
+                elif not (0 <= nx < width and 0 <= ny < height):
+                    continue
+                neighborhood[(nx, ny)] = True
+            cells = list(neighborhood)
+        if not include_center:
+            cells.remove(pos)
+        return tuple(cells)
+
+    def random_neighbor(self, pos, moore, rng, include_center=True, radius=1):
+        """
+        Returns a cell of the neighborhood of pos picked with rng.choice, as
+        rng.choice(get_neighborhood(...)) would, using the same draw.
+
+        On a torus larger than the neighborhood the offset is picked and
+        wrapped, without building the neighborhood.
+        """
+        if self._wraps_cleanly(radius):
+            dx, dy = rng.choice(self.neighbor_offsets(moore, include_center, radius))
+            return ((pos[0] + dx) % self.width, (pos[1] + dy) % self.height)
+        return rng.choice(self.get_neighborhood(pos, moore, include_center, radius))
+
+    def place_agent(self, agent, pos):
+        """
+        Place the agent at the specified location and index it.
+        """
+        x, y = pos
+        if agent.pos is not None and agent in self._grid[x][y]:
+            return
+        super().place_agent(agent, pos)
+        if self.op_counts is not None:
+            self.op_counts["places"] += 1
+        agent_type = type(agent)
+        if agent_type in self.soil_types:
+            self._set_slot(self._soil, agent, pos)
+        elif agent_type in self.plant_types:
+            self._set_slot(self._plants, agent, pos)
+        else:
+            self._typed.setdefault(pos, {}).setdefault(agent_type, []).append(agent)
+            cells = self._cells_by_type.setdefault(agent_type, {})
+            cells[pos] = cells.get(pos, 0) + 1
+
+    def place_agents(self, agents):
+        """
+        Place new agents, none of them on the grid yet, at the positions
+        their pos attribute already holds, and index them.
+
+        Unlike place_agent, the agents are appended to their cells directly,
+        without mesa's per-call checks and warnings, which dominate the cost
+        of building a large world.
+        """
+        grid = self._grid
+        soil_types = self.soil_types
+        plant_types = self.plant_types
+        count = 0
+        for agent in agents:
+            pos = agent.pos
+            x, y = pos
+            grid[x][y].append(agent)
+            agent_type = type(agent)
+            if agent_type in soil_types:
+                self._set_slot(self._soil, agent, pos)
+            elif agent_type in plant_types:
+                self._set_slot(self._plants, agent, pos)
+            else:
+                self._typed.setdefault(pos, {}).setdefault(agent_type, []).append(agent)
+                cells = self._cells_by_type.setdefault(agent_type, {})
+                cells[pos] = cells.get(pos, 0) + 1
+            if self._empties_built:
+                self._empties.discard(pos)
+                self._empty_mask[pos] = True
+            count += 1
+        if self.op_counts is not None:
+            self.op_counts["places"] += count
+
+    def remove_agent(self, agent):
+        """
+        Remove the agent from its location and from the index.
+        """
+        pos = agent.pos
+        super().remove_agent(agent)
+        if self.op_counts is not None:
+            self.op_counts["removes"] += 1
+        x, y = pos
+        agent_type = type(agent)
+        if agent_type in self.soil_types:
+            self._soil[x][y] = None
+        elif agent_type in self.plant_types:
+            self._plants[x][y] = None
+        else:
+            cell = self._typed[pos]
+            bucket = cell[agent_type]
+            bucket.remove(agent)
+            if not bucket:
+                del cell[agent_type]
+                if not cell:
+                    del self._typed[pos]
+            cells = self._cells_by_type[agent_type]
+            if cells[pos] == 1:
+                del cells[pos]
+            else:
+                cells[pos] -= 1
+
+    def move_agent(self, agent, pos):
+        """
+        Move an agent from its current position to a new position.
+        """
+        if self.op_counts is not None:
+            self.op_counts["moves"] += 1
+        super().move_agent(agent, pos)
+
+    def clear_cells(self, cells, keep_types=()):
+        """
+        Remove every agent from the given cells, except those of keep_types,
+        and return the removed agents.
+
+        Cells are emptied in bulk rather than one remove_agent call per agent.
+        """
+        if self._empties_built:
+            removed = [
+                agent
+                for pos in cells
+                for agent in self.get_cell_list_contents(pos)
+                if type(agent) not in keep_types
+            ]
+            for agent in removed:
+                self.remove_agent(agent)
+            return removed
+
+        removed = []
+        for pos in cells:
+            x, y = pos
+            contents = self._grid[x][y]
+            if not contents:
+                continue
+            kept = []
+            for agent in contents:
+                if type(agent) in keep_types:
+                    kept.append(agent)
+                else:
+                    agent.pos = None
+                    removed.append(agent)
+            if len(kept) == len(contents):
+                continue
+            self._grid[x][y] = kept
+            soil = self._soil[x][y]
+            if soil is not None and type(soil) not in keep_types:
+                self._soil[x][y] = None
+            plant = self._plants[x][y]
+            if plant is not None and type(plant) not in keep_types:
+                self._plants[x][y] = None
+            cell = self._typed.pop(pos, None)
+            if cell is not None:
+                kept_cell = {}
+                for agent_type, bucket in cell.items():
+                    if agent_type in keep_types:
+                        kept_cell[agent_type] = bucket
+                    else:
+                        del self._cells_by_type[agent_type][pos]
+                if kept_cell:
+                    self._typed[pos] = kept_cell
+        if self.op_counts is not None:
+            self.op_counts["removes"] += len(removed)
+        return removed
+
+    @staticmethod
+    def _set_slot(layer, agent, pos):
+        x, y = pos
+        if layer[x][y] is not None:
+            raise ValueError(f"Cell {pos} already holds {layer[x][y]!r}")
+        layer[x][y] = agent
+
+    def soil_at(self, pos):
+        """
+        Returns the soil agent at pos, or None.
+        """
+        x, y = pos
+        return self._soil[x][y]
+
+    def plant_at(self, pos):
+        """
+        Returns the plant agent at pos, or None.
+        """
+        x, y = pos
+        return self._plants[x][y]
+
+    def soil_levels(self, empty=-1):
+        """
+        Returns a (width, height) int8 array with the level of the soil agent
+        of every cell, read from the soil slots, empty where there is none.
+        """
+        return np.array(
+            [[empty if soil is None else soil.level for soil in column] for column in self._soil],
+            dtype=np.int8,
+        ).reshape(self.width, self.height)
+
+    def plant_codes(self):
+        """
+        Returns a (width, height) int8 array read from the plant slots: 0
+        where there is no plant, otherwise 1 + the index of the plant's type
+        in plant_types.
+        """
+        codes = {plant_type: i + 1 for i, plant_type in enumerate(self.plant_types)}
+        return np.array(
+            [[0 if plant is None else codes[type(plant)] for plant in column] for column in self._plants],
+            dtype=np.int8,
+        ).reshape(self.width, self.height)
+
+    def cells_of_type(self, agent_type):
+        """
+        Returns a mapping of every cell holding animals of agent_type to the
+        number of them there. Only the non-layered types are indexed.
+        """
+        return self._cells_by_type.get(agent_type, {})
+
+    def cell_ranks(self, agents):
+        """
+        Returns the index of each of agents, none of a layered type, among
+        the agents of its type in its cell, the order random_agent_at picks
+        them in.
+        """
+        typed = self._typed
+        return [typed[agent.pos][type(agent)].index(agent) for agent in agents]
+
+    def order_cells(self, agents, ranks):
+        """
+        Put each of agents, just placed with place_agents on cells holding no
+        other agents of their type, at the index in its cell that cell_ranks
+        gave.
+        """
+        typed = self._typed
+        for agent, rank in zip(agents, ranks):
+            typed[agent.pos][type(agent)][rank] = agent
+
+    def count_at(self, pos, types):
+        """
+        Returns the number of agents of the given types at pos.
+        """
+        cell = self._typed.get(pos)
+        if cell is None:
+            return 0
+        count = 0
+        for agent_type in types:
+            bucket = cell.get(agent_type)
+            if bucket:
+                count += len(bucket)
+        return count
+
+    def iter_agents_at(self, pos, types):
+        """
+        Iterate over the agents of the given types at pos.
+        """
+        cell = self._typed.get(pos)
+        if cell is None:
+            return
+        for agent_type in types:
+            bucket = cell.get(agent_type)
+            if bucket:
+                yield from bucket
+
+    def random_agent_at(self, pos, types, rng):
+        """
+        Returns an agent of the given types at pos, chosen uniformly at random
+        with rng, or None if there is none.
+        """
+        count = self.count_at(pos, types)
+        if count == 0:
+            return None
+        index = rng.randrange(count)
+        cell = self._typed[pos]
+        for agent_type in types:
+            bucket = cell.get(agent_type)
+            if bucket:
+                if index < len(bucket):
+                    return bucket[index]
+                index -= len(bucket)
+
+    def step_towards(self, pos, target, moore=True):
+        """
+        Returns the neighbor of pos (or pos itself) that is nearest to target
+        by Manhattan distance, the one get_neighborhood lists first on ties.
+
+        The step is derived from the signs of the offset to target, the
+        shorter way around the edges if the grid is a torus.
+        """
+        x, y = pos
+        dx = target[0] - x
+        dy = target[1] - y
+        if self.torus:
+            # Halfway around either way is as near; the negative step is
+            # listed first
+            dx %= self.width
+            if 2 * dx >= self.width:
+                dx -= self.width
+            dy %= self.height
+            if 2 * dy >= self.height:
+                dy -= self.height
+        sx = (dx > 0) - (dx < 0)
+        sy = (dy > 0) - (dy < 0)
+        if not moore and sx and sy:
+            # Only one axis at a time: (-1, 0) comes before (0, sy), which
+            # comes before (1, 0)
+            if sx > 0:
+                sx = 0
+            else:
+                sy = 0
+        nx, ny = x + sx, y + sy
+        if self.torus:
+            nx %= self.width
+            ny %= self.height
+        return (nx, ny)
+
+    def torus_distance(self, pos1, pos2):
+        """
+        Returns the Manhattan distance between two positions, taking the
+        shorter way around the edges if the grid is a torus.
+        """
+        dx = abs(pos1[0] - pos2[0])
+        dy = abs(pos1[1] - pos2[1])
+        if self.torus:
+            dx = min(dx, self.width - dx)
+            dy = min(dy, self.height - dy)
+        return dx + dy
+
+    def nearest_of_types(self, pos, types, radius=1, include_center=False):
+        """
+        Returns the position of the nearest agent of the given types within
+        the Moore neighborhood of the given radius around pos, by Manhattan
+        distance, or None if there is none.
+
+        Either the cells occupied by those types or the cells of the
+        neighborhood are scanned, whichever are fewer, so the cost is bounded
+        by the size of the neighborhood and never touches agents of other
+        types. Ties are broken by the order of the window offsets either
+        way, so the result does not depend on which is scanned.
+        """
+        occupied = [self._cells_by_type.get(agent_type, {}) for agent_type in types]
+        n_occupied = sum(len(cells) for cells in occupied)
+        if n_occupied == 0:
+            return None
+
+        x, y = pos
+        if n_occupied < (2 * radius + 1) ** 2:
+            ranks = self._offset_ranks(radius)
+            best = None
+            best_rank = len(ranks)
+            for cells in occupied:
+                for cell in cells:
+                    for dx in self._axis_offsets(cell[0] - x, self.width, radius):
+                        for dy in self._axis_offsets(cell[1] - y, self.height, radius):
+                            if dx == 0 and dy == 0 and not include_center:
+                                continue
+                            rank = ranks[(dx, dy)]
+                            if rank < best_rank:
+                                best = cell
+                                best_rank = rank
+            return best
+
+        for dx, dy in self._offsets(radius):
+            if dx == 0 and dy == 0 and not include_center:
+                continue
+            cell = (x + dx, y + dy)
+            if self.torus:
+                cell = (cell[0] % self.width, cell[1] % self.height)
+            elif self.out_of_bounds(cell):
+                continue
+            for cells in occupied:
+                if cell in cells:
+                    return cell
+        return None
+
+    def _axis_offsets(self, delta, size, radius):
+        """
+        Returns the offsets within radius along one axis that reach a cell
+        delta away, several on a torus smaller than the window.
+        """
+        if not self.torus:
+            return (delta,) if -radius <= delta <= radius else ()
+        if size > 2 * radius:
+            offset = (delta + radius) % size - radius
+            return (offset,) if offset <= radius else ()
+        return tuple(d for d in range(-radius, radius + 1) if (d - delta) % size == 0)
+
+    def _offset_ranks(self, radius):
+        try:
+            return self._window_ranks[radius]
+        except KeyError:
+            ranks = {offset: i for i, offset in enumerate(self._offsets(radius))}
+            self._window_ranks[radius] = ranks
+            return ranks
+
+    def _offsets(self, radius):
+        try:
+            return self._window_offsets[radius]
+        except KeyError:
+            offsets = sorted(
+                (
+                    (dx, dy)
+                    for dx in range(-radius, radius + 1)
+                    for dy in range(-radius, radius + 1)
+                ),
+                key=lambda offset: abs(offset[0]) + abs(offset[1]),
+            )
+            self._window_offsets[radius] = offsets
+            return offsets
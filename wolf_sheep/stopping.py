@@ -0,0 +1,171 @@
+"""
+Stop conditions
+===============
+
+Conditions that end a WolfSheep run early, passed as
+WolfSheep(stop_conditions=[...]). The model checks them at the end of every
+step, each one only every `every` steps, and stops running (model.running is
+set to False and model.stop_reason says why) as soon as one of them holds.
+
+    >>> model = WolfSheep(stop_conditions=[Extinction([Mouse, Cat]), Steady(200)])
+    >>> model.run_model(5000)
+    'steady: no change in Mouse, Sheep, ... for 200 steps'
+
+Batch configs describe them as JSON, see from_config.
+"""
+
+from collections import deque
+
+from .agents import Grass, Bush, Tree, Mouse, Sheep, Cat, Wolf
+
+COUNTED_TYPES = (Mouse, Sheep, Cat, Wolf, Grass, Bush, Tree)
+TYPES_BY_NAME = {agent_type.__name__: agent_type for agent_type in COUNTED_TYPES}
+
+
+def count(model, agent_type):
+    """
+    Returns the number of animals or plants of agent_type in model.
+    """
+    if agent_type in (Grass, Bush, Tree):
+        return model.plant_count(agent_type)
+    return model.animal_count(agent_type)
+
+
+class StopCondition:
+    """
+    Base class of the stop conditions. Subclasses implement check.
+    """
+
+    def __init__(self, types=COUNTED_TYPES, every=1):
+        """
+        Args:
+            types: The animal and plant types the condition looks at
+            every: Check the condition every this many steps
+        """
+        self.types = tuple(types)
+        self.every = every
+
+    def __call__(self, model):
+        """
+        Returns why the run should stop, or None to keep going.
+        """
+        if model.schedule.steps % self.every != 0:
+            return None
+        return self.check(model)
+
+    def counts(self, model):
+        return tuple(count(model, agent_type) for agent_type in self.types)
+
+    def names(self):
+        return ", ".join(agent_type.__name__ for agent_type in self.types)
+
+    def check(self, model):
+        raise NotImplementedError
+
+
+class Extinction(StopCondition):
+    """
+    Stops once all of the given types have died out, or any of them with
+    any=True.
+    """
+
+    def __init__(self, types=(Mouse, Sheep, Cat, Wolf), any=False, every=1):
+        super().__init__(types, every)
+        self.any = any
+
+    def check(self, model):
+        extinct = [n == 0 for n in self.counts(model)]
+        if any(extinct) if self.any else all(extinct):
+            died = [t.__name__ for t, gone in zip(self.types, extinct) if gone]
+            return f"extinction: {', '.join(died)}"
+        return None
+
+
+class Steady(StopCondition):
+    """
+    Stops once the counts of the given types have stayed within tolerance of
+    each other over the last window checks.
+    """
+
+    def __init__(self, window=100, types=COUNTED_TYPES, tolerance=0, every=1):
+        super().__init__(types, every)
+        self.window = window
+        self.tolerance = tolerance
+        self.history = deque(maxlen=window)
+
+    def check(self, model):
+        self.history.append(self.counts(model))
+        if len(self.history) < self.window:
+            return None
+        for series in zip(*self.history):
+            if max(series) - min(series) > self.tolerance:
+                return None
+        return f"steady: no change in {self.names()} for {self.window * self.every} steps"
+
+
+class Periodic(StopCondition):
+    """
+    Stops once the counts of the given types have repeated with the same
+    period, of 2 to max_period checks, for repeats whole periods (steady
+    counts are left to Steady).
+    """
+
+    def __init__(self, max_period=200, repeats=3, types=COUNTED_TYPES, tolerance=0, every=1):
+        super().__init__(types, every)
+        self.max_period = max_period
+        self.repeats = repeats
+        self.tolerance = tolerance
+        self.history = deque(maxlen=max_period * repeats)
+
+    def check(self, model):
+        self.history.append(self.counts(model))
+        history = list(self.history)
+        n = len(history)
+        if self._repeats(history, 1, min(n, 2 * self.repeats)):
+            # Steady counts repeat with every period
+            return None
+        for period in range(2, self.max_period + 1):
+            span = period * self.repeats
+            if span > n:
+                break
+            if self._repeats(history, period, span):
+                return f"periodic: {self.names()} repeat every {period * self.every} steps"
+        return None
+
+    def _repeats(self, history, period, span):
+        """
+        Whether each of the last span entries of history equals, within
+        tolerance, the entry period before it.
+        """
+        n = len(history)
+        tolerance = self.tolerance
+        for i in range(n - span + period, n):
+            a, b = history[i], history[i - period]
+            if any(abs(x - y) > tolerance for x, y in zip(a, b)):
+                return False
+        return True
+
+
+CONDITIONS = {"extinction": Extinction, "steady": Steady, "periodic": Periodic}
+
+
+def from_config(specs):
+    """
+    Build stop conditions from their JSON description: a list of objects
+    naming the condition and its arguments, with types given by class name,
+    e.g.
+
+        [{"condition": "extinction", "types": ["Mouse", "Cat"], "any": true},
+         {"condition": "steady", "window": 200, "every": 10}]
+    """
+    conditions = []
+    for spec in specs:
+        arguments = dict(spec)
+        try:
+            condition = CONDITIONS[arguments.pop("condition")]
+            if "types" in arguments:
+                arguments["types"] = [TYPES_BY_NAME[name] for name in arguments["types"]]
+        except KeyError as e:
+            raise ValueError(f"Bad stop condition {spec!r}: unknown {e}") from None
+        conditions.append(condition(**arguments))
+    return conditions
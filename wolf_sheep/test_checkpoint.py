@@ -0,0 +1,129 @@
+"""
+Tests that a model restored from a checkpoint continues exactly as the
+original does.
+
+    $ python -m pytest wolf_sheep/test_checkpoint.py
+"""
+
+import os
+import pickle
+import time
+
+import numpy as np
+import pytest
+
+from wolf_sheep.agents import Cat
+from wolf_sheep.collector import read_columns
+from wolf_sheep.model import WolfSheep
+
+# mesa warns about every agent placed with its position already set
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+SCENARIOS = [
+    dict(soil=True),
+    dict(soil=True, plant_engine="vectorized", agent_pool=True, fire_mode="spread"),
+    dict(soil=True, engine="vectorized"),
+    dict(soil=True, collector="streaming"),
+    dict(soil=True, plant_engine="timers", agent_pool=True),
+    dict(soil=True, deferred_changes=True, agent_pool=True, initial_sheep=20),
+]
+
+
+@pytest.mark.parametrize("params", SCENARIOS)
+def test_restored_run_continues_identically(params, tmp_path):
+    path = os.path.join(tmp_path, "model.ckpt")
+    model = WolfSheep(seed=3, initial_mice=50, initial_cats=10, fire_period=25, **params)
+    for _ in range(30):
+        model.step()
+    model.save_checkpoint(path)
+    for _ in range(40):
+        model.step()
+
+    restored = WolfSheep.load_checkpoint(path)
+    for _ in range(40):
+        restored.step()
+    assert restored.datacollector.get_model_vars_dataframe().equals(
+        model.datacollector.get_model_vars_dataframe()
+    )
+
+
+def test_parameters_can_be_overridden(tmp_path):
+    path = os.path.join(tmp_path, "model.ckpt")
+    WolfSheep(seed=1, initial_cats=10).save_checkpoint(path)
+    assert WolfSheep.load_checkpoint(path, cat_reproduce=0.2).cat_reproduce == 0.2
+
+    model = WolfSheep.load_checkpoint(path, migration=False)
+    assert model.migration_enabled is False
+    model.step()
+
+    model = WolfSheep.load_checkpoint(path, cat_hunt_radius=7)
+    cats = model.schedule.agents_of_type(Cat)
+    assert cats and all(cat.hunt_radius == 7 for cat in cats)
+
+    for params in (dict(no_such_parameter=1), dict(step=3), dict(width=10)):
+        with pytest.raises(TypeError):
+            WolfSheep.load_checkpoint(path, **params)
+
+
+def test_branches_write_their_own_store(tmp_path):
+    original = os.path.join(tmp_path, "original")
+    path = os.path.join(tmp_path, "model.ckpt")
+    model = WolfSheep(seed=2, collector="streaming", collect_path=original)
+    for _ in range(10):
+        model.step()
+    model.save_checkpoint(path)
+    for _ in range(10):
+        model.step()
+    model.datacollector.flush()
+
+    branches = []
+    for name in ("a", "b"):
+        branch = WolfSheep.load_checkpoint(
+            path, collect_path=os.path.join(tmp_path, name), cat_reproduce=0.2
+        )
+        for _ in range(5):
+            branch.step()
+        branch.datacollector.flush()
+        branches.append(read_columns(os.path.join(tmp_path, name)))
+    # The original store is untouched, and each branch starts from its rows
+    assert len(read_columns(original)["Step"]) == 21
+    for columns in branches:
+        assert np.array_equal(columns["Step"], np.arange(16))
+    with pytest.raises(FileExistsError):
+        WolfSheep.load_checkpoint(path, collect_path=original)
+
+
+def test_checkpoints_are_quicker_than_pickling(tmp_path):
+    # 160,000 soil patches, the grass on them and 19,000 animals: about
+    # 280,000 agents
+    path = os.path.join(tmp_path, "model.ckpt")
+    start = time.perf_counter()
+    model = WolfSheep(
+        width=400, height=400, soil=True, initial_mice=16000, initial_cats=3000, seed=1
+    )
+    build = time.perf_counter() - start
+    model.step()
+
+    start = time.perf_counter()
+    model.save_checkpoint(path)
+    save = time.perf_counter() - start
+    start = time.perf_counter()
+    WolfSheep.load_checkpoint(path)
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pickle.loads(pickle.dumps(model, protocol=5))
+    pickling = time.perf_counter() - start
+    assert save + load < pickling
+    assert load < 2 * build
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    for params in SCENARIOS:
+        test_restored_run_continues_identically(params, tempfile.mkdtemp())
+    test_parameters_can_be_overridden(tempfile.mkdtemp())
+    test_branches_write_their_own_store(tempfile.mkdtemp())
+    test_checkpoints_are_quicker_than_pickling(tempfile.mkdtemp())
+    print("ok")
@@ -0,0 +1,64 @@
+"""
+Tests of the StreamingDataCollector's column types and column stores.
+
+    $ python -m pytest wolf_sheep/test_collector.py
+"""
+
+import os
+import types
+
+import numpy as np
+import pytest
+
+from wolf_sheep.collector import StreamingDataCollector, read_columns
+
+
+def collect(collector, values):
+    model = types.SimpleNamespace(schedule=types.SimpleNamespace(steps=0))
+    for step, value in enumerate(values):
+        model.schedule.steps = step
+        model.value = value
+        collector.collect(model)
+
+
+@pytest.mark.parametrize("in_memory", [True, False])
+def test_columns_widen_to_later_values(in_memory, tmp_path):
+    path = None if in_memory else os.path.join(tmp_path, "run")
+    collector = StreamingDataCollector(
+        {"Value": lambda model: model.value}, path=path, chunk_size=2
+    )
+    # Ints are written out in a first chunk before the first float arrives
+    collect(collector, [True, 2, 3, 4.5, 5])
+    columns = collector.get_columns()
+    assert columns["Value"].dtype == np.float64
+    assert columns["Value"].tolist() == [1.0, 2.0, 3.0, 4.5, 5.0]
+    if path is not None:
+        assert read_columns(path)["Value"].tolist() == [1.0, 2.0, 3.0, 4.5, 5.0]
+
+
+def test_existing_stores_are_kept_unless_overwritten(tmp_path):
+    path = os.path.join(tmp_path, "run")
+    reporters = {"Value": lambda model: model.value}
+    collector = StreamingDataCollector(reporters, path=path)
+    collect(collector, [1, 2])
+    collector.flush()
+
+    with pytest.raises(FileExistsError):
+        StreamingDataCollector(reporters, path=path)
+    with pytest.raises(FileExistsError):
+        StreamingDataCollector(reporters).move_to(path)
+    assert read_columns(path)["Value"].tolist() == [1, 2]
+
+    collector = StreamingDataCollector(reporters, path=path, overwrite=True)
+    collect(collector, [7])
+    collector.flush()
+    assert read_columns(path)["Value"].tolist() == [7]
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    test_columns_widen_to_later_values(True, tempfile.mkdtemp())
+    test_columns_widen_to_later_values(False, tempfile.mkdtemp())
+    test_existing_stores_are_kept_unless_overwritten(tempfile.mkdtemp())
+    print("ok")
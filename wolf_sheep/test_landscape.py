@@ -0,0 +1,76 @@
+"""
+Tests of landscape rasters: every plant engine starts from the soil levels
+and plant stages in the files, without writing to them.
+
+    $ python -m pytest wolf_sheep/test_landscape.py
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from wolf_sheep import raster
+from wolf_sheep.model import WolfSheep
+from wolf_sheep.tiled import TiledWolfSheep
+
+
+def make_landscape(directory, width=30, height=20):
+    rng = np.random.default_rng(0)
+    levels = rng.integers(0, 5, size=(width, height)).astype(np.int8)
+    stages = np.where(levels > 0, rng.integers(1, 4, size=levels.shape), 0).astype(np.int8)
+    levels_path = os.path.join(directory, "levels.npy")
+    stages_path = os.path.join(directory, "stages.raw")
+    np.save(levels_path, levels)
+    stages.tofile(stages_path)
+    return levels, stages, levels_path, stages_path
+
+
+@pytest.mark.filterwarnings("ignore")
+@pytest.mark.parametrize(
+    "params", [dict(), dict(plant_engine="timers"), dict(plant_engine="vectorized"), dict(engine="vectorized")]
+)
+def test_engines_start_from_files(params, tmp_path):
+    levels, stages, levels_path, stages_path = make_landscape(tmp_path)
+    model = WolfSheep(
+        width=30, height=20, soil=True, soil_levels=levels_path, plant_stages=stages_path, seed=1, **params
+    )
+    assert np.array_equal(raster.soil_levels(model), levels)
+    assert np.array_equal(raster.plant_stages(model), stages)
+    for _ in range(20):
+        model.step()
+    assert np.array_equal(np.load(levels_path), levels)
+    assert np.array_equal(np.fromfile(stages_path, dtype=np.int8).reshape(30, 20), stages)
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_tiles_read_their_columns(tmp_path):
+    levels, stages, levels_path, stages_path = make_landscape(tmp_path)
+    model = TiledWolfSheep(
+        tiles=3, processes=False, width=30, height=20, soil=True, soil_levels=levels_path, plant_stages=stages_path
+    )
+    tiled_levels = np.concatenate([tile.plants.level for tile in model._tiles])
+    assert np.array_equal(tiled_levels, levels)
+    assert model.total("Tree") == np.count_nonzero(stages == 3)
+
+
+def test_bad_rasters_are_rejected(tmp_path):
+    levels, _, levels_path, _ = make_landscape(tmp_path)
+    with pytest.raises(ValueError):
+        WolfSheep(width=10, height=10, soil=True, soil_levels=levels_path)
+    with pytest.raises(ValueError):
+        WolfSheep(width=30, height=20, soil=True, soil_levels=levels * 3)
+    wide_path = os.path.join(tmp_path, "wide.npy")
+    np.save(wide_path, levels.astype(np.int64))
+    with pytest.raises(ValueError):
+        WolfSheep(width=30, height=20, soil=True, soil_levels=wide_path)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    for params in [dict(), dict(plant_engine="timers"), dict(plant_engine="vectorized"), dict(engine="vectorized")]:
+        test_engines_start_from_files(params, tempfile.mkdtemp())
+    test_tiles_read_their_columns(tempfile.mkdtemp())
+    test_bad_rasters_are_rejected(tempfile.mkdtemp())
+    print("ok")
@@ -0,0 +1,27 @@
+"""
+Tests of the step profiler.
+
+    $ python -m pytest wolf_sheep/test_profiling.py
+"""
+
+import pytest
+
+from wolf_sheep.model import WolfSheep
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_streaming_collector_keeps_timings():
+    model = WolfSheep(seed=1, soil=True, profile=True, collector="streaming")
+    for _ in range(5):
+        model.step()
+    columns = model.datacollector.get_columns()
+    # Each row holds the profile of the step before, complete from step 2 on
+    assert columns["time/schedule.step"].dtype.kind == "f"
+    assert columns["time/schedule.step"][2:].min() > 0
+    assert columns["calls/Grass"].dtype.kind == "i"
+    assert columns["grid/moves"][2:].max() > 0
+
+
+if __name__ == "__main__":
+    test_streaming_collector_keeps_timings()
+    print("ok")
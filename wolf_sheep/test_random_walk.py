@@ -9,6 +9,7 @@ from mesa.time import RandomActivation
 from mesa.visualization.TextVisualization import TextGrid, TextVisualization
 
 from random_walk import RandomWalker
+from rng import RandomStreams
 
 
 class WalkerAgent(RandomWalker):
@@ -40,6 +41,7 @@ class WalkerWorld(Model):
         self.width = width
         self.grid = MultiGrid(self.width, self.height, torus=True)
         self.agent_count = agent_count
+        self.streams = RandomStreams(self._seed)
 
         self.schedule = RandomActivation(self)
         # Create agents
@@ -0,0 +1,49 @@
+"""
+Tests that the rasters and heatmaps draw every engine, with and without
+soil.
+
+    $ python -m pytest wolf_sheep/test_raster.py
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from wolf_sheep import raster
+from wolf_sheep.model import WolfSheep
+from wolf_sheep.plants import NONE
+from wolf_sheep.server import HEATMAP_LAYERS, RasterHeatmap, heatmap_rgb
+
+# mesa warns about every agent placed with its position already set
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+ENGINES = [
+    dict(engine="agents", plant_engine="agents"),
+    dict(engine="agents", plant_engine="timers"),
+    dict(engine="agents", plant_engine="vectorized"),
+    dict(engine="vectorized"),
+]
+
+
+@pytest.mark.parametrize("engines, soil", list(itertools.product(ENGINES, (False, True))))
+def test_every_engine_is_drawn(engines, soil):
+    model = WolfSheep(width=12, height=8, soil=soil, seed=1, **engines)
+    model.step()
+
+    levels = raster.soil_levels(model)
+    stages = raster.plant_stages(model)
+    assert levels.shape == stages.shape == (12, 8)
+    if not soil:
+        assert (levels == -1).all()
+        assert (stages == NONE).all()
+    for layer in HEATMAP_LAYERS:
+        assert heatmap_rgb(model, layer, factor=3).shape == (4, 3, 3)
+        frame = RasterHeatmap(layer, canvas_width=6, canvas_height=4).render(model)
+        assert frame["image"].startswith("data:image/png;base64,")
+
+
+if __name__ == "__main__":
+    for engines, soil in itertools.product(ENGINES, (False, True)):
+        test_every_engine_is_drawn(engines, soil)
+    print("ok")
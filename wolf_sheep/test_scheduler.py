@@ -0,0 +1,160 @@
+"""
+Tests of the scheduler's deferred births and deaths, and of the bulk spawn
+and kill of the model against the one-agent-at-a-time path.
+
+    $ python -m pytest wolf_sheep/test_scheduler.py
+"""
+
+import mesa
+import pytest
+
+from wolf_sheep.agents import SoilPatch, Grass, Bush, Tree, Sheep
+from wolf_sheep.model import WolfSheep
+from wolf_sheep.scheduler import RandomActivationByTypeFiltered
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+
+class Prey(mesa.Agent):
+    def step(self):
+        self.model.acted.append(self)
+
+
+class Hunter(mesa.Agent):
+    """
+    Runs the step's script: a list of (action, agent) pairs.
+    """
+
+    def step(self):
+        for action, agent in self.model.script:
+            if action == "add":
+                self.model.schedule.add(agent)
+            else:
+                self.model.schedule.remove(agent)
+
+
+def deferred_model():
+    model = mesa.Model()
+    model.acted = []
+    model.script = []
+    model.schedule = RandomActivationByTypeFiltered(model)
+    model.schedule.defer_changes = True
+    # No shuffling: hunters step before prey, as they were added first
+    model.random.shuffle = lambda items: None
+    model.schedule.add(Hunter(model.next_id(), model))
+    model.schedule.register_filter("all", Prey, lambda agent: True)
+    return model
+
+
+def test_prey_eaten_before_its_turn_does_not_act():
+    model = deferred_model()
+    eaten, spared = Prey(model.next_id(), model), Prey(model.next_id(), model)
+    model.schedule.add(eaten)
+    model.schedule.add(spared)
+    model.script = [("remove", eaten)]
+    model.schedule.step()
+    assert model.acted == [spared]
+    assert eaten not in model.schedule.agents
+    assert model.schedule.get_type_count(Prey) == 1
+    assert model.schedule.get_type_count(Prey, "all") == 1
+
+
+def test_newborn_acts_from_the_next_step():
+    model = deferred_model()
+    newborn = Prey(model.next_id(), model)
+    model.script = [("add", newborn)]
+    model.schedule.step()
+    assert model.acted == []
+    assert model.schedule.get_type_count(Prey) == 1
+    model.script = []
+    model.schedule.step()
+    assert model.acted == [newborn]
+
+
+def test_newborn_killed_in_its_birth_step_is_never_scheduled():
+    model = deferred_model()
+    newborn = Prey(model.next_id(), model)
+    model.script = [("add", newborn), ("remove", newborn)]
+    model.schedule.step()
+    model.script = []
+    model.schedule.step()
+    assert model.acted == []
+    assert newborn not in model.schedule.agents
+    assert model.schedule.get_type_count(Prey) == 0
+    assert model.schedule.get_type_count(Prey, "all") == 0
+
+
+def empty_model(**params):
+    model = WolfSheep(
+        width=10,
+        height=10,
+        initial_sheep=0,
+        initial_wolves=0,
+        initial_mice=0,
+        initial_cats=0,
+        migration=False,
+        seed=1,
+        **params,
+    )
+    model.schedule.register_filter("strong", Sheep, lambda agent: agent.energy > 5)
+    return model
+
+
+def contents(model):
+    return {
+        "counts": {t: model.schedule.get_type_count(t) for t in (Sheep, Grass)},
+        "strong": model.schedule.get_type_count(Sheep, "strong"),
+        "registered": len(model.agents_by_type.get(Sheep, ())),
+        "cells": sorted(
+            (agent.pos, type(agent).__name__)
+            for agent in model.schedule.agents
+            if type(agent) is Sheep
+        ),
+    }
+
+
+def test_bulk_spawn_and_kill_match_one_at_a_time():
+    positions = [(x, (3 * x) % 10) for x in range(10)] * 2
+    energies = list(range(20))
+    bulk, single = empty_model(), empty_model()
+
+    spawned = bulk.spawn_agents(Sheep, positions, [True] * 20, energies)
+    one_by_one = [
+        single.spawn(Sheep, pos, True, energy) for pos, energy in zip(positions, energies)
+    ]
+    assert contents(bulk) == contents(single)
+
+    bulk.kill_agents(spawned[::3])
+    for agent in one_by_one[::3]:
+        single.kill(agent)
+    assert contents(bulk) == contents(single)
+    assert contents(bulk)["counts"][Sheep] == 13
+
+
+def test_kill_agents_with_the_soil_of_a_killed_plant():
+    model = WolfSheep(width=5, height=5, soil=True, plant_engine="timers", seed=1)
+    pos = next(agent.pos for agent in model.schedule.agents if type(agent) is Grass)
+    model.kill_agents([model.grid.soil_at(pos), model.grid.plant_at(pos)])
+    assert model.grid.soil_at(pos) is None
+    model.step()
+
+    # Nothing grows back without soil, and no patch or plant there is woken
+    assert model.grid.soil_at(pos) is None
+    assert model.grid.plant_at(pos) is None
+    layered = (SoilPatch, Grass, Bush, Tree)
+    assert not [
+        agent for agent in model.schedule.agents if type(agent) in layered and agent.pos == pos
+    ]
+    assert not [agent for agent in model.schedule._pending if agent.pos == pos]
+    for agent_type, agents in model.schedule._agents_by_type.items():
+        assert model.schedule.get_type_count(agent_type) == len(agents)
+    assert model.schedule.get_type_count(SoilPatch) == 24
+
+
+if __name__ == "__main__":
+    test_prey_eaten_before_its_turn_does_not_act()
+    test_newborn_acts_from_the_next_step()
+    test_newborn_killed_in_its_birth_step_is_never_scheduled()
+    test_bulk_spawn_and_kill_match_one_at_a_time()
+    test_kill_agents_with_the_soil_of_a_killed_plant()
+    print("ok")
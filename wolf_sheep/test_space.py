@@ -0,0 +1,32 @@
+"""
+Tests of the LayeredMultiGrid's nearest-prey queries.
+
+    $ python -m pytest wolf_sheep/test_space.py
+"""
+
+import mesa
+
+from wolf_sheep.space import LayeredMultiGrid
+
+
+class Prey(mesa.Agent):
+    pass
+
+
+def test_ties_do_not_depend_on_the_prey_count():
+    model = mesa.Model()
+    grid = LayeredMultiGrid(20, 20, torus=True)
+    # Listed last in the type's cells, but first in the window's order
+    for pos in [(6, 5), (4, 5)]:
+        grid.place_agent(Prey(model.next_id(), model), pos)
+    assert grid.nearest_of_types((5, 5), (Prey,)) == (4, 5)
+
+    # Enough prey elsewhere to scan the window instead of the prey cells
+    for x in range(10):
+        grid.place_agent(Prey(model.next_id(), model), (x, 15))
+    assert grid.nearest_of_types((5, 5), (Prey,)) == (4, 5)
+
+
+if __name__ == "__main__":
+    test_ties_do_not_depend_on_the_prey_count()
+    print("ok")
@@ -0,0 +1,93 @@
+"""
+Tests of the stop conditions that end a run early.
+
+    $ python -m pytest wolf_sheep/test_stopping.py
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from wolf_sheep.agents import Mouse, Cat
+from wolf_sheep.model import WolfSheep
+from wolf_sheep.stopping import Extinction, Steady, Periodic, from_config
+from wolf_sheep.tiled import TiledWolfSheep
+
+
+class Counts:
+    """
+    Stands in for a model whose animal counts follow a given series.
+    """
+
+    def __init__(self, series):
+        self.series = series
+        self.schedule = SimpleNamespace(steps=0)
+
+    def animal_count(self, agent_type):
+        return self.series[self.schedule.steps]
+
+    def plant_count(self, plant_type):
+        return 0
+
+
+def first_stop(condition, series):
+    model = Counts(series)
+    for step in range(len(series)):
+        model.schedule.steps = step
+        reason = condition(model)
+        if reason is not None:
+            return step, reason
+    return None
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_extinction_ends_the_run():
+    model = WolfSheep(seed=1, migration=False, stop_conditions=[Extinction([Mouse, Cat])])
+    assert model.run_model(2000).startswith("extinction")
+    assert model.schedule.steps < 2000
+    assert model.animal_count(Mouse) == model.animal_count(Cat) == 0
+    assert not model.running
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_tiled_runs_stop():
+    model = TiledWolfSheep(
+        seed=1,
+        tiles=2,
+        processes=False,
+        migration=False,
+        stop_conditions=[Extinction([Mouse, Cat])],
+    )
+    assert model.run_model(2000).startswith("extinction")
+    assert model.schedule.steps < 2000
+    assert model.total("Mice") == model.total("Cats") == 0
+    assert not model.running
+
+
+def test_steady_and_periodic():
+    assert first_stop(Steady(5, types=[Mouse]), [9, 3, 4, 4, 4, 4, 4, 4])[0] == 6
+    assert first_stop(Steady(5, types=[Mouse], every=2), [9, 3, 4, 4, 4, 4, 4, 4]) is None
+    step, reason = first_stop(Periodic(10, types=[Mouse]), [1, 2, 3, 5, 8, 5] * 5)
+    assert step == 17 and "every 6 steps" in reason
+    assert first_stop(Periodic(10, types=[Mouse]), [4] * 30) is None
+
+
+def test_from_config():
+    steady, extinction = from_config(
+        [
+            {"condition": "steady", "window": 50, "every": 10},
+            {"condition": "extinction", "types": ["Mouse"], "any": True},
+        ]
+    )
+    assert (steady.window, steady.every) == (50, 10)
+    assert extinction.types == (Mouse,) and extinction.any
+    with pytest.raises(ValueError):
+        from_config([{"condition": "boredom"}])
+
+
+if __name__ == "__main__":
+    test_extinction_ends_the_run()
+    test_tiled_runs_stop()
+    test_steady_and_periodic()
+    test_from_config()
+    print("ok")
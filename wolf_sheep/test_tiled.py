@@ -0,0 +1,65 @@
+"""
+Tests of tiled runs: tiles in worker processes step exactly as they do in
+one process, and animals cross tile edges without being lost or duplicated.
+
+    $ python -m pytest wolf_sheep/test_tiled.py
+"""
+
+import numpy as np
+import pytest
+
+from wolf_sheep.agents import Mouse
+from wolf_sheep.tiled import TiledWolfSheep
+
+PARAMS = dict(
+    width=24,
+    height=10,
+    soil=True,
+    initial_mice=80,
+    initial_cats=20,
+    initial_wolves=5,
+    cat_hunt_radius=2,
+    fire_period=15,
+)
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_processes_match_one_process():
+    with TiledWolfSheep(seed=5, tiles=3, processes=True, **PARAMS) as model:
+        model.run_model(30)
+        in_processes = model.datacollector.get_model_vars_dataframe()
+    model = TiledWolfSheep(seed=5, tiles=3, processes=False, **PARAMS)
+    model.run_model(30)
+    assert model.datacollector.get_model_vars_dataframe().equals(in_processes)
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_animals_cross_tiles():
+    # Mice that never die or breed: only moving changes the tiles
+    model = TiledWolfSheep(
+        seed=2,
+        tiles=4,
+        processes=False,
+        width=16,
+        height=4,
+        initial_mice=40,
+        initial_cats=0,
+        mouse_reproduce=0,
+        fire_period=0,
+        migration=False,
+    )
+    for tile in model._tiles:
+        tile.animals.species[Mouse].energy[:] = 1e9
+    before = [tile.counts()["Mice"] for tile in model._tiles]
+    model.run_model(20)
+    after = [tile.counts()["Mice"] for tile in model._tiles]
+    assert sum(after) == model.total("Mice") == 40
+    assert before != after
+    for tile in model._tiles:
+        assert np.all(tile.animals.species[Mouse].x < tile.width)
+
+
+if __name__ == "__main__":
+    test_processes_match_one_process()
+    test_animals_cross_tiles()
+    print("ok")
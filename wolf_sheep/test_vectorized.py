@@ -0,0 +1,95 @@
+"""
+Tests for the vectorized animal engine: it should reproduce the population
+dynamics of the agent engine in distribution, not draw for draw.
+
+    $ python -m pytest wolf_sheep/test_vectorized.py
+"""
+
+import warnings
+
+import numpy as np
+
+from wolf_sheep.agents import Mouse, Sheep, Cat, Wolf
+from wolf_sheep.model import WolfSheep
+
+PARAMS = dict(
+    width=40,
+    height=40,
+    initial_mice=200,
+    initial_sheep=60,
+    initial_cats=30,
+    initial_wolves=8,
+    soil=True,
+    plant_engine="vectorized",
+    fire_period=0,
+)
+SEEDS = range(8)
+STEPS = 40
+
+
+def run(engine, seed, steps=STEPS, **params):
+    warnings.simplefilter("ignore")
+    model = WolfSheep(engine=engine, seed=seed, **{**PARAMS, **params})
+    for _ in range(steps):
+        model.step()
+    return model.datacollector.get_model_vars_dataframe()
+
+
+def test_same_series():
+    agents = run("agents", 0, steps=2)
+    vectorized = run("vectorized", 0, steps=2)
+    assert list(agents.columns) == list(vectorized.columns)
+    assert len(agents) == len(vectorized)
+
+
+def test_reproducible():
+    first = run("vectorized", 3, steps=10)
+    second = run("vectorized", 3, steps=10)
+    assert first.equals(second)
+
+
+def test_population_means_match():
+    """
+    The mean trajectory of every series over several seeds must agree between
+    the engines to within a few standard errors.
+    """
+    agents = np.stack([run("agents", seed).values for seed in SEEDS])
+    vectorized = np.stack([run("vectorized", seed).values for seed in SEEDS])
+    columns = run("agents", 0, steps=0).columns
+    for step in (5, 10, 20, 40):
+        a = agents[:, step]
+        v = vectorized[:, step]
+        stderr = np.sqrt((a.var(axis=0) + v.var(axis=0)) / len(SEEDS))
+        # Allow for series that are (almost) deterministic
+        tolerance = 4 * stderr + 0.05 * np.abs(a.mean(axis=0)) + 1
+        difference = np.abs(a.mean(axis=0) - v.mean(axis=0))
+        for column, diff, tol in zip(columns, difference, tolerance):
+            assert diff <= tol, (step, column, diff, tol)
+
+
+def test_fire_kills_animals_on_burned_cells():
+    warnings.simplefilter("ignore")
+    model = WolfSheep(engine="vectorized", seed=1, **{**PARAMS, "fire_period": 1})
+    model.forest_fire(period=1)
+    for agent_type in (Mouse, Sheep, Cat, Wolf):
+        species = model.animals.species[agent_type]
+        assert not model.burned[species.x, species.y].any()
+
+
+def test_starving_animals_die():
+    warnings.simplefilter("ignore")
+    model = WolfSheep(
+        engine="vectorized",
+        seed=2,
+        **{**PARAMS, "initial_cats": 0, "initial_wolves": 0, "soil": False},
+    )
+    model.animals.species[Sheep].energy[:] = 1
+    model.animals.step_species(model.animals.species[Sheep])
+    assert model.animal_count(Sheep) == 0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(name, "ok")
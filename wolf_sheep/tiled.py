@@ -0,0 +1,459 @@
+"""
+Tiled multi-core runs
+=====================
+
+Runs one large WolfSheep landscape on several cores. The torus is cut into
+vertical stripes of whole columns, the tiles, and every tile holds the
+plants and animals of its columns in the array engines (PlantLayer and
+AnimalEngine) in its own worker process.
+
+Species act in a random order, as in WolfSheep, and every species' step is
+split in two around an exchange between neighboring tiles:
+
+1. Predators sense prey in the tiles next to theirs through a halo: each
+   tile sends the prey positions within hunting range of its edges to its
+   neighbors, where they count as ghost prey.
+2. Every animal moves. Animals that stepped over an edge are handed to the
+   tile they are now on.
+3. Animals eat, die and reproduce. Predators and prey, or herbivores and
+   plants, are then always on the same tile, so this needs no exchange.
+
+Fires and migrants are drawn once, by the coordinating TiledWolfSheep, and
+the DataCollector sums the counts of all tiles.
+
+    >>> with TiledWolfSheep(tiles=8, width=4000, height=4000, soil=True) as model:
+    ...     model.run_model(100)
+    ...     data = model.datacollector.get_model_vars_dataframe()
+
+Every tile draws from its own random streams, so a run is reproducible for a
+given seed and number of tiles, whether or not the tiles run in processes,
+but does not repeat a WolfSheep run with the same seed.
+
+The workers are forked where the platform can fork. Elsewhere, e.g. on
+Windows, they are spawned and re-import the script that creates the model,
+which must then do so under ``if __name__ == "__main__":``.
+"""
+
+import inspect
+import multiprocessing
+import os
+from functools import partial
+
+import mesa
+import numpy as np
+
+from .agents import Grass, Bush, Tree, Mouse, Sheep, Cat, Wolf
+from .model import WolfSheep, FOOD_ENERGIES
+from .plants import PlantLayer
+from . import landscape
+from .rng import RandomStreams
+from .vectorized import AnimalEngine
+
+# WolfSheep parameters that choose an implementation, which tiles fix
+UNSUPPORTED_PARAMS = (
+    "engine",
+    "plant_engine",
+    "agent_pool",
+    "deferred_changes",
+    "collector",
+    "collect_path",
+    "collect_columns",
+    "profile",
+)
+
+REPORTED_TYPES = {
+    "Mice": Mouse,
+    "Cats": Cat,
+    "Wolves": Wolf,
+    "Sheep": Sheep,
+    "Grass": Grass,
+    "Bush": Bush,
+    "Tree": Tree,
+}
+REPORTED_NAMES = {agent_type: name for name, agent_type in REPORTED_TYPES.items()}
+
+# How worker processes start: forked where possible, else the platform default
+START_METHOD = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+
+
+class Tile:
+    """
+    The plants and animals of columns x0 to x1 - 1 of the grid, at full
+    height. Stands in for the model towards its PlantLayer and AnimalEngine.
+
+    The animals live on a ring of the tile's columns plus halo columns on
+    either side: the column x0 + d is at local x d modulo the ring width, so
+    the left halo wraps around to the end of the ring. Between steps every
+    animal of a tile is on one of its own columns.
+    """
+
+    def __init__(self, index, x0, x1, halo, params, seed):
+        """
+        Args:
+            index: Position of the tile, from left to right
+            x0, x1: The first and one past the last column of the tile
+            halo: Width of the halo, at least the largest hunt radius
+            params: The WolfSheep parameters of the run
+            seed: Seed of the run; the tile's streams derive from it and index
+        """
+        self.__dict__.update(params)
+        self.index = index
+        self.x0 = x0
+        self.halo = halo
+        self.grid_width = params["width"]
+        self.width = x1 - x0
+        self.ring = self.width + 2 * halo
+        self.streams = RandomStreams((seed, index))
+        self.food_energies = dict(FOOD_ENERGIES)
+        self.plants = None
+        if self.soil:
+            # Each tile maps only its own columns of a landscape file
+            columns = slice(x0, x1)
+            self.plants = PlantLayer(
+                self,
+                self.streams.numpy("succession"),
+                landscape.soil_levels(self, columns),
+                landscape.plant_stages(self, columns),
+            )
+        self.animals = AnimalEngine(self)
+        # The plants only cover the tile's own columns
+        self.animals.width = self.ring
+
+    def _to_local(self, x):
+        offset = (np.asarray(x) - self.x0) % self.grid_width
+        offset = np.where(offset >= self.width + self.halo, offset - self.grid_width, offset)
+        return offset % self.ring
+
+    def _to_global(self, x):
+        offset = np.where(x >= self.width + self.halo, x - self.ring, x)
+        return (self.x0 + offset) % self.grid_width
+
+    def add(self, agent_type, x, y, energy, countup=None):
+        """
+        Add animals of agent_type at global columns x and rows y.
+        """
+        species = self.animals.species[agent_type]
+        species.add(self._to_local(x), y, energy)
+        if countup is not None and len(countup):
+            species.countup[-len(countup):] = countup
+
+    def border(self, agent_type):
+        """
+        Returns the global (x, y) positions of the prey of agent_type that
+        its predators on the left and on the right neighbor can sense.
+        """
+        radius = getattr(self, self.animals.species[agent_type].hunt_radius)
+        prey = [self.animals.species[prey_type] for prey_type in self.animals.species[agent_type].hunts]
+        x = np.concatenate([p.x for p in prey])
+        y = np.concatenate([p.y for p in prey])
+        left = x < radius
+        right = x >= self.width - radius
+        return (
+            (self._to_global(x[left]), y[left]),
+            (self._to_global(x[right]), y[right]),
+        )
+
+    def move(self, agent_type, ghosts):
+        """
+        Move the animals of agent_type, sensing the ghost prey at global
+        positions ghosts, and hand over those that left the tile.
+
+        Returns the animals that moved onto the left and onto the right
+        neighbor, as (x, y, energy, countup) arrays with global x.
+        """
+        species = self.animals.species[agent_type]
+        if len(species):
+            if ghosts is not None:
+                ghosts = (self._to_local(ghosts[0]), ghosts[1])
+            self.animals.move_species(species, ghosts)
+        left = species.x >= self.width + self.halo
+        right = (species.x >= self.width) & ~left
+        leaving = [
+            (self._to_global(species.x[m]), species.y[m], species.energy[m], species.countup[m])
+            for m in (left, right)
+        ]
+        species.keep(~(left | right))
+        return leaving
+
+    def settle(self, agent_type, arrivals):
+        """
+        Add the animals of agent_type that moved onto the tile, then let all
+        of them eat, die and reproduce.
+        """
+        for x, y, energy, countup in arrivals:
+            self.add(agent_type, x, y, energy, countup)
+        self.animals.feed_species(self.animals.species[agent_type])
+
+    def step_plants(self):
+        if self.plants is not None:
+            self.plants.step()
+
+    def burn(self, cells):
+        """
+        Kill the plants and animals on the given global flat cell indices,
+        all of which are on the tile.
+        """
+        mask = np.zeros((self.width, self.height), dtype=bool)
+        mask.reshape(-1)[cells - self.x0 * self.height] = True
+        if self.plants is not None:
+            self.plants.clear(mask)
+        self.animals.clear(mask)
+
+    def counts(self):
+        """
+        Returns the number of animals and plants of every reported type.
+        """
+        counts = {}
+        for name, agent_type in REPORTED_TYPES.items():
+            if agent_type in self.animals.species:
+                counts[name] = self.animals.count(agent_type)
+            elif self.plants is not None:
+                counts[name] = self.plants.count(agent_type)
+            else:
+                counts[name] = 0
+        return counts
+
+
+def _serve(connection, *tile_args):
+    """
+    Worker process: build a Tile, then run the methods the coordinator asks
+    for until it sends None.
+    """
+    tile = Tile(*tile_args)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        name, args = request
+        connection.send(getattr(tile, name)(*args))
+    connection.close()
+
+
+class TiledWolfSheep(mesa.Model):
+    """
+    A WolfSheep run on array engines split into tiles, each stepped by its
+    own worker process.
+    """
+
+    def __init__(self, tiles=None, processes=True, seed=None, **params):
+        """
+        Create a new tiled run.
+
+        Args:
+            tiles: Number of tiles, by default one per core; fewer if the
+                   tiles would be narrower than twice the hunting range
+            processes: Whether to step every tile in its own worker process,
+                       rather than all of them in this one
+            seed: Seed for the model's random number generator
+            params: WolfSheep parameters, except those that choose an engine
+                    or collector
+        """
+        super().__init__()
+        unsupported = set(params) & set(UNSUPPORTED_PARAMS)
+        if unsupported:
+            raise TypeError(f"TiledWolfSheep does not take {sorted(unsupported)}")
+        bound = inspect.signature(WolfSheep.__init__).bind(None, **params)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        del params["self"], params["seed"]
+        for name in UNSUPPORTED_PARAMS:
+            params.pop(name)
+        # The migration parameter would hide the migration method
+        self.migration_enabled = params.pop("migration")
+        # Checked here, on the totals of all tiles
+        self.stop_conditions = list(params.pop("stop_conditions"))
+        self.stop_reason = None
+        self.__dict__.update(params)
+        self.streams = RandomStreams(self._seed)
+        self.cnt = 1
+        # Holds no agents, only counts the steps
+        self.schedule = mesa.time.BaseScheduler(self)
+
+        halo = max(self.cat_hunt_radius, self.wolf_hunt_radius, 1)
+        if tiles is None:
+            tiles = os.cpu_count() or 1
+        tiles = max(1, min(tiles, self.width // (2 * halo)))
+        if tiles == 1:
+            halo = 0
+        self.tiles = tiles
+        self.bounds = [self.width * i // tiles for i in range(tiles + 1)]
+
+        tile_args = [
+            (index, self.bounds[index], self.bounds[index + 1], halo, params, self._seed)
+            for index in range(tiles)
+        ]
+        self._tiles = []
+        self._connections = []
+        self._workers = []
+        if processes:
+            # Importing mesa makes spawn the default start method, and spawned
+            # workers re-import the __main__ module; forking needs no guard
+            context = multiprocessing.get_context(START_METHOD)
+            for args in tile_args:
+                connection, child = context.Pipe()
+                worker = context.Process(target=_serve, args=(child, *args), daemon=True)
+                worker.start()
+                child.close()
+                self._connections.append(connection)
+                self._workers.append(worker)
+        else:
+            self._tiles = [Tile(*args) for args in tile_args]
+
+        rng = self.streams.numpy("init")
+        for agent_type, n, max_energy in (
+            (Mouse, self.initial_mice, 10),
+            (Sheep, self.initial_sheep, 20),
+            (Cat, self.initial_cats, 20),
+            (Wolf, self.initial_wolves, 30),
+        ):
+            x = rng.integers(0, self.width, size=n)
+            y = rng.integers(0, self.height, size=n)
+            energy = rng.integers(0, max_energy, size=n)
+            owner = self.tile_of(x)
+            self._call(
+                "add",
+                [(agent_type, x[owner == i], y[owner == i], energy[owner == i]) for i in range(tiles)],
+            )
+
+        self.totals = {}
+        self.datacollector = mesa.DataCollector(
+            {name: partial(TiledWolfSheep.total, name=name) for name in REPORTED_TYPES}
+        )
+        self._count()
+        self.running = True
+        self.datacollector.collect(self)
+
+    def tile_of(self, x):
+        """
+        Returns the index of the tile holding each global column of x.
+        """
+        return np.searchsorted(self.bounds, x, side="right") - 1
+
+    def _call(self, name, args):
+        """
+        Run the Tile method called name on every tile, with the arguments
+        args[i] on tile i, and return the results.
+        """
+        if not self._connections:
+            return [getattr(tile, name)(*a) for tile, a in zip(self._tiles, args)]
+        for connection, a in zip(self._connections, args):
+            connection.send((name, a))
+        return [connection.recv() for connection in self._connections]
+
+    def _call_all(self, name, *args):
+        return self._call(name, [args] * self.tiles)
+
+    def total(self, name):
+        """
+        Returns the number of animals or plants reported as name, over all
+        tiles.
+        """
+        return self.totals[name]
+
+    def animal_count(self, agent_type):
+        """
+        Returns the number of animals of a type over all tiles, as
+        WolfSheep.animal_count does.
+        """
+        return self.totals[REPORTED_NAMES[agent_type]]
+
+    plant_count = animal_count
+
+    def _count(self):
+        self.totals = dict.fromkeys(REPORTED_TYPES, 0)
+        for counts in self._call_all("counts"):
+            for name, count in counts.items():
+                self.totals[name] += count
+
+    def step(self):
+        self._call_all("step_plants")
+
+        order = [Mouse, Sheep, Cat, Wolf]
+        self.random.shuffle(order)
+        tiles = self.tiles
+        for agent_type in order:
+            ghosts = [None] * tiles
+            if agent_type in (Cat, Wolf) and tiles > 1:
+                borders = self._call_all("border", agent_type)
+                ghosts = []
+                for i in range(tiles):
+                    (x_left, y_left), _ = borders[(i + 1) % tiles]
+                    _, (x_right, y_right) = borders[i - 1]
+                    ghosts.append(
+                        (np.concatenate([x_right, x_left]), np.concatenate([y_right, y_left]))
+                    )
+            leaving = self._call("move", [(agent_type, g) for g in ghosts])
+            arrivals = [
+                [leaving[(i + 1) % tiles][0], leaving[i - 1][1]] for i in range(tiles)
+            ]
+            self._call("settle", [(agent_type, a) for a in arrivals])
+
+        self.schedule.step()
+        self.cnt += 1
+        self._count()
+        if self.schedule.steps % self.collect_interval == 0:
+            self.datacollector.collect(self)
+        self.forest_fire()
+        if self.migration_enabled:
+            self.migration()
+        for condition in self.stop_conditions:
+            self.stop_reason = condition(self)
+            if self.stop_reason is not None:
+                self.running = False
+                break
+
+    def run_model(self, step_count=200):
+        """
+        Run step_count steps, or fewer if a stop condition ends the run.
+        Returns why the run stopped, as WolfSheep.run_model does.
+        """
+        for _ in range(step_count):
+            self.step()
+            if not self.running:
+                break
+        return self.stop_reason or "step_count"
+
+    def forest_fire(self, period=None):
+        """
+        Every period steps, burn fire_fraction of the grid, as
+        WolfSheep.forest_fire does.
+        """
+        period = self.fire_period if period is None else period
+        if not period or self.cnt % period != 0:
+            return
+        total_cells = self.width * self.height
+        n_burned = int(self.fire_fraction * total_cells)
+        if self.fire_mode == "spread":
+            cells = np.asarray(self._spread_fire(n_burned), dtype=np.int64)
+        else:
+            cells = self.streams.numpy("fire").choice(total_cells, n_burned, replace=False)
+        owner = self.tile_of(cells // self.height)
+        self._call("burn", [(cells[owner == i],) for i in range(self.tiles)])
+
+    _spread_fire = WolfSheep._spread_fire
+    migration = WolfSheep.migration
+
+    def _migrate(self, agent_type, pos, energy):
+        x, y = pos
+        owner = self.tile_of(x)
+        args = [(agent_type, [], [], []) for _ in range(self.tiles)]
+        args[owner] = (agent_type, [x], [y], [energy])
+        self._call("add", args)
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        for connection in self._connections:
+            connection.send(None)
+            connection.close()
+        for worker in self._workers:
+            worker.join()
+        self._connections = []
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
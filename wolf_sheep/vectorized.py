@@ -0,0 +1,348 @@
+"""
+Array-backed animal engine
+==========================
+
+Struct-of-arrays alternative to the Mouse, Sheep, Cat and Wolf agents. The
+positions, energies and ages of each species are kept in NumPy arrays and
+every rule of agents.py (moving, hunting, eating, dying and reproducing) is
+applied to a whole species at once.
+
+Species act one after another in a random order, as the agent types do in
+RandomActivationByTypeFiltered, but all animals of a species act
+simultaneously. Conflicts are settled at random: when several herbivores
+stand on one plant a random one eats it, and predators sharing a cell eat
+distinct prey, one each, while prey lasts.
+"""
+
+import numpy as np
+
+from .agents import Mouse, Sheep, Cat, Wolf, Grass, Bush
+from .plants import TYPE_STAGES
+
+
+class Species:
+    """
+    The rules of one species and the arrays holding its animals.
+    """
+
+    def __init__(
+        self,
+        agent_type,
+        cost,
+        reproduce,
+        reproduce_energy=None,
+        food=(),
+        hunts=(),
+        hunt_radius=1,
+    ):
+        """
+        Args:
+            agent_type: The agent class the species stands in for
+            cost: Energy spent every step
+            reproduce: Name of the model attribute holding the probability
+                       of reproducing each step
+            reproduce_energy: Name of the model attribute holding the energy
+                              needed to reproduce, or None if there is none
+            food: Plant or animal types the species eats
+            hunts: Animal types the species moves towards
+            hunt_radius: Name of the model attribute holding the radius
+                         within which prey is sensed
+        """
+        self.agent_type = agent_type
+        self.cost = cost
+        self.reproduce = reproduce
+        self.reproduce_energy = reproduce_energy
+        self.food = food
+        self.hunts = hunts
+        self.hunt_radius = hunt_radius
+
+        self.x = np.empty(0, dtype=np.int64)
+        self.y = np.empty(0, dtype=np.int64)
+        self.energy = np.empty(0, dtype=np.float64)
+        self.countup = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, x, y, energy):
+        """
+        Append new animals with the given positions and energies.
+        """
+        self.x = np.concatenate([self.x, np.asarray(x, dtype=np.int64)])
+        self.y = np.concatenate([self.y, np.asarray(y, dtype=np.int64)])
+        self.energy = np.concatenate([self.energy, np.asarray(energy, dtype=np.float64)])
+        self.countup = np.concatenate([self.countup, np.zeros(len(x), dtype=np.int64)])
+
+    def keep(self, mask):
+        """
+        Keep only the animals selected by a boolean mask.
+        """
+        self.x = self.x[mask]
+        self.y = self.y[mask]
+        self.energy = self.energy[mask]
+        self.countup = self.countup[mask]
+
+
+class AnimalEngine:
+    """
+    All animals of a WolfSheep model, held as one Species per animal type.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.width = model.width
+        self.height = model.height
+        self.species = {
+            Mouse: Species(
+                Mouse,
+                cost=1,
+                reproduce="mouse_reproduce",
+                reproduce_energy="mouse_reproduce_energy",
+                food=(Grass,),
+            ),
+            Sheep: Species(
+                Sheep,
+                cost=2,
+                reproduce="sheep_reproduce",
+                food=(Grass, Bush),
+            ),
+            Cat: Species(
+                Cat,
+                cost=1,
+                reproduce="cat_reproduce",
+                reproduce_energy="cat_reproduce_energy",
+                food=(Mouse,),
+                hunts=(Mouse,),
+                hunt_radius="cat_hunt_radius",
+            ),
+            Wolf: Species(
+                Wolf,
+                cost=2,
+                reproduce="wolf_reproduce",
+                reproduce_energy="wolf_reproduce_energy",
+                food=(Mouse, Sheep, Cat),
+                hunts=(Sheep, Mouse),
+                hunt_radius="wolf_hunt_radius",
+            ),
+        }
+        self._window_offsets = {}
+
+    def add(self, agent_type, positions, energies):
+        """
+        Add animals of agent_type at the given (x, y) positions.
+        """
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        self.species[agent_type].add(positions[:, 0], positions[:, 1], energies)
+
+    def count(self, agent_type):
+        """
+        Returns the number of living animals of agent_type.
+        """
+        return len(self.species[agent_type])
+
+    def clear(self, mask):
+        """
+        Kill every animal standing on a cell selected by a boolean grid mask.
+        """
+        for species in self.species.values():
+            species.keep(~mask[species.x, species.y])
+
+    def step(self):
+        """
+        Let every species act once, in random order.
+        """
+        order = list(self.species)
+        self.model.random.shuffle(order)
+        for agent_type in order:
+            self.step_species(self.species[agent_type])
+
+    def step_species(self, species):
+        if len(species) == 0:
+            return
+        self.move_species(species)
+        self.feed_species(species)
+
+    def move_species(self, species, ghosts=None):
+        """
+        The first half of a species' step: age, move (hunting, for
+        predators) and pay the energy cost of the step. ghosts are (x, y)
+        arrays of prey held elsewhere that predators can sense too.
+        """
+        species.countup += 1
+        if species.hunts:
+            self.hunt(species, getattr(self.model, species.hunt_radius), ghosts)
+        else:
+            self.random_move(species, np.ones(len(species), dtype=bool))
+        species.energy -= species.cost
+
+    def feed_species(self, species):
+        """
+        The second half of a species' step: eat, die of hunger and
+        reproduce.
+        """
+        model = self.model
+        if len(species) == 0:
+            return
+
+        if species.food and species.food[0] in TYPE_STAGES:
+            self.graze(species)
+        elif species.food:
+            self.prey_on(species)
+
+        # Death
+        alive = species.energy >= 0
+        species.keep(alive)
+
+        # Reproduction
+        rng = model.streams.numpy("reproduction")
+        draws = rng.random(len(species))
+        breeding = draws < getattr(model, species.reproduce)
+        if species.reproduce_energy is not None:
+            breeding &= species.energy > getattr(model, species.reproduce_energy)
+        if breeding.any():
+            species.energy[breeding] /= 2
+            species.add(species.x[breeding], species.y[breeding], species.energy[breeding])
+
+    def random_move(self, species, movers):
+        """
+        Step the selected animals to a random cell of their Moore
+        neighborhood, including the cell they are on.
+        """
+        rng = self.model.streams.numpy("movement")
+        moves = rng.integers(0, 9, size=int(movers.sum()))
+        species.x[movers] = (species.x[movers] + moves // 3 - 1) % self.width
+        species.y[movers] = (species.y[movers] + moves % 3 - 1) % self.height
+
+    def hunt(self, species, radius, ghosts=None):
+        """
+        Move every animal of a predator species one step towards the nearest
+        prey within radius, or randomly if none is in range. ghosts are (x,
+        y) arrays of further cells holding prey.
+        """
+        occupied = np.zeros((self.width, self.height), dtype=bool)
+        for prey_type in species.hunts:
+            prey = self.species[prey_type]
+            occupied[prey.x, prey.y] = True
+        if ghosts is not None:
+            occupied[ghosts] = True
+
+        n = len(species)
+        found = np.zeros(n, dtype=bool)
+        target_dx = np.zeros(n, dtype=np.int64)
+        target_dy = np.zeros(n, dtype=np.int64)
+        for dx, dy in self._offsets(radius):
+            hit = ~found & occupied[
+                (species.x + dx) % self.width, (species.y + dy) % self.height
+            ]
+            target_dx[hit] = dx
+            target_dy[hit] = dy
+            found |= hit
+            if found.all():
+                break
+
+        # On a Moore grid the step towards the target that minimizes the
+        # Manhattan distance goes diagonally whenever it can
+        species.x[found] = (species.x[found] + np.sign(target_dx[found])) % self.width
+        species.y[found] = (species.y[found] + np.sign(target_dy[found])) % self.height
+        self.random_move(species, ~found)
+
+    def _offsets(self, radius):
+        try:
+            return self._window_offsets[radius]
+        except KeyError:
+            offsets = sorted(
+                (
+                    (dx, dy)
+                    for dx in range(-radius, radius + 1)
+                    for dy in range(-radius, radius + 1)
+                    if (dx, dy) != (0, 0)
+                ),
+                key=lambda offset: abs(offset[0]) + abs(offset[1]),
+            )
+            self._window_offsets[radius] = offsets
+            return offsets
+
+    def graze(self, species):
+        """
+        Let herbivores eat the plant on their cell. Of several animals on
+        the same plant, a random one gets it.
+        """
+        plants = self.model.plants
+        if plants is None:
+            return
+        stages = plants.stage[species.x, species.y]
+        edible = np.isin(stages, [TYPE_STAGES[food] for food in species.food])
+        candidates = np.flatnonzero(edible)
+        if len(candidates) == 0:
+            return
+
+        rng = self.model.streams.numpy("feeding")
+        candidates = candidates[rng.permutation(len(candidates))]
+        cells = species.x[candidates] * self.height + species.y[candidates]
+        _, first = np.unique(cells, return_index=True)
+        eaters = candidates[first]
+
+        food_energies = self.model.food_energies
+        stage_energy = np.zeros(4, dtype=np.float64)
+        for plant_type, stage in TYPE_STAGES.items():
+            stage_energy[stage] = food_energies[plant_type]
+        species.energy[eaters] += stage_energy[stages[eaters]]
+        plants.remove_plant((species.x[eaters], species.y[eaters]))
+
+    def prey_on(self, species):
+        """
+        Let predators eat one prey animal each on their cell. Predators and
+        prey on a cell are paired up in random order.
+        """
+        prey_species = [self.species[prey_type] for prey_type in species.food]
+        prey_cells = np.concatenate(
+            [prey.x * self.height + prey.y for prey in prey_species]
+        )
+        if len(prey_cells) == 0:
+            return
+        prey_owner = np.concatenate(
+            [np.full(len(prey), i) for i, prey in enumerate(prey_species)]
+        )
+        prey_index = np.concatenate([np.arange(len(prey)) for prey in prey_species])
+
+        rng = self.model.streams.numpy("feeding")
+        predator_cells = species.x * self.height + species.y
+        prey_rank = self._rank_within_cell(prey_cells, rng)
+        predator_rank = self._rank_within_cell(predator_cells, rng)
+
+        # Predator k on a cell eats prey k on that cell, if there is one
+        stride = max(len(prey_cells), len(predator_cells)) + 1
+        prey_keys = prey_cells * stride + prey_rank
+        predator_keys = predator_cells * stride + predator_rank
+        sort = np.argsort(prey_keys)
+        position = np.searchsorted(prey_keys[sort], predator_keys)
+        position = np.minimum(position, len(prey_keys) - 1)
+        matched = prey_keys[sort][position] == predator_keys
+        eaten = sort[position[matched]]
+
+        food_energies = self.model.food_energies
+        gains = np.array(
+            [food_energies[prey_type] for prey_type in species.food], dtype=np.float64
+        )
+        species.energy[matched] += gains[prey_owner[eaten]]
+
+        for i, prey in enumerate(prey_species):
+            dead = prey_index[eaten[prey_owner[eaten] == i]]
+            if len(dead):
+                alive = np.ones(len(prey), dtype=bool)
+                alive[dead] = False
+                prey.keep(alive)
+
+    @staticmethod
+    def _rank_within_cell(cells, rng):
+        """
+        Returns, for every entry, its rank among the entries with the same
+        cell, in a random order.
+        """
+        order = np.lexsort((rng.random(len(cells)), cells))
+        sorted_cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+        group_start = np.repeat(starts, np.diff(np.r_[starts, len(cells)]))
+        rank = np.empty(len(cells), dtype=np.int64)
+        rank[order] = np.arange(len(cells)) - group_start
+        return rank